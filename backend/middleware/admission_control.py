@@ -0,0 +1,252 @@
+from pymongo import monitoring
+from typing import Dict, Optional
+import json
+import logging
+import threading
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+ADMISSION_DB_LATENCY_MS = float(os.getenv("ADMISSION_DB_LATENCY_MS", "100"))  # Latência considerada normal
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "500"))  # Requisições simultâneas no worker
+
+# Comandos que não medem a saúde do banco (getMore de change streams espera por design)
+IGNORED_COMMANDS = {"getMore", "killCursors", "endSessions", "hello", "isMaster", "ismaster"}
+
+
+class DbLatencyTracker(monitoring.CommandListener):
+    """
+    Acompanha a latência dos comandos do MongoDB (listener do driver).
+    
+    Mantém uma média móvel exponencial das durações e os comandos ainda em
+    andamento: se o banco parar de responder, a idade do comando mais antigo
+    denuncia a pressão antes mesmo de qualquer comando terminar. Os callbacks
+    rodam nas threads do driver.
+    """
+    
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.ewma_ms = 0.0
+        self.commands = 0
+        self.failures = 0
+        self._started: Dict[int, float] = {}
+        self._lock = threading.Lock()
+    
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        with self._lock:
+            self._started[event.request_id] = time.monotonic()
+    
+    def _finished(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        duration_ms = event.duration_micros / 1000
+        with self._lock:
+            self._started.pop(event.request_id, None)
+            self.commands += 1
+            self.ewma_ms += self.alpha * (duration_ms - self.ewma_ms)
+    
+    def succeeded(self, event):
+        self._finished(event)
+    
+    def failed(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.failures += 1
+        self._finished(event)
+    
+    @property
+    def in_flight(self) -> int:
+        return len(self._started)
+    
+    def oldest_in_flight_ms(self) -> float:
+        with self._lock:
+            if not self._started:
+                return 0.0
+            # dict preserva a ordem de inserção: o primeiro é o mais antigo
+            return (time.monotonic() - next(iter(self._started.values()))) * 1000
+    
+    def latency_ms(self) -> float:
+        """Latência efetiva: média recente ou idade do comando mais antigo pendente"""
+        return max(self.ewma_ms, self.oldest_in_flight_ms())
+
+
+class RouteClass:
+    """Classe de rota com limite de concorrência e prioridade (0 = protegida)"""
+    
+    __slots__ = ("name", "max_concurrency", "priority")
+    
+    def __init__(self, name: str, max_concurrency: int, priority: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.priority = priority
+
+
+ROUTE_CLASSES = {
+    "payments": RouteClass("payments", 200, 0),
+    "chat": RouteClass("chat", 200, 0),
+    "auth": RouteClass("auth", 100, 1),
+    "default": RouteClass("default", 300, 1),
+    "search": RouteClass("search", 50, 2),
+    "suggestions": RouteClass("suggestions", 20, 3),
+    "admin_analytics": RouteClass("admin_analytics", 5, 3),
+    "exports": RouteClass("exports", 3, 3),
+}
+
+# Prefixos em ordem de especificidade (primeiro que casar)
+ROUTE_PREFIXES = (
+    ("/api/security/audit-logs/export", "exports"),
+    ("/api/security/lgpd/export-my-data", "exports"),
+    ("/api/financial/admin/financial-report", "admin_analytics"),
+    ("/api/admin/analytics/", "admin_analytics"),
+    ("/api/search/suggestions", "suggestions"),
+    ("/api/search/", "search"),
+    ("/api/payments", "payments"),
+    ("/api/financial", "payments"),
+    ("/api/chat", "chat"),
+    ("/api/auth/", "auth"),
+)
+
+# Rotas nunca rejeitadas (health checks do balanceador)
+EXEMPT_PATHS = {"/api/health", "/api/"}
+
+# Nível de pressão -> menor prioridade descartada
+SHED_PRIORITY = {1: 3, 2: 2, 3: 1}
+
+
+def classify(path: str) -> RouteClass:
+    for prefix, name in ROUTE_PREFIXES:
+        if path.startswith(prefix):
+            return ROUTE_CLASSES[name]
+    return ROUTE_CLASSES["default"]
+
+
+class AdmissionController:
+    """
+    Controle de admissão por classe de rota.
+    
+    Cada classe tem um limite de requisições simultâneas. Além disso, o nível de
+    pressão (latência do banco e total em andamento no worker) define quais
+    prioridades são descartadas: primeiro analytics, exportações e sugestões,
+    depois busca e, em último caso, o restante. Pagamentos e chat (prioridade
+    0) nunca são descartados por pressão.
+    """
+    
+    def __init__(
+        self,
+        db_tracker: DbLatencyTracker,
+        target_latency_ms: float = ADMISSION_DB_LATENCY_MS,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT
+    ):
+        self.db_tracker = db_tracker
+        self.target_latency_ms = target_latency_ms
+        self.max_in_flight = max_in_flight
+        self.in_flight: Dict[str, int] = {name: 0 for name in ROUTE_CLASSES}
+        self.total_in_flight = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {}
+    
+    def pressure(self) -> int:
+        """Nível de pressão de 0 (normal) a 3 (crítico)"""
+        ratio = max(
+            self.db_tracker.latency_ms() / self.target_latency_ms,
+            self.total_in_flight / self.max_in_flight * 2
+        )
+        if ratio < 1:
+            return 0
+        if ratio < 2:
+            return 1
+        if ratio < 4:
+            return 2
+        return 3
+    
+    def try_acquire(self, route_class: RouteClass) -> Optional[int]:
+        """
+        Tenta admitir uma requisição
+        
+        Returns:
+            None se admitida, ou o Retry-After (segundos) se rejeitada
+        """
+        if self.in_flight[route_class.name] >= route_class.max_concurrency:
+            self._count_shed(route_class, "concurrency")
+            return 1
+        
+        if route_class.priority > 0:
+            level = self.pressure()
+            if level and route_class.priority >= SHED_PRIORITY[level]:
+                self._count_shed(route_class, "pressure")
+                return 2 ** level
+        
+        self.in_flight[route_class.name] += 1
+        self.total_in_flight += 1
+        self.admitted += 1
+        return None
+    
+    def release(self, route_class: RouteClass):
+        self.in_flight[route_class.name] -= 1
+        self.total_in_flight -= 1
+    
+    def _count_shed(self, route_class: RouteClass, reason: str):
+        key = f"{route_class.name}:{reason}"
+        self.shed[key] = self.shed.get(key, 0) + 1
+    
+    def snapshot(self) -> dict:
+        """Métricas do controle de admissão"""
+        return {
+            "enabled": ADMISSION_CONTROL_ENABLED,
+            "pressure": self.pressure(),
+            "db_latency_ewma_ms": round(self.db_tracker.ewma_ms, 1),
+            "db_oldest_in_flight_ms": round(self.db_tracker.oldest_in_flight_ms(), 1),
+            "db_in_flight": self.db_tracker.in_flight,
+            "db_commands": self.db_tracker.commands,
+            "in_flight": dict(self.in_flight),
+            "total_in_flight": self.total_in_flight,
+            "admitted": self.admitted,
+            "shed": dict(self.shed)
+        }
+
+
+class AdmissionControlMiddleware:
+    """Middleware ASGI que rejeita com 503 rápido o que não pode ser admitido"""
+    
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        route_class = classify(scope["path"])
+        retry_after = self.controller.try_acquire(route_class)
+        
+        if retry_after is not None:
+            await self._reject(send, retry_after)
+            return
+        
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
+    
+    @staticmethod
+    async def _reject(send, retry_after: int):
+        body = json.dumps({"detail": "Servidor sobrecarregado. Tente novamente em instantes."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Instâncias globais
+db_latency_tracker = DbLatencyTracker()
+admission_controller = AdmissionController(db_latency_tracker)
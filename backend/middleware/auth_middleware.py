@@ -1,7 +1,31 @@
-from fastapi import Header, HTTPException, status
+from fastapi import Header, HTTPException, WebSocket, status
 from services.auth_service import decode_token
+from services.token_cache import token_cache
+from services.revocation_service import revocation_list
 from typing import Optional
 
+def authenticate_token(token: str) -> Optional[dict]:
+    """
+    Valida um access token, usando o cache de tokens já verificados.
+    
+    Usado tanto pelas dependências HTTP quanto pela autenticação de WebSocket.
+    A lista de revogação é consultada mesmo em acertos do cache.
+    """
+    payload = token_cache.get(token)
+    
+    if payload is None:
+        payload = decode_token(token, "access")
+        if not payload:
+            return None
+        token_cache.put(token, payload)
+    
+    if revocation_list.is_revoked(payload):
+        token_cache.invalidate(token)
+        return None
+    
+    # Cópia para que o handler não altere o payload em cache
+    return dict(payload)
+
 async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     """Middleware para verificar JWT e obter usuário atual"""
     if not authorization:
@@ -24,7 +48,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
             detail="Formato de token inválido",
         )
     
-    payload = decode_token(token, "access")
+    payload = authenticate_token(token)
     if not payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -33,6 +57,32 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     
     return payload
 
+async def get_optional_user(authorization: Optional[str] = Header(None)) -> Optional[dict]:
+    """Usuário do token, se houver um válido (para rotas públicas)"""
+    if not authorization:
+        return None
+    
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        return None
+    
+    return authenticate_token(parts[1])
+
+def get_websocket_user(websocket: WebSocket) -> Optional[dict]:
+    """Autentica um WebSocket pelo parâmetro `token` ou header Authorization"""
+    token = websocket.query_params.get("token")
+    
+    if not token:
+        authorization = websocket.headers.get("authorization", "")
+        parts = authorization.split()
+        if len(parts) == 2 and parts[0].lower() == "bearer":
+            token = parts[1]
+    
+    if not token:
+        return None
+    
+    return authenticate_token(token)
+
 async def require_role(user: dict, allowed_roles: list):
     """Verifica se o usuário tem a role necessária"""
     if user.get("role") not in allowed_roles:
@@ -0,0 +1,307 @@
+import asyncio
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # Bytes
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+# Corpos maiores que isso são comprimidos fora do event loop
+COMPRESSION_THREAD_THRESHOLD = 256 * 1024
+
+# Tipos de conteúdo que valem a compressão (imagens, vídeos e arquivos
+# compactados ficam de fora)
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml"
+}
+COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+# Tamanho mínimo por prefixo de rota (None = nunca comprimir). Rotas de
+# autenticação ficam sem compressão: misturam tokens com dados enviados pelo
+# cliente (BREACH) e as respostas são pequenas.
+ROUTE_MIN_SIZE: Dict[str, Optional[int]] = {
+    "/api/health": None,
+    "/api/auth/": None,
+    "/api/security/2fa": None,
+    "/api/security/audit-logs/export": 0,
+    "/api/security/lgpd/export-my-data": 0
+}
+
+for _path in filter(None, os.getenv("COMPRESSION_EXCLUDED_PATHS", "").split(",")):
+    ROUTE_MIN_SIZE[_path.strip()] = None
+
+# Preferência entre as codificações aceitas pelo cliente
+ENCODING_PREFERENCE = [
+    name for name, available in (("zstd", zstandard), ("br", brotli), ("gzip", zlib))
+    if available is not None
+]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Codificações do Accept-Encoding com seus pesos (q)"""
+    accepted = {}
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Melhor codificação disponível aceita pelo cliente"""
+    if not header:
+        return None
+    
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    for name in ENCODING_PREFERENCE:
+        if accepted.get(name, wildcard) > 0:
+            return name
+    return None
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith(COMPRESSIBLE_SUFFIXES)
+    )
+
+
+class StreamEncoder:
+    """Compressor incremental; cada chunk é descarregado para não atrasar streams"""
+    
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+    
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush()
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class ResponseCompressor:
+    """Configuração e estatísticas da compressão de respostas"""
+    
+    def __init__(self, min_size: int = COMPRESSION_MIN_SIZE, route_min_size: Optional[Dict[str, Optional[int]]] = None):
+        self.min_size = min_size
+        self.route_min_size = ROUTE_MIN_SIZE if route_min_size is None else route_min_size
+        self.compressed: Dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.skipped_small = 0
+        self.skipped_type = 0
+        self.streamed = 0
+    
+    def min_size_for(self, path: str) -> Optional[int]:
+        """Tamanho mínimo para a rota (prefixo mais longo vence); None = desativado"""
+        best = None
+        for prefix in self.route_min_size:
+            if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.min_size if best is None else self.route_min_size[best]
+    
+    def record(self, encoding: str, size_in: int, size_out: int):
+        self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+    
+    def snapshot(self) -> dict:
+        return {
+            "encodings_available": ENCODING_PREFERENCE,
+            "min_size": self.min_size,
+            "compressed": dict(self.compressed),
+            "streamed": self.streamed,
+            "skipped_small": self.skipped_small,
+            "skipped_type": self.skipped_type,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+        }
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compressão (zstd, brotli ou gzip, conforme disponível)
+    
+    Respostas de corpo único abaixo do tamanho mínimo, de tipos já comprimidos
+    ou que já trazem Content-Encoding passam intactas. Respostas em stream são
+    comprimidas chunk a chunk.
+    """
+    
+    def __init__(self, app, compressor: ResponseCompressor):
+        self.app = app
+        self.compressor = compressor
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        min_size = self.compressor.min_size_for(scope["path"])
+        encoding = None
+        if min_size is not None:
+            for name, value in scope["headers"]:
+                if name == b"accept-encoding":
+                    encoding = choose_encoding(value.decode("latin-1"))
+                    break
+        
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        await _CompressedResponder(self.compressor, encoding, min_size, send).run(self.app, scope, receive)
+
+
+class _CompressedResponder:
+    """Estado de uma resposta: decide no primeiro chunk se e como comprimir"""
+    
+    def __init__(self, compressor: ResponseCompressor, encoding: str, min_size: int, send):
+        self.compressor = compressor
+        self.encoding = encoding
+        self.min_size = min_size
+        self.send = send
+        self.start_message: Optional[dict] = None
+        self.encoder: Optional[StreamEncoder] = None
+        self.passthrough = False
+        self.size_in = 0
+        self.size_out = 0
+    
+    async def run(self, app, scope, receive):
+        await app(scope, receive, self.send_wrapper)
+    
+    async def send_wrapper(self, message: dict):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+        
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        
+        if self.encoder is None:
+            headers = self.start_message["headers"]
+            if not self._should_compress(headers, body, more_body):
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            
+            self.encoder = StreamEncoder(self.encoding)
+            if not more_body:
+                await self._send_whole(headers, body)
+                return
+            
+            self.compressor.streamed += 1
+            self.start_message["headers"] = self._encoded_headers(headers)
+            await self.send(self.start_message)
+        
+        self.size_in += len(body)
+        chunk = self.encoder.compress(body) if more_body else self.encoder.finish(body)
+        self.size_out += len(chunk)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        
+        if not more_body:
+            self.compressor.record(self.encoding, self.size_in, self.size_out)
+    
+    def _should_compress(self, headers: List[Tuple[bytes, bytes]], body: bytes, more_body: bool) -> bool:
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+        
+        if self.start_message["status"] in (204, 304) or not is_compressible(content_type.decode("latin-1")):
+            self.compressor.skipped_type += 1
+            return False
+        
+        if not more_body and len(body) < self.min_size:
+            self.compressor.skipped_small += 1
+            self.start_message["headers"] = _with_vary(headers)
+            return False
+        
+        return True
+    
+    async def _send_whole(self, headers: List[Tuple[bytes, bytes]], body: bytes):
+        if len(body) > COMPRESSION_THREAD_THRESHOLD:
+            compressed = await asyncio.to_thread(self.encoder.finish, body)
+        else:
+            compressed = self.encoder.finish(body)
+        
+        self.compressor.record(self.encoding, len(body), len(compressed))
+        
+        headers = self._encoded_headers(headers)
+        headers.append((b"content-length", str(len(compressed)).encode()))
+        self.start_message["headers"] = headers
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed})
+    
+    def _encoded_headers(self, headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+        headers = [(name, value) for name, value in headers if name != b"content-length"]
+        headers.append((b"content-encoding", self.encoding.encode()))
+        return _with_vary(headers)
+
+
+def _with_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Garante `Vary: Accept-Encoding` (caches não devem misturar codificações)"""
+    result = []
+    found = False
+    for name, value in headers:
+        if name == b"vary":
+            found = True
+            if b"accept-encoding" not in value.lower() and value.strip() != b"*":
+                value = value + b", Accept-Encoding"
+        result.append((name, value))
+    
+    if not found:
+        result.append((b"vary", b"Accept-Encoding"))
+    return result
+
+
+# Instância global
+response_compressor = ResponseCompressor()
@@ -0,0 +1,405 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from middleware.auth_middleware import authenticate_token
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))  # Por quanto tempo a resposta é reaproveitada
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # Respostas em memória por worker
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # Tempo máximo de uma execução em andamento
+
+MAX_KEY_LENGTH = 255
+IDEMPOTENT_METHODS = {"POST"}
+
+# Respostas que não são guardadas: o cliente pode tentar de novo com a mesma chave
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+# Headers da resposta original que são reproduzidos
+REPLAYED_HEADERS = {b"content-type", b"location", b"etag", b"cache-control"}
+
+# Intervalo entre consultas ao aguardar uma execução em outro worker
+REMOTE_POLL_SECONDS = 0.05
+
+
+class StoredResponse:
+    """Resposta guardada para uma chave de idempotência"""
+    
+    __slots__ = ("fingerprint", "status", "headers", "body", "expires_at")
+    
+    def __init__(self, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+    
+    def to_document(self) -> dict:
+        return {
+            "status": self.status,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers],
+            "body": self.body
+        }
+    
+    @classmethod
+    def from_document(cls, doc: dict) -> "StoredResponse":
+        expires_at = doc["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return cls(
+            fingerprint=doc["fingerprint"],
+            status=doc["response"]["status"],
+            headers=[(name.encode("latin-1"), value.encode("latin-1")) for name, value in doc["response"]["headers"]],
+            body=bytes(doc["response"]["body"]),
+            expires_at=expires_at.timestamp()
+        )
+
+
+class IdempotencyConflict(Exception):
+    """Chave reutilizada com outro corpo ou ainda em execução"""
+    
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IdempotencyStore:
+    """
+    Respostas por (usuário, Idempotency-Key, rota).
+    
+    A coleção `idempotency_keys` (TTL) é a fonte da verdade entre workers: o
+    primeiro a inserir a chave executa a requisição e grava a resposta; os
+    demais esperam por ela. Neste worker, requisições repetidas esperam pela
+    execução em andamento (sem ida ao banco) e respostas já concluídas ficam
+    num cache LRU na frente da coleção.
+    """
+    
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL_SECONDS, maxsize: int = IDEMPOTENCY_CACHE_SIZE, lock_seconds: int = IDEMPOTENCY_LOCK_SECONDS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.lock_seconds = lock_seconds
+        self._db = None
+        self._cache: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.conflicts = 0
+        self.errors = 0
+    
+    async def start(self, db):
+        """Cria o índice TTL e passa a usar a coleção compartilhada"""
+        self._db = db
+        await db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    
+    @staticmethod
+    def record_id(user_id: str, route: str, key: str) -> str:
+        return hashlib.sha256(f"{user_id}\n{route}\n{key}".encode()).hexdigest()
+    
+    def _cached(self, record_id: str) -> Optional[StoredResponse]:
+        stored = self._cache.get(record_id)
+        if stored is None:
+            return None
+        if stored.expires_at <= time.time():
+            del self._cache[record_id]
+            return None
+        self._cache.move_to_end(record_id)
+        return stored
+    
+    def _remember(self, record_id: str, stored: StoredResponse):
+        self._cache[record_id] = stored
+        self._cache.move_to_end(record_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+    
+    def _check(self, stored: StoredResponse, fingerprint: str) -> StoredResponse:
+        if stored.fingerprint != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict(422, "Idempotency-Key já usada com outro corpo de requisição")
+        self.replayed += 1
+        return stored
+    
+    async def begin(self, record_id: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Resposta já existente para a chave, ou None se esta requisição deve executar
+        
+        Quando retorna None, a chave fica reservada até `complete` ou `abort`.
+        """
+        while True:
+            stored = self._cached(record_id)
+            if stored is not None:
+                return self._check(stored, fingerprint)
+            
+            in_flight = self._in_flight.get(record_id)
+            if in_flight is not None:
+                in_flight_fingerprint, future = in_flight
+                if in_flight_fingerprint != fingerprint:
+                    self.conflicts += 1
+                    raise IdempotencyConflict(422, "Idempotency-Key já usada com outro corpo de requisição")
+                self.waited += 1
+                stored = await asyncio.shield(future)
+                if stored is not None:
+                    self.replayed += 1
+                    return stored
+                continue  # A execução falhou; esta requisição tenta de novo
+            
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[record_id] = (fingerprint, future)
+            try:
+                stored = await self._reserve(record_id, fingerprint)
+            except BaseException:
+                self._release(record_id, None)
+                raise
+            
+            if stored is not None:
+                self._release(record_id, stored)
+                self._remember(record_id, stored)
+                return self._check(stored, fingerprint)
+            
+            self.executed += 1
+            return None
+    
+    async def _reserve(self, record_id: str, fingerprint: str) -> Optional[StoredResponse]:
+        """Reserva a chave na coleção ou aguarda a execução de outro worker"""
+        if self._db is None:
+            return None
+        
+        deadline = time.monotonic() + self.lock_seconds
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await self._db.idempotency_keys.insert_one({
+                    "_id": record_id,
+                    "fingerprint": fingerprint,
+                    "locked_until": now + timedelta(seconds=self.lock_seconds),
+                    "expires_at": now + timedelta(seconds=self.ttl)
+                })
+                return None
+            except DuplicateKeyError:
+                pass
+            except PyMongoError as e:
+                # Sem o banco, segue só com a proteção deste worker
+                self.errors += 1
+                logger.warning(f"Falha ao reservar chave de idempotência: {e}")
+                return None
+            
+            doc = await self._db.idempotency_keys.find_one({"_id": record_id})
+            if doc is None:
+                continue  # Expirou ou foi liberada entre as duas operações
+            
+            if "response" in doc:
+                return StoredResponse.from_document(doc)
+            
+            if doc["fingerprint"] != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(422, "Idempotency-Key já usada com outro corpo de requisição")
+            
+            locked_until = doc["locked_until"]
+            if locked_until.tzinfo is None:
+                locked_until = locked_until.replace(tzinfo=timezone.utc)
+            
+            # Execução abandonada (worker caiu): assume a chave
+            if locked_until <= now:
+                result = await self._db.idempotency_keys.update_one(
+                    {"_id": record_id, "locked_until": locked_until, "response": {"$exists": False}},
+                    {"$set": {"locked_until": now + timedelta(seconds=self.lock_seconds)}}
+                )
+                if result.modified_count:
+                    return None
+                continue
+            
+            if time.monotonic() >= deadline:
+                self.conflicts += 1
+                raise IdempotencyConflict(409, "Requisição com esta Idempotency-Key ainda em andamento")
+            
+            self.waited += 1
+            await asyncio.sleep(REMOTE_POLL_SECONDS)
+    
+    def _release(self, record_id: str, stored: Optional[StoredResponse]):
+        in_flight = self._in_flight.pop(record_id, None)
+        if in_flight is not None and not in_flight[1].done():
+            in_flight[1].set_result(stored)
+    
+    async def complete(self, record_id: str, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        """Guarda a resposta e libera quem estava esperando"""
+        stored = StoredResponse(fingerprint, status, headers, body, time.time() + self.ttl)
+        self._remember(record_id, stored)
+        self._release(record_id, stored)
+        
+        if self._db is None:
+            return
+        try:
+            await self._db.idempotency_keys.update_one(
+                {"_id": record_id},
+                {"$set": {"response": stored.to_document()}, "$unset": {"locked_until": ""}}
+            )
+        except PyMongoError as e:
+            self.errors += 1
+            logger.warning(f"Falha ao gravar resposta idempotente: {e}")
+    
+    async def abort(self, record_id: str):
+        """Libera a chave sem guardar resposta (erro ou resposta não reaproveitável)"""
+        self._release(record_id, None)
+        
+        if self._db is None:
+            return
+        try:
+            await self._db.idempotency_keys.delete_one({"_id": record_id, "response": {"$exists": False}})
+        except PyMongoError as e:
+            self.errors += 1
+            logger.warning(f"Falha ao liberar chave de idempotência: {e}")
+    
+    def snapshot(self) -> dict:
+        return {
+            "backend": "mongo" if self._db is not None else "memory",
+            "cached": len(self._cache),
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "waited": self.waited,
+            "conflicts": self.conflicts,
+            "errors": self.errors
+        }
+
+
+class IdempotencyMiddleware:
+    """
+    Middleware ASGI para o header Idempotency-Key em POSTs autenticados
+    
+    A primeira resposta (status < 500, exceto os reenviáveis) é guardada e
+    reproduzida nas repetições com a mesma chave, rota e usuário, com o header
+    `Idempotent-Replayed: true`. A mesma chave com outro corpo retorna 422.
+    """
+    
+    def __init__(self, app, store: IdempotencyStore):
+        self.app = app
+        self.store = store
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope["headers"])
+        key = headers.get(b"idempotency-key", b"").decode("latin-1").strip()
+        user_id = self._user_id(headers.get(b"authorization", b"").decode("latin-1"))
+        if not key or user_id is None:
+            await self.app(scope, receive, send)
+            return
+        
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key deve ter no máximo {MAX_KEY_LENGTH} caracteres"})
+            return
+        
+        body, more = await _read_body(receive)
+        fingerprint = self._fingerprint(scope, body)
+        record_id = self.store.record_id(user_id, f"{scope['method']} {scope['path']}", key)
+        
+        try:
+            stored = await self.store.begin(record_id, fingerprint)
+        except IdempotencyConflict as e:
+            await _send_json(send, e.status_code, {"detail": e.detail})
+            return
+        
+        if stored is not None:
+            await _replay(send, stored)
+            return
+        
+        await self._execute(scope, _replay_receive(body, more, receive), send, record_id, fingerprint)
+    
+    @staticmethod
+    def _fingerprint(scope, body: bytes) -> str:
+        """Identifica a requisição: mesma chave com outra query ou corpo é conflito"""
+        digest = hashlib.sha256(f"{scope['method']} {scope['path']}?".encode())
+        digest.update(scope.get("query_string", b""))
+        digest.update(b"\n")
+        digest.update(body)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _user_id(authorization: str) -> Optional[str]:
+        parts = authorization.split()
+        if len(parts) != 2 or parts[0].lower() != "bearer":
+            return None
+        payload = authenticate_token(parts[1])
+        return payload["sub"] if payload else None
+    
+    async def _execute(self, scope, receive, send, record_id: str, fingerprint: str):
+        status = 500
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+        finished = False
+        
+        async def capture(message):
+            nonlocal status, headers, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(name, value) for name, value in message.get("headers", []) if name in REPLAYED_HEADERS]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                finished = not message.get("more_body", False)
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            if finished and status < 500 and status not in RETRYABLE_STATUS:
+                await self.store.complete(record_id, fingerprint, status, headers, b"".join(chunks))
+            else:
+                await self.store.abort(record_id)
+
+
+async def _read_body(receive) -> Tuple[bytes, List[dict]]:
+    """Lê o corpo inteiro (necessário para a impressão digital)"""
+    chunks = []
+    extra = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            extra.append(message)
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks), extra
+
+def _replay_receive(body: bytes, extra: List[dict], receive):
+    """`receive` que entrega o corpo já lido e depois volta ao original"""
+    pending = [{"type": "http.request", "body": body, "more_body": False}, *extra]
+    
+    async def replay():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+    
+    return replay
+
+async def _replay(send, stored: StoredResponse):
+    headers = list(stored.headers)
+    headers.append((b"content-length", str(len(stored.body)).encode()))
+    headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": stored.status, "headers": headers})
+    await send({"type": "http.response.body", "body": stored.body})
+
+async def _send_json(send, status: int, content: dict):
+    body = json.dumps(content).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Instância global
+idempotency_store = IdempotencyStore()
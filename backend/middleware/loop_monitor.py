@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Configurações do monitor (milissegundos)
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "50"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+
+class LoopLagMonitor:
+    """
+    Mede o atraso de agendamento do event loop e identifica chamadas bloqueantes.
+    
+    Uma corrotina de amostragem dorme por `interval` e mede quanto tempo a mais
+    levou para ser reagendada (lag). Em paralelo, uma thread watchdog observa o
+    último heartbeat da amostragem: se o loop ficar parado além do limite, ela
+    captura a pilha da thread do loop (o código bloqueante) e a rota da task
+    que estava rodando naquele momento.
+    """
+    
+    def __init__(
+        self,
+        interval_ms: float = LOOP_LAG_INTERVAL_MS,
+        threshold_ms: float = LOOP_LAG_THRESHOLD_MS,
+        max_events: int = 50
+    ):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.task_routes: Dict[asyncio.Task, dict] = {}
+        self.recent_stalls = deque(maxlen=max_events)
+        self.recent_lags = deque(maxlen=1000)
+        self.stalls_by_route: Dict[str, int] = {}
+        self.total_stalls = 0
+        self.max_lag = 0.0
+        self.samples = 0
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._pending_stall: Optional[dict] = None
+        self._sampler_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+    
+    def start(self):
+        """Inicia amostragem e watchdog (chamar dentro do event loop)"""
+        if self._sampler_task:
+            return
+        
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        
+        self._sampler_task = self._loop.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(
+            f"Monitor de event loop iniciado (intervalo {self.interval * 1000:.0f}ms, "
+            f"limite {self.threshold * 1000:.0f}ms)"
+        )
+    
+    async def stop(self):
+        """Para amostragem e watchdog"""
+        self._stop.set()
+        if self._sampler_task:
+            self._sampler_task.cancel()
+            try:
+                await self._sampler_task
+            except asyncio.CancelledError:
+                pass
+            self._sampler_task = None
+        self._watchdog = None
+    
+    def track(self, scope: dict):
+        """Associa a task atual à requisição (scope ASGI) que ela está atendendo"""
+        task = asyncio.current_task()
+        if task is not None:
+            self.task_routes[task] = scope
+        return task
+    
+    def untrack(self, task: Optional[asyncio.Task]):
+        if task is not None:
+            self.task_routes.pop(task, None)
+    
+    async def _sample(self):
+        """Corrotina de amostragem: mede o atraso entre o sleep pedido e o real"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            
+            lag = max(0.0, now - expected)
+            self.samples += 1
+            self.recent_lags.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            
+            if lag >= self.threshold:
+                self._record_stall(lag)
+    
+    def _watch(self):
+        """Thread watchdog: captura a pilha da thread do loop enquanto ele está travado"""
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            
+            if stalled_for < self.threshold:
+                continue
+            
+            # Captura apenas uma vez por travamento
+            if self._pending_stall and self._pending_stall["heartbeat"] == heartbeat:
+                continue
+            
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame) if frame else []
+            
+            route = None
+            try:
+                task = asyncio.current_task(self._loop)
+            except RuntimeError:
+                task = None
+            if task is not None:
+                route = describe_scope(self.task_routes.get(task))
+            
+            self._pending_stall = {
+                "heartbeat": heartbeat,
+                "route": route,
+                "task": task.get_name() if task is not None else None,
+                "stack": stack[-15:]
+            }
+    
+    def _record_stall(self, lag: float):
+        """Registra um travamento detectado (executa no event loop)"""
+        stall = self._pending_stall
+        self._pending_stall = None
+        
+        route = stall["route"] if stall else None
+        route_key = route or "desconhecida"
+        
+        self.total_stalls += 1
+        self.stalls_by_route[route_key] = self.stalls_by_route.get(route_key, 0) + 1
+        
+        event = {
+            "lag_ms": round(lag * 1000, 1),
+            "route": route,
+            "task": stall["task"] if stall else None,
+            "stack": stall["stack"] if stall else [],
+            "timestamp": time.time()
+        }
+        self.recent_stalls.append(event)
+        
+        if event["stack"]:
+            logger.warning(
+                f"Event loop bloqueado por {event['lag_ms']}ms na rota {route_key}\n"
+                + "".join(event["stack"])
+            )
+        else:
+            logger.warning(f"Event loop bloqueado por {event['lag_ms']}ms na rota {route_key}")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Métricas atuais do event loop"""
+        lags = sorted(self.recent_lags)
+        p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+        
+        return {
+            "enabled": self._sampler_task is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": self.samples,
+            "lag_p99_ms": round(p99 * 1000, 1),
+            "lag_max_ms": round(self.max_lag * 1000, 1),
+            "stalls_total": self.total_stalls,
+            "stalls_by_route": dict(self.stalls_by_route),
+            "recent_stalls": list(self.recent_stalls)[-10:]
+        }
+
+
+def describe_scope(scope: Optional[dict]) -> Optional[str]:
+    """Descreve a rota de um scope ASGI (usa o template da rota quando disponível)"""
+    if not scope:
+        return None
+    
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    
+    if scope.get("type") == "websocket":
+        return f"WS {path}"
+    return f"{scope.get('method', '')} {path}"
+
+
+class LoopMonitorMiddleware:
+    """Middleware ASGI que registra qual rota cada task do event loop está atendendo"""
+    
+    def __init__(self, app, monitor: LoopLagMonitor):
+        self.app = app
+        self.monitor = monitor
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        
+        task = self.monitor.track(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.untrack(task)
+
+
+# Instância global
+loop_monitor = LoopLagMonitor()
@@ -1,50 +1,384 @@
 from fastapi import Request, HTTPException, status
-from collections import defaultdict
-from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from typing import Dict, Optional, Set, Tuple
 import asyncio
+import logging
+import math
+import time
+import os
+from middleware.auth_middleware import authenticate_token
+from utils.constants import RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW_SECONDS
 
-class RateLimiter:
-    def __init__(self, requests_per_window: int = 100, window_seconds: int = 60):
-        self.requests_per_window = requests_per_window
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | mongo
+RATE_LIMIT_SYNC_SECONDS = float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "0.5"))
+
+
+class RateLimitPolicy:
+    """Limite de requisições por janela, contado por usuário ou por IP"""
+    
+    __slots__ = ("name", "limit", "window_seconds", "per")
+    
+    def __init__(self, name: str, limit: int, window_seconds: int, per: str = "user"):
+        self.name = name
+        self.limit = limit
         self.window_seconds = window_seconds
-        self.requests = defaultdict(list)
-        self.cleanup_task = None
+        self.per = per  # "user" (cai para IP sem token) ou "ip"
+
+
+class WindowCounter:
+    """Estado fixo por chave: contagens da janela atual e da anterior"""
     
-    async def check_rate_limit(self, request: Request):
-        """Verifica rate limit por IP"""
-        client_ip = request.client.host
-        now = datetime.now(timezone.utc)
-        
-        # Remove requisições antigas
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if now - req_time < timedelta(seconds=self.window_seconds)
-        ]
-        
-        # Verifica limite
-        if len(self.requests[client_ip]) >= self.requests_per_window:
+    __slots__ = ("window", "current", "previous", "expires_at")
+    
+    def __init__(self, window: int, window_seconds: int):
+        self.window = window
+        self.current = 0
+        self.previous = 0
+        self.expires_at = (window + 2) * window_seconds
+
+
+DEFAULT_POLICY = RateLimitPolicy("default", RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW_SECONDS)
+
+# Limites adicionais de rotas sensíveis (força bruta), somados ao limite geral
+ROUTE_POLICIES: Dict[Tuple[str, str], RateLimitPolicy] = {
+    ("POST", "/api/auth/login"): RateLimitPolicy("login", 5, 60, per="ip"),
+    ("POST", "/api/auth/signup"): RateLimitPolicy("signup", 10, 3600, per="ip"),
+    ("POST", "/api/auth/google"): RateLimitPolicy("google", 10, 60, per="ip"),
+    ("POST", "/api/auth/refresh"): RateLimitPolicy("refresh", 30, 60, per="ip"),
+    ("POST", "/api/auth/change-password"): RateLimitPolicy("change_password", 5, 300),
+    ("POST", "/api/security/2fa/verify"): RateLimitPolicy("2fa", 5, 60),
+}
+
+# Custo de rotas pesadas no limite geral (prefixo -> requisições consumidas)
+ROUTE_COSTS = (
+    ("/api/security/audit-logs/export", 10),
+    ("/api/security/lgpd/export-my-data", 10),
+    ("/api/financial/admin/financial-report", 10),
+    ("/api/admin/analytics/", 5),
+    ("/api/search/", 2),
+)
+
+# Multiplicador do limite geral por role
+ROLE_LIMIT_MULTIPLIERS = {
+    "admin": 5
+}
+
+
+def route_cost(path: str) -> int:
+    for prefix, cost in ROUTE_COSTS:
+        if path.startswith(prefix):
+            return cost
+    return 1
+
+
+class MemoryRateLimitStorage:
+    """
+    Contadores de janela deslizante em memória (um worker).
+    
+    Cada chave guarda apenas duas contagens (janela atual e anterior); a taxa é
+    estimada ponderando a janela anterior pela fração que ainda se sobrepõe à
+    janela deslizante. A tabela de chaves é um LRU limitado a `max_keys`, e
+    chaves sem uso há mais de duas janelas são descartadas conforme novas chegam.
+    """
+    
+    backend = "memory"
+    
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, WindowCounter]" = OrderedDict()
+        self.evictions = 0
+    
+    def hit(self, key: str, limit: int, window_seconds: int, cost: int = 1, now: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Consome `cost` do limite da chave
+        
+        Returns:
+            (permitido, segundos até poder tentar novamente)
+        """
+        now = time.time() if now is None else now
+        window = int(now // window_seconds)
+        
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = WindowCounter(window, window_seconds)
+            self._counters[key] = counter
+            self._evict(now)
+        else:
+            self._counters.move_to_end(key)
+            if counter.window != window:
+                counter.previous = counter.current if counter.window == window - 1 else 0
+                counter.current = 0
+                counter.window = window
+                counter.expires_at = (window + 2) * window_seconds
+        
+        others_previous, others_current = self._others(key, window, window_seconds)
+        previous = counter.previous + others_previous
+        current = counter.current + others_current
+        
+        elapsed = (now % window_seconds) / window_seconds
+        estimate = previous * (1 - elapsed) + current
+        
+        if estimate + cost > limit:
+            return False, self._retry_after(previous, current, limit, window_seconds, now, cost)
+        
+        counter.current += cost
+        self._record(key, window, window_seconds, cost)
+        return True, 0
+    
+    def _others(self, key: str, window: int, window_seconds: int) -> Tuple[int, int]:
+        """Contagens de outros workers (janela anterior, atual); nenhuma em memória"""
+        return 0, 0
+    
+    def _record(self, key: str, window: int, window_seconds: int, cost: int):
+        """Registra um consumo para sincronização; nada a fazer em memória"""
+        pass
+    
+    @staticmethod
+    def _retry_after(previous: int, current: int, limit: int, window_seconds: int, now: float, cost: int) -> int:
+        elapsed = now % window_seconds
+        remaining = window_seconds - elapsed
+        
+        if current + cost <= limit:
+            # Basta a janela anterior perder peso o suficiente
+            excess = previous * (1 - elapsed / window_seconds) + current + cost - limit
+            return max(1, math.ceil(excess / previous * window_seconds))
+        
+        if cost > limit:
+            return window_seconds
+        
+        # A janela atual já estourou: espera a próxima e o decaimento dela
+        decay = 1 - (limit - cost) / current
+        return max(1, math.ceil(remaining + decay * window_seconds))
+    
+    def _evict(self, now: float):
+        """Remove chaves expiradas do início do LRU e mantém o limite de tamanho"""
+        while self._counters:
+            key, counter = next(iter(self._counters.items()))
+            if counter.expires_at > now and len(self._counters) <= self.max_keys:
+                break
+            del self._counters[key]
+            self.evictions += 1
+    
+    async def start(self):
+        pass
+    
+    async def stop(self):
+        pass
+    
+    def snapshot(self) -> dict:
+        return {
+            "backend": self.backend,
+            "keys": len(self._counters),
+            "max_keys": self.max_keys,
+            "evictions": self.evictions
+        }
+
+
+class MongoRateLimitStorage(MemoryRateLimitStorage):
+    """
+    Contadores compartilhados entre workers e réplicas via MongoDB.
+    
+    A decisão continua local (sem ida ao banco por requisição): os consumos são
+    acumulados em memória e enviados em lote a cada `sync_interval` com `$inc`
+    em documentos por (chave, janela), que expiram por índice TTL. Na mesma
+    sincronização são lidas as contagens globais das chaves ativas, e a parte
+    que veio de outros workers entra na estimativa da janela deslizante.
+    
+    Se o banco ficar indisponível, os consumos pendentes são mantidos e o limite
+    segue aplicado com as contagens locais.
+    """
+    
+    backend = "mongo"
+    
+    def __init__(self, db, max_keys: int = RATE_LIMIT_MAX_KEYS, sync_interval: float = RATE_LIMIT_SYNC_SECONDS):
+        super().__init__(max_keys)
+        self.db = db
+        self.sync_interval = sync_interval
+        self._pending: Dict[str, int] = {}  # documento -> consumo ainda não enviado
+        self._flushed: Dict[str, int] = {}  # documento -> consumo deste worker já enviado
+        self._remote: Dict[str, int] = {}  # documento -> consumo de outros workers
+        self._expires: Dict[str, float] = {}  # documento -> fim da validade (timestamp)
+        self._active: Set[str] = set()  # documentos usados desde a última sincronização
+        self._task: Optional[asyncio.Task] = None
+        self.syncs = 0
+        self.sync_errors = 0
+    
+    @staticmethod
+    def _doc_id(key: str, window: int) -> str:
+        return f"{key}|{window}"
+    
+    def _others(self, key: str, window: int, window_seconds: int) -> Tuple[int, int]:
+        previous_id = self._doc_id(key, window - 1)
+        current_id = self._doc_id(key, window)
+        self._active.add(previous_id)
+        self._active.add(current_id)
+        self._expires.setdefault(previous_id, (window + 1) * window_seconds)
+        self._expires.setdefault(current_id, (window + 2) * window_seconds)
+        return self._remote.get(previous_id, 0), self._remote.get(current_id, 0)
+    
+    def _record(self, key: str, window: int, window_seconds: int, cost: int):
+        doc_id = self._doc_id(key, window)
+        self._pending[doc_id] = self._pending.get(doc_id, 0) + cost
+    
+    async def start(self):
+        await self.db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+        self._task = asyncio.create_task(self._sync_loop())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.sync()
+    
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+    
+    async def sync(self):
+        """Envia os consumos pendentes e lê as contagens globais das chaves ativas"""
+        pending, self._pending = self._pending, {}
+        active, self._active = self._active | set(pending), set()
+        
+        if pending:
+            try:
+                await self.db.rate_limits.bulk_write([
+                    UpdateOne(
+                        {"_id": doc_id},
+                        {
+                            "$inc": {"count": count},
+                            "$setOnInsert": {
+                                "expires_at": datetime.fromtimestamp(self._expires[doc_id], timezone.utc)
+                            }
+                        },
+                        upsert=True
+                    )
+                    for doc_id, count in pending.items()
+                ], ordered=False)
+                for doc_id, count in pending.items():
+                    self._flushed[doc_id] = self._flushed.get(doc_id, 0) + count
+            except Exception as e:
+                # Devolve os consumos para a próxima tentativa
+                for doc_id, count in pending.items():
+                    self._pending[doc_id] = self._pending.get(doc_id, 0) + count
+                self.sync_errors += 1
+                logger.error(f"Erro ao enviar contadores de rate limit: {str(e)}")
+        
+        if active:
+            try:
+                docs = await self.db.rate_limits.find({"_id": {"$in": list(active)}}).to_list(None)
+                for doc in docs:
+                    self._remote[doc["_id"]] = max(0, doc["count"] - self._flushed.get(doc["_id"], 0))
+            except Exception as e:
+                self._active |= active
+                self.sync_errors += 1
+                logger.error(f"Erro ao ler contadores de rate limit: {str(e)}")
+        
+        self.syncs += 1
+        self._prune(time.time())
+    
+    def _prune(self, now: float):
+        """Descarta o estado de sincronização de janelas já vencidas"""
+        expired = [doc_id for doc_id, expires in self._expires.items() if expires <= now]
+        for doc_id in expired:
+            del self._expires[doc_id]
+            self._pending.pop(doc_id, None)
+            self._flushed.pop(doc_id, None)
+            self._remote.pop(doc_id, None)
+    
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data.update({
+            "pending_keys": len(self._pending),
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors
+        })
+        return data
+
+
+class RateLimiter:
+    """Aplica as políticas de rate limit sobre um backend de contadores"""
+    
+    def __init__(
+        self,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        default_policy: RateLimitPolicy = DEFAULT_POLICY,
+        storage: Optional[MemoryRateLimitStorage] = None
+    ):
+        self.storage = storage or MemoryRateLimitStorage(max_keys)
+        self.default_policy = default_policy
+        self.allowed = 0
+        self.rejected_by_policy: Dict[str, int] = {}
+    
+    async def configure(self, db):
+        """Seleciona o backend de contadores conforme RATE_LIMIT_BACKEND"""
+        if RATE_LIMIT_BACKEND == "mongo":
+            self.storage = MongoRateLimitStorage(db, self.storage.max_keys)
+        await self.storage.start()
+        logger.info(f"Rate limit com backend {self.storage.backend}")
+    
+    async def stop(self):
+        await self.storage.stop()
+    
+    def hit(self, key: str, limit: int, window_seconds: int, cost: int = 1, now: Optional[float] = None) -> Tuple[bool, int]:
+        return self.storage.hit(key, limit, window_seconds, cost, now)
+    
+    @staticmethod
+    def identify(request: Request) -> Tuple[str, Optional[str], str]:
+        """Identifica o cliente: usuário do token (quando válido) ou IP"""
+        ip = request.client.host if request.client else "unknown"
+        
+        authorization = request.headers.get("authorization")
+        if authorization:
+            parts = authorization.split()
+            if len(parts) == 2 and parts[0].lower() == "bearer":
+                payload = authenticate_token(parts[1])
+                if payload:
+                    return f"user:{payload['sub']}", payload.get("role"), ip
+        
+        return f"ip:{ip}", None, ip
+    
+    def _enforce(self, policy: RateLimitPolicy, key: str, limit: int, cost: int = 1):
+        allowed, retry_after = self.hit(f"{policy.name}:{key}", limit, policy.window_seconds, cost)
+        if not allowed:
+            self.rejected_by_policy[policy.name] = self.rejected_by_policy.get(policy.name, 0) + 1
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Limite de requisições excedido. Tente novamente em {self.window_seconds} segundos."
+                detail=f"Limite de requisições excedido. Tente novamente em {retry_after} segundos.",
+                headers={"Retry-After": str(retry_after)}
             )
+    
+    async def check_rate_limit(self, request: Request):
+        """Verifica os limites aplicáveis à requisição (levanta 429 se excedido)"""
+        identity, role, ip = self.identify(request)
+        path = request.url.path
         
-        # Adiciona requisição atual
-        self.requests[client_ip].append(now)
+        policy = ROUTE_POLICIES.get((request.method, path))
+        if policy:
+            self._enforce(policy, f"ip:{ip}" if policy.per == "ip" else identity, policy.limit)
+        
+        default = self.default_policy
+        limit = default.limit * ROLE_LIMIT_MULTIPLIERS.get(role, 1)
+        self._enforce(default, identity, limit, route_cost(path))
+        self.allowed += 1
     
-    async def cleanup_old_requests(self):
-        """Limpeza periódica de requisições antigas"""
-        while True:
-            await asyncio.sleep(self.window_seconds)
-            now = datetime.now(timezone.utc)
-            
-            for ip in list(self.requests.keys()):
-                self.requests[ip] = [
-                    req_time for req_time in self.requests[ip]
-                    if now - req_time < timedelta(seconds=self.window_seconds)
-                ]
-                
-                if not self.requests[ip]:
-                    del self.requests[ip]
+    def snapshot(self) -> dict:
+        """Métricas do rate limiter"""
+        data = self.storage.snapshot()
+        data.update({
+            "allowed": self.allowed,
+            "rejected_by_policy": dict(self.rejected_by_policy)
+        })
+        return data
 
 # Instância global
 rate_limiter = RateLimiter()
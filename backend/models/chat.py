@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime, timezone
 import uuid
 
@@ -10,6 +10,13 @@ class Chat(BaseModel):
     job_id: str
     client_id: str
     videomaker_id: str
+    job_titulo: Optional[str] = None
+    
+    # Resumo mantido a cada mensagem (lista de chats)
+    last_message: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    last_sender_id: Optional[str] = None
+    unread: Dict[str, int] = {}  # user_id -> mensagens não lidas
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MessageCreate(BaseModel):
@@ -17,6 +24,9 @@ class MessageCreate(BaseModel):
     content: str
     attachments: List[str] = []  # GridFS file IDs
 
+class MarkReadRequest(BaseModel):
+    until: Optional[str] = None  # Cursor do histórico; sem ele, todas as mensagens
+
 class Message(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime, timezone
+from typing import Dict, Optional
 
 class PlatformConfig(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -9,7 +10,12 @@ class PlatformConfig(BaseModel):
     valor_hora_base: float = 120.0  # R$ 120/hora
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_by: str = "system"
+    version: int = 0  # Incrementada a cada alteração (invalidação dos caches)
+    moderation_rules: Optional[Dict[str, str]] = None  # Regras do chat (nome -> regex); None = padrão
 
 class ConfigUpdate(BaseModel):
     taxa_comissao: float = Field(..., ge=0.0, le=1.0)
     valor_hora_base: float = Field(..., gt=0.0)
+
+class ModerationRulesUpdate(BaseModel):
+    rules: Optional[Dict[str, str]] = None  # None restaura as regras padrão
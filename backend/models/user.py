@@ -48,6 +48,15 @@ class UserResponse(BaseModel):
     raio_atuacao_km: float
     created_at: datetime
 
+# Valores usados quando o documento do usuário não tem o campo
+USER_RESPONSE_DEFAULTS = {
+    "verificado": False,
+    "rating_medio": 0.0,
+    "total_avaliacoes": 0,
+    "portfolio_videos": [],
+    "raio_atuacao_km": 50.0
+}
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -57,3 +66,10 @@ class TokenResponse(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
     user: UserResponse
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class ChangePasswordRequest(BaseModel):
+    current_password: str
+    new_password: str
@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from middleware.auth_middleware import get_current_user, require_role
-from models.config import PlatformConfig, ConfigUpdate
-from models.user import UserResponse
+from models.config import PlatformConfig, ConfigUpdate, ModerationRulesUpdate
+from models.user import UserResponse, USER_RESPONSE_DEFAULTS
+from services.revocation_service import revocation_list
+from services.config_service import config_service
+from services.entity_cache import user_cache
+from utils.serialization import model_list_response
+from utils.field_selection import parse_fields, build_projection
 from typing import List, Optional
 from datetime import datetime, timezone
 
@@ -18,23 +23,17 @@ async def admin_only(user: dict = Depends(get_current_user)):
 async def get_platform_config(user: dict = Depends(admin_only)):
     """Obtém configurações da plataforma"""
     
-    config = await db.platform_config.find_one({"id": "platform_config"}, {"_id": 0})
-    
-    if not config:
-        # Cria config padrão
-        default_config = PlatformConfig()
-        config_dict = default_config.model_dump()
-        config_dict['updated_at'] = config_dict['updated_at'].isoformat()
-        
-        await db.platform_config.insert_one(config_dict)
-        return default_config
+    # Cria a config padrão se não existir
+    config = await config_service.get()
     
     return PlatformConfig(
         id=config["id"],
         taxa_comissao=config["taxa_comissao"],
         valor_hora_base=config["valor_hora_base"],
         updated_at=datetime.fromisoformat(config["updated_at"]) if isinstance(config["updated_at"], str) else config["updated_at"],
-        updated_by=config.get("updated_by", "system")
+        updated_by=config.get("updated_by", "system"),
+        version=config.get("version", 0),
+        moderation_rules=config.get("moderation_rules")
     )
 
 @router.put("/config")
@@ -51,11 +50,8 @@ async def update_platform_config(
         "updated_by": user["sub"]
     }
     
-    result = await db.platform_config.update_one(
-        {"id": "platform_config"},
-        {"$set": update_dict},
-        upsert=True
-    )
+    # Incrementa a versão; outros workers recebem pelo change stream (ou TTL)
+    config = await config_service.update(update_dict)
     
     # Log de auditoria
     await db.audit_logs.insert_one({
@@ -68,7 +64,59 @@ async def update_platform_config(
     return {
         "success": True,
         "message": "Configurações atualizadas",
-        "config": update_dict
+        "config": {**update_dict, "version": config.get("version", 0)}
+    }
+
+@router.get("/moderation/rules")
+async def get_moderation_rules(user: dict = Depends(admin_only)):
+    """Regras de moderação do chat ativas neste worker"""
+    from services.moderation_service import moderation_service, DEFAULT_RULES
+    
+    return {
+        "rules": moderation_service.rules,
+        "default": moderation_service.rules == DEFAULT_RULES
+    }
+
+@router.put("/moderation/rules")
+async def update_moderation_rules(
+    rules_update: ModerationRulesUpdate,
+    user: dict = Depends(admin_only)
+):
+    """
+    Troca as regras de moderação do chat sem reiniciar
+    
+    As regras (nome -> regex) são validadas e ativadas neste worker na hora; os
+    demais as recebem pela configuração da plataforma.
+    """
+    from services.moderation_service import moderation_service
+    
+    try:
+        moderation_service.load(rules_update.rules)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    update_dict = {
+        "moderation_rules": rules_update.rules,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        "updated_by": user["sub"]
+    }
+    config = await config_service.update(update_dict)
+    
+    await db.audit_logs.insert_one({
+        "user_id": user["sub"],
+        "action": "update_moderation_rules",
+        "details": update_dict,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
+    
+    return {
+        "success": True,
+        "message": "Regras de moderação atualizadas",
+        "rules": moderation_service.rules,
+        "version": config.get("version", 0)
     }
 
 @router.get("/users", response_model=List[UserResponse])
@@ -76,10 +124,13 @@ async def list_all_users(
     role: Optional[str] = Query(None),
     ativo: Optional[bool] = Query(None),
     verificado: Optional[bool] = Query(None),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
     user: dict = Depends(admin_only)
 ):
     """Lista todos os usuários com filtros"""
     
+    selected = parse_fields("users", fields, user.get("role"))
+    
     query = {}
     
     if role:
@@ -89,27 +140,9 @@ async def list_all_users(
     if verificado is not None:
         query["verificado"] = verificado
     
-    users = await db.users.find(query, {"_id": 0}).to_list(10000)
-    
-    response = []
-    for user_dict in users:
-        response.append(UserResponse(
-            id=user_dict["id"],
-            email=user_dict["email"],
-            nome=user_dict["nome"],
-            telefone=user_dict["telefone"],
-            role=user_dict["role"],
-            cidade=user_dict.get("cidade"),
-            estado=user_dict.get("estado"),
-            verificado=user_dict.get("verificado", False),
-            rating_medio=user_dict.get("rating_medio", 0.0),
-            total_avaliacoes=user_dict.get("total_avaliacoes", 0),
-            portfolio_videos=user_dict.get("portfolio_videos", []),
-            raio_atuacao_km=user_dict.get("raio_atuacao_km", 50.0),
-            created_at=datetime.fromisoformat(user_dict["created_at"]) if isinstance(user_dict["created_at"], str) else user_dict["created_at"]
-        ))
-    
-    return response
+    users = await db.users.find(query, build_projection(selected)).to_list(10000)
+    
+    return model_list_response(UserResponse, users, defaults=USER_RESPONSE_DEFAULTS, fields=selected)
 
 @router.put("/users/{user_id}/ban")
 async def ban_user(
@@ -119,7 +152,7 @@ async def ban_user(
 ):
     """Banir/desativar usuário"""
     
-    user_dict = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user_dict = await user_cache.get(user_id)
     if not user_dict:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -133,6 +166,10 @@ async def ban_user(
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    user_cache.invalidate(user_id)
+    
+    # Invalida tokens já emitidos (access e refresh)
+    await revocation_list.revoke_subject(user_id, reason="ban")
     
     # Log de auditoria
     await db.audit_logs.insert_one({
@@ -162,6 +199,7 @@ async def unban_user(
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    user_cache.invalidate(user_id)
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -196,6 +234,7 @@ async def verify_user(
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    user_cache.invalidate(user_id)
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -211,30 +250,36 @@ async def verify_user(
 @router.get("/jobs")
 async def admin_list_jobs(
     status_filter: Optional[str] = Query(None, alias="status"),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
     user: dict = Depends(admin_only)
 ):
     """Lista todos os jobs (admin)"""
     
+    selected = parse_fields("admin_jobs", fields, user.get("role"))
+    
     query = {}
     if status_filter:
         query["status"] = status_filter
     
-    jobs = await db.jobs.find(query, {"_id": 0}).to_list(10000)
+    jobs = await db.jobs.find(query, build_projection(selected)).to_list(10000)
     
     return jobs
 
 @router.get("/payments")
 async def admin_list_payments(
     status_filter: Optional[str] = Query(None, alias="status"),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
     user: dict = Depends(admin_only)
 ):
     """Lista todos os pagamentos (admin)"""
     
+    selected = parse_fields("admin_payments", fields, user.get("role"))
+    
     query = {}
     if status_filter:
         query["status"] = status_filter
     
-    payments = await db.payments.find(query, {"_id": 0}).to_list(10000)
+    payments = await db.payments.find(query, build_projection(selected)).to_list(10000)
     
     return payments
 
@@ -324,6 +369,46 @@ async def get_platform_stats(user: dict = Depends(admin_only)):
         }
     }
 
+@router.get("/metrics")
+async def get_runtime_metrics(user: dict = Depends(admin_only)):
+    """Métricas de runtime deste worker (event loop, caches, filas)"""
+    from middleware.loop_monitor import loop_monitor
+    from services.auth_service import password_hasher
+    from services.token_cache import token_cache
+    from services.google_auth_service import google_token_verifier
+    from middleware.rate_limiter import rate_limiter
+    from middleware.admission_control import admission_controller
+    from services.entity_cache import job_cache
+    from middleware.compression import response_compressor
+    from middleware.idempotency import idempotency_store
+    from services.chat_broker import chat_broker
+    from services.chat_connections import connection_manager
+    from services.message_writer import message_writer
+    from services.moderation_service import moderation_service
+    from services.presence_service import presence_service
+    
+    return {
+        "platform_config": config_service.snapshot(),
+        "event_loop": loop_monitor.snapshot(),
+        "password_hasher": password_hasher.snapshot(),
+        "token_cache": token_cache.snapshot(),
+        "token_revocation": revocation_list.snapshot(),
+        "google_certs": google_token_verifier.snapshot(),
+        "rate_limiter": rate_limiter.snapshot(),
+        "admission": admission_controller.snapshot(),
+        "compression": response_compressor.snapshot(),
+        "idempotency": idempotency_store.snapshot(),
+        "chat_broker": chat_broker.snapshot(),
+        "chat_connections": connection_manager.snapshot(),
+        "message_writer": message_writer.snapshot(),
+        "moderation": moderation_service.snapshot(),
+        "presence": presence_service.snapshot(),
+        "entity_cache": {
+            "users": user_cache.snapshot(),
+            "jobs": job_cache.snapshot()
+        }
+    }
+
 @router.get("/analytics/growth")
 async def get_growth_analytics(
     months: int = Query(6, ge=1, le=24),
@@ -532,7 +617,7 @@ async def get_top_performers(
     top_videomakers = []
     for item in top_videomakers_data:
         if item["_id"]:
-            user_data = await db.users.find_one({"id": item["_id"]}, {"_id": 0, "nome": 1, "email": 1, "rating_medio": 1, "total_avaliacoes": 1})
+            user_data = await user_cache.get(item["_id"], {"_id": 0, "nome": 1, "email": 1, "rating_medio": 1, "total_avaliacoes": 1})
             if user_data:
                 top_videomakers.append({
                     "id": item["_id"],
@@ -564,7 +649,7 @@ async def get_top_performers(
     # Enriquecer com dados do usuário
     top_clients = []
     for item in top_clients_data:
-        user_data = await db.users.find_one({"id": item["_id"]}, {"_id": 0, "nome": 1, "email": 1})
+        user_data = await user_cache.get(item["_id"], {"_id": 0, "nome": 1, "email": 1})
         if user_data:
             top_clients.append({
                 "id": item["_id"],
@@ -1,23 +1,33 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Request
-from models.user import UserCreate, User, UserLogin, TokenResponse, UserResponse
-from services.auth_service import hash_password, verify_password, create_access_token, create_refresh_token, decode_token
+from models.user import UserCreate, User, UserLogin, TokenResponse, UserResponse, LogoutRequest, ChangePasswordRequest
+from services.auth_service import password_hasher, PasswordHasherBusy, create_access_token, create_refresh_token, decode_token
+from services.revocation_service import revocation_list
+from services.google_auth_service import google_token_verifier
+from middleware.auth_middleware import get_current_user
 from services.security_service import AuditService
+from services.entity_cache import user_cache
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timezone
 from pydantic import BaseModel
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 import os
 
 router = APIRouter(prefix="/auth", tags=["Autenticação"])
 
 # Dependência para obter o banco de dados (será injetado no server.py)
-from server import db, limiter
+from server import db
 
 class GoogleSignInRequest(BaseModel):
     token: str
     role: str = "client"  # Default role for Google sign-in users
 
+def hasher_busy_error() -> HTTPException:
+    """Resposta rápida quando o pool de hashing de senha está saturado"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servidor ocupado. Tente novamente em instantes.",
+        headers={"Retry-After": "1"}
+    )
+
 @router.post("/signup", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
 async def signup(user_data: UserCreate):
     """Cadastro de novo usuário (cliente ou videomaker)"""
@@ -37,6 +47,12 @@ async def signup(user_data: UserCreate):
             detail="Role inválida. Use: client, videomaker ou admin"
         )
     
+    # Gera hash da senha fora do event loop
+    try:
+        password_hash = await password_hasher.hash(user_data.password)
+    except PasswordHasherBusy:
+        raise hasher_busy_error()
+    
     # Cria usuário
     user = User(
         email=user_data.email,
@@ -47,7 +63,7 @@ async def signup(user_data: UserCreate):
         estado=user_data.estado,
         latitude=user_data.latitude,
         longitude=user_data.longitude,
-        password_hash=hash_password(user_data.password),
+        password_hash=password_hash,
         raio_atuacao_km=user_data.raio_atuacao_km
     )
     
@@ -93,7 +109,6 @@ async def signup(user_data: UserCreate):
     )
 
 @router.post("/login", response_model=TokenResponse)
-@limiter.limit("5/minute")  # Máximo 5 tentativas por minuto
 async def login(request: Request, credentials: UserLogin):
     """Login de usuário com rate limiting"""
     
@@ -119,8 +134,15 @@ async def login(request: Request, credentials: UserLogin):
             detail="Email ou senha incorretos"
         )
     
-    # Verifica senha
-    if not verify_password(credentials.password, user_dict["password_hash"]):
+    # Verifica senha (fora do event loop)
+    try:
+        password_valid, new_password_hash = await password_hasher.verify(
+            credentials.password, user_dict.get("password_hash", "")
+        )
+    except PasswordHasherBusy:
+        raise hasher_busy_error()
+    
+    if not password_valid:
         # Log de tentativa falhada
         await AuditService.log(
             db=db,
@@ -147,6 +169,14 @@ async def login(request: Request, credentials: UserLogin):
             detail="Usuário banido ou inativo"
         )
     
+    # Atualiza o hash se o custo do bcrypt mudou
+    if new_password_hash:
+        await db.users.update_one(
+            {"id": user_dict["id"]},
+            {"$set": {"password_hash": new_password_hash}}
+        )
+        user_cache.invalidate(user_dict["id"])
+    
     # Gera tokens
     access_token = create_access_token(
         data={"sub": user_dict["id"], "email": user_dict["email"], "role": user_dict["role"]}
@@ -193,7 +223,7 @@ async def refresh_token(refresh_token: str):
     """Renova access token usando refresh token"""
     
     payload = decode_token(refresh_token, "refresh")
-    if not payload:
+    if not payload or revocation_list.is_revoked(payload):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh token inválido ou expirado"
@@ -218,19 +248,110 @@ async def refresh_token(refresh_token: str):
         "token_type": "bearer"
     }
 
+@router.post("/logout")
+async def logout(
+    request: Request,
+    body: LogoutRequest = LogoutRequest(),
+    user: dict = Depends(get_current_user)
+):
+    """Revoga o access token atual e, se enviado, o refresh token"""
+    
+    await revocation_list.revoke_token(user, reason="logout")
+    
+    if body.refresh_token:
+        refresh_payload = decode_token(body.refresh_token, "refresh")
+        if refresh_payload and refresh_payload.get("sub") == user["sub"]:
+            await revocation_list.revoke_token(refresh_payload, reason="logout")
+    
+    await AuditService.log(
+        db=db,
+        user_id=user["sub"],
+        user_email=user.get("email", ""),
+        user_role=user.get("role", ""),
+        action="logout",
+        resource="auth",
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+        status="success"
+    )
+    
+    return {
+        "success": True,
+        "message": "Logout realizado"
+    }
+
+@router.post("/change-password")
+async def change_password(
+    request: Request,
+    body: ChangePasswordRequest,
+    user: dict = Depends(get_current_user)
+):
+    """Troca a senha e revoga todos os tokens emitidos anteriormente"""
+    
+    user_dict = await db.users.find_one({"id": user["sub"]}, {"_id": 0})
+    if not user_dict:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuário não encontrado"
+        )
+    
+    try:
+        password_valid, _ = await password_hasher.verify(
+            body.current_password, user_dict.get("password_hash", "")
+        )
+        if not password_valid:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Senha atual incorreta"
+            )
+        
+        new_password_hash = await password_hasher.hash(body.new_password)
+    except PasswordHasherBusy:
+        raise hasher_busy_error()
+    
+    await db.users.update_one(
+        {"id": user["sub"]},
+        {"$set": {
+            "password_hash": new_password_hash,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    user_cache.invalidate(user["sub"])
+    
+    # Encerra as sessões abertas em outros dispositivos
+    await revocation_list.revoke_subject(user["sub"], reason="password_change")
+    
+    # Novos tokens para a sessão atual (emitidos depois do corte)
+    access_token = create_access_token(
+        data={"sub": user_dict["id"], "email": user_dict["email"], "role": user_dict["role"]}
+    )
+    refresh_token = create_refresh_token(data={"sub": user_dict["id"]})
+    
+    await AuditService.log(
+        db=db,
+        user_id=user["sub"],
+        user_email=user_dict["email"],
+        user_role=user_dict["role"],
+        action="change_password",
+        resource="auth",
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+        status="success"
+    )
+    
+    return {
+        "success": True,
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer"
+    }
+
 @router.post("/google", response_model=TokenResponse)
 async def google_signin(request: GoogleSignInRequest):
     """Autenticação via Google Sign-In"""
     try:
-        from google.oauth2 import id_token
-        from google.auth.transport import requests as google_requests
-        
-        # Verify the Google token
-        idinfo = id_token.verify_oauth2_token(
-            request.token, 
-            google_requests.Request(),
-            None  # We're not verifying the audience for now
-        )
+        # Verifica o token localmente com os certificados do Google em cache
+        idinfo = await google_token_verifier.verify(request.token)
         
         # Get user info from Google
         email = idinfo['email']
@@ -1,136 +1,316 @@
-from fastapi import APIRouter, HTTPException, status, Depends, WebSocket, WebSocketDisconnect, UploadFile, File
-from middleware.auth_middleware import get_current_user
-from models.chat import MessageCreate, Message, MessageResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Query, WebSocket, WebSocketDisconnect, UploadFile, File
+from middleware.auth_middleware import get_current_user, get_websocket_user
+from models.chat import MarkReadRequest, MessageCreate, Message, MessageResponse
 from services.storage_service import StorageService
-from utils.validators import contains_blocked_content
-from typing import List, Dict
+from services.chat_summary import ChatSummaryService, SUMMARY_PROJECTION, other_participant
+from services.chat_connections import connection_manager, ChatConnection, CLOSE_POLICY
+from services.message_writer import message_writer
+from services.presence_service import presence_service, TYPING_TTL_SECONDS
+from services.moderation_service import moderation_service
+from utils.serialization import model_list_response
+from utils.cursor import encode_cursor, cursor_filter
+from typing import List, Optional, Set, Tuple
 from datetime import datetime, timezone
-import json
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 from server import db
 
 storage_service = StorageService(db)
+chat_summary = ChatSummaryService(db)
 
-# Gerenciador de conexões WebSocket
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, chat_id: str):
-        await websocket.accept()
-        if chat_id not in self.active_connections:
-            self.active_connections[chat_id] = []
-        self.active_connections[chat_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, chat_id: str):
-        if chat_id in self.active_connections:
-            self.active_connections[chat_id].remove(websocket)
-            if not self.active_connections[chat_id]:
-                del self.active_connections[chat_id]
-    
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-    
-    async def broadcast(self, message: str, chat_id: str):
-        if chat_id in self.active_connections:
-            for connection in self.active_connections[chat_id]:
-                await connection.send_text(message)
+# Conexões WebSocket deste worker (filas de envio por conexão + broker entre workers)
+manager = connection_manager
 
-manager = ConnectionManager()
+# Chats assinados ao mesmo tempo numa conexão multiplexada
+CHAT_WS_MAX_SUBSCRIPTIONS = int(os.getenv("CHAT_WS_MAX_SUBSCRIPTIONS", "200"))
 
-@router.websocket("/ws/{chat_id}")
-async def websocket_endpoint(websocket: WebSocket, chat_id: str):
-    """WebSocket para chat em tempo real"""
+CHAT_PROJECTION = {"_id": 0, "id": 1, "client_id": 1, "videomaker_id": 1}
+
+# Usuários por consulta de presença
+PRESENCE_MAX_QUERY = 100
+
+# Página padrão do histórico (mensagens mais recentes)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+
+# Avisos de chat_update em andamento (referência até terminarem)
+_chat_updates: Set[asyncio.Task] = set()
+
+async def notify_chat_update(participants: Tuple[str, str], event: dict):
+    for user_id in participants:
+        await manager.notify_user(user_id, event)
+
+def record_chat_message(participants: Tuple[str, str], message: Message, future: asyncio.Future):
+    """
+    Depois da mensagem gravada, atualiza o resumo do chat e avisa os
+    participantes (lista de chats) sobre a última mensagem
+    
+    Callback do future de gravação: mensagem que não foi gravada não entra no
+    resumo nem no contador de não lidas. O resumo vai no próximo lote do
+    `message_writer` e os avisos saem em segundo plano.
+    """
+    if future.cancelled() or future.exception():
+        return
+    
+    created_at = message.created_at.isoformat()
+    recipient_id = other_participant(
+        {"client_id": participants[0], "videomaker_id": participants[1]},
+        message.sender_id
+    )
+    chat_summary.record_message(message.chat_id, message.sender_id, recipient_id, message.content, created_at)
+    
+    task = asyncio.create_task(notify_chat_update(participants, {
+        "type": "chat_update",
+        "chat_id": message.chat_id,
+        "sender_id": message.sender_id,
+        "last_message": message.content,
+        "last_message_at": created_at
+    }))
+    _chat_updates.add(task)
+    task.add_done_callback(_chat_updates.discard)
+
+def send_persisted_ack(connection: ChatConnection, message: Message, ref, future: asyncio.Future):
+    """Confirma ao remetente que a mensagem foi gravada (`ref` é o id do cliente)"""
+    if future.cancelled() or future.exception():
+        connection.send_event({
+            "type": "nack",
+            "chat_id": message.chat_id,
+            "id": message.id,
+            "ref": ref,
+            "error": "Mensagem não gravada, tente novamente"
+        })
+    else:
+        connection.send_event({"type": "ack", "chat_id": message.chat_id, "id": message.id, "ref": ref})
+
+async def handle_client_message(connection: ChatConnection, chat_id: str, message_data: dict):
+    """
+    Modera, distribui e grava uma mensagem recebida pelo WebSocket
+    
+    A entrega não espera a gravação: a mensagem vai para o próximo lote do
+    `message_writer` e o remetente recebe `ack` (ou `nack`) quando o lote é
+    confirmado. Só então o resumo do chat é atualizado, sem prender o laço de
+    recebimento.
+    """
+    
+    # Participação verificada na entrada do chat; o remetente é o usuário do token
+    if chat_id not in connection.chats:
+        connection.send_event({"chat_id": chat_id, "error": "Você não é participante deste chat"})
+        return
+    sender_id = connection.user_id
+    presence_service.clear_typing(chat_id, sender_id)
+    
+    # Moderação de conteúdo
+    content = message_data.get("content", "")
+    is_blocked, blocked_reason = moderation_service.check(chat_id, sender_id, content)
+    
+    # Cria mensagem
+    message = Message(
+        chat_id=chat_id,
+        sender_id=sender_id,
+        content=content,
+        attachments=message_data.get("attachments", []),
+        blocked=is_blocked,
+        blocked_reason=blocked_reason
+    )
+    
+    # Grava no próximo lote
+    message_dict = message.model_dump()
+    message_dict['created_at'] = message_dict['created_at'].isoformat()
     
-    await manager.connect(websocket, chat_id)
+    persisted = message_writer.submit("messages", message_dict)
+    ref = message_data.get("ref")
+    persisted.add_done_callback(lambda future: send_persisted_ack(connection, message, ref, future))
+    
+    # Se bloqueada, notifica apenas remetente
+    if is_blocked:
+        connection.send_event({
+            "type": "blocked",
+            "chat_id": chat_id,
+            "message": "Mensagem bloqueada",
+            "reason": blocked_reason,
+            "hint": "Não é permitido compartilhar números, emails ou links"
+        })
+        
+        # Log de moderação
+        message_writer.submit("moderation_logs", {
+            "chat_id": chat_id,
+            "message_id": message.id,
+            "sender_id": sender_id,
+            "reason": blocked_reason,
+            "content": content,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+    else:
+        # Envia para todos no chat
+        response = {
+            "type": "message",
+            "data": {
+                "id": message.id,
+                "chat_id": message.chat_id,
+                "sender_id": message.sender_id,
+                "content": message.content,
+                "attachments": message.attachments,
+                "created_at": message.created_at.isoformat()
+            }
+        }
+        participants = connection.chats[chat_id]
+        await manager.broadcast(response, chat_id)
+        persisted.add_done_callback(lambda future: record_chat_message(participants, message, future))
+
+async def handle_typing(connection: ChatConnection, chat_id: str, message_data: dict):
+    """Repassa o indicador de digitação ao chat, com debounce por usuário"""
+    if chat_id not in connection.chats:
+        return
+    
+    typing = bool(message_data.get("typing", True))
+    if presence_service.typing_changed(chat_id, connection.user_id, typing):
+        await manager.broadcast({
+            "type": "typing",
+            "chat_id": chat_id,
+            "user_id": connection.user_id,
+            "typing": typing,
+            "ttl": TYPING_TTL_SECONDS
+        }, chat_id, ephemeral=True)
+
+@router.websocket("/ws")
+async def user_websocket_endpoint(websocket: WebSocket):
+    """
+    WebSocket do usuário, multiplexando todos os seus chats
+    
+    Autenticação como em `/ws/{chat_id}`. Além das notificações e dos avisos
+    `chat_update` (lista de chats), o cliente escolhe os chats abertos com frames:
+    
+    - `{"type": "subscribe", "chat_id": ...}` / `{"type": "unsubscribe", "chat_id": ...}`
+    - `{"type": "message", "chat_id": ..., "content": ..., "attachments": [...], "ref": ...}`
+      (confirmada com `ack`/`nack` contendo o mesmo `ref` quando gravada)
+    - `{"type": "typing", "chat_id": ..., "typing": true|false}`
+    - `{"type": "pong"}` (resposta ao heartbeat)
+    
+    Cada chat assinado entrega também a presença (`presence`) do outro
+    participante e os avisos de digitação (`typing`).
+    """
+    
+    user = get_websocket_user(websocket)
+    if not user:
+        await websocket.close(code=CLOSE_POLICY)
+        return
+    
+    connection = await manager.connect(websocket, user, multiplexed=True)
     
     try:
         while True:
-            # Recebe mensagem do cliente
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await connection.receive_event()
+            frame_type = message_data.get("type")
             
-            # Verifica chat
-            chat = await db.chats.find_one({"id": chat_id}, {"_id": 0})
-            if not chat:
-                await manager.send_personal_message(
-                    json.dumps({"error": "Chat não encontrado"}),
-                    websocket
-                )
+            if frame_type == "pong":
                 continue
             
-            # Valida que sender é participante
-            sender_id = message_data.get("sender_id")
-            if sender_id not in [chat["client_id"], chat["videomaker_id"]]:
-                await manager.send_personal_message(
-                    json.dumps({"error": "Você não é participante deste chat"}),
-                    websocket
-                )
+            # Token revogado durante a sessão
+            if not connection.is_authorized():
+                await connection.close(CLOSE_POLICY)
+                return
+            
+            chat_id = message_data.get("chat_id")
+            if not isinstance(chat_id, str):
+                connection.send_event({"error": "chat_id obrigatório"})
                 continue
             
-            # Moderação de conteúdo
-            content = message_data.get("content", "")
-            is_blocked, blocked_reason = contains_blocked_content(content)
+            if frame_type == "subscribe":
+                if chat_id not in connection.chats:
+                    if len(connection.chats) >= CHAT_WS_MAX_SUBSCRIPTIONS:
+                        connection.send_event({"chat_id": chat_id, "error": "Limite de chats abertos atingido"})
+                        continue
+                    
+                    chat = await db.chats.find_one({"id": chat_id}, CHAT_PROJECTION)
+                    if not chat or connection.user_id not in (chat["client_id"], chat["videomaker_id"]):
+                        connection.send_event({"chat_id": chat_id, "error": "Você não é participante deste chat"})
+                        continue
+                    manager.join(connection, chat)
+                connection.send_event({"type": "subscribed", "chat_id": chat_id})
             
-            # Cria mensagem
-            message = Message(
-                chat_id=chat_id,
-                sender_id=sender_id,
-                content=content,
-                attachments=message_data.get("attachments", []),
-                blocked=is_blocked,
-                blocked_reason=blocked_reason
-            )
+            elif frame_type == "unsubscribe":
+                manager.leave(connection, chat_id)
+                connection.send_event({"type": "unsubscribed", "chat_id": chat_id})
             
-            # Salva no banco
-            message_dict = message.model_dump()
-            message_dict['created_at'] = message_dict['created_at'].isoformat()
+            elif frame_type == "message":
+                await handle_client_message(connection, chat_id, message_data)
             
-            await db.messages.insert_one(message_dict)
+            elif frame_type == "typing":
+                await handle_typing(connection, chat_id, message_data)
             
-            # Se bloqueada, notifica apenas remetente
-            if is_blocked:
-                await manager.send_personal_message(
-                    json.dumps({
-                        "type": "blocked",
-                        "message": "Mensagem bloqueada",
-                        "reason": blocked_reason,
-                        "hint": "Não é permitido compartilhar números, emails ou links"
-                    }),
-                    websocket
-                )
-                
-                # Log de moderação
-                await db.moderation_logs.insert_one({
-                    "chat_id": chat_id,
-                    "message_id": message.id,
-                    "sender_id": sender_id,
-                    "reason": blocked_reason,
-                    "content": content,
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                })
             else:
-                # Envia para todos no chat
-                response = {
-                    "type": "message",
-                    "data": {
-                        "id": message.id,
-                        "chat_id": message.chat_id,
-                        "sender_id": message.sender_id,
-                        "content": message.content,
-                        "attachments": message.attachments,
-                        "created_at": message.created_at.isoformat()
-                    }
-                }
-                await manager.broadcast(json.dumps(response), chat_id)
+                connection.send_event({"chat_id": chat_id, "error": "Tipo de frame desconhecido"})
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, chat_id)
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-        manager.disconnect(websocket, chat_id)
+        await connection.close()
+    except Exception:
+        logger.exception(f"Erro no WebSocket do usuário {connection.user_id}")
+        await connection.close()
+
+@router.websocket("/ws/{chat_id}")
+async def websocket_endpoint(websocket: WebSocket, chat_id: str):
+    """
+    WebSocket para chat em tempo real
+    
+    Autenticação pelo parâmetro `token` (ou header Authorization), verificada
+    uma vez na conexão junto com a participação no chat.
+    
+    Protocolo: sem subprotocolo, frames de texto JSON (v1). Com
+    `Sec-WebSocket-Protocol: videomakers.chat.v2.msgpack` os frames são binários
+    MessagePack (ou `videomakers.chat.v2.json` para JSON); a conexão começa com
+    um `hello` informando versão e codificação.
+    """
+    
+    user = get_websocket_user(websocket)
+    if not user:
+        await websocket.close(code=CLOSE_POLICY)
+        return
+    
+    chat = await db.chats.find_one({"id": chat_id}, CHAT_PROJECTION)
+    if not chat or user["sub"] not in (chat["client_id"], chat["videomaker_id"]):
+        await websocket.close(code=CLOSE_POLICY)
+        return
+    
+    connection = await manager.connect(websocket, user)
+    manager.join(connection, chat)
+    
+    try:
+        while True:
+            # Recebe mensagem do cliente
+            message_data = await connection.receive_event()
+            
+            # Resposta ao heartbeat do servidor
+            if message_data.get("type") == "pong":
+                continue
+            
+            # Token revogado durante a sessão
+            if not connection.is_authorized():
+                await connection.close(CLOSE_POLICY)
+                return
+            
+            # Chat encerrado durante a sessão
+            if chat_id not in connection.chats:
+                connection.send_event({"chat_id": chat_id, "error": "Chat encerrado"})
+                await connection.close()
+                return
+            
+            if message_data.get("type") == "typing":
+                await handle_typing(connection, chat_id, message_data)
+                continue
+            
+            await handle_client_message(connection, chat_id, message_data)
+    
+    except WebSocketDisconnect:
+        await connection.close()
+    except Exception:
+        logger.exception(f"Erro no WebSocket do chat {chat_id}")
+        await connection.close()
 
 @router.post("/message", response_model=MessageResponse)
 async def send_message(
@@ -154,12 +334,14 @@ async def send_message(
             detail="Você não é participante deste chat"
         )
     
+    presence_service.clear_typing(message_data.chat_id, user["sub"])
+    
     # Moderação
-    is_blocked, blocked_reason = contains_blocked_content(message_data.content)
+    is_blocked, blocked_reason = moderation_service.check(message_data.chat_id, user["sub"], message_data.content)
     
     if is_blocked:
         # Log de moderação
-        await db.moderation_logs.insert_one({
+        message_writer.submit("moderation_logs", {
             "chat_id": message_data.chat_id,
             "sender_id": user["sub"],
             "reason": blocked_reason,
@@ -180,11 +362,28 @@ async def send_message(
         attachments=message_data.attachments
     )
     
-    # Salva no banco
     message_dict = message.model_dump()
     message_dict['created_at'] = message_dict['created_at'].isoformat()
+    persisted = message_writer.submit("messages", message_dict)
+    persisted.add_done_callback(
+        lambda future: record_chat_message((chat["client_id"], chat["videomaker_id"]), message, future)
+    )
+    
+    # Só é entregue o que foi gravado (falha aqui vira erro 500 ao remetente)
+    await persisted
     
-    await db.messages.insert_one(message_dict)
+    # Entrega em tempo real para quem está com o chat aberto
+    await manager.broadcast({
+        "type": "message",
+        "data": {
+            "id": message.id,
+            "chat_id": message.chat_id,
+            "sender_id": message.sender_id,
+            "content": message.content,
+            "attachments": message.attachments,
+            "created_at": message.created_at.isoformat()
+        }
+    }, message.chat_id)
     
     return MessageResponse(
         id=message.id,
@@ -201,12 +400,23 @@ async def send_message(
 @router.get("/{chat_id}/messages", response_model=List[MessageResponse])
 async def get_chat_messages(
     chat_id: str,
+    before: Optional[str] = Query(None, description="Cursor: mensagens anteriores a esta posição"),
+    after: Optional[str] = Query(None, description="Cursor: mensagens posteriores a esta posição (desde a última vista)"),
+    limit: int = Query(CHAT_HISTORY_PAGE_SIZE, ge=1, le=CHAT_HISTORY_MAX_PAGE_SIZE),
     user: dict = Depends(get_current_user)
 ):
-    """Obtém histórico de mensagens de um chat"""
+    """
+    Obtém histórico de mensagens de um chat, paginado por cursor
+    
+    Sem cursor, retorna as `limit` mensagens mais recentes. As mensagens vêm
+    sempre em ordem cronológica; os headers trazem os cursores de continuação:
+    
+    - `X-Cursor-Before`: página anterior (ausente quando não há mensagens mais antigas)
+    - `X-Cursor-After`: mensagens novas desde a mais recente desta página
+    """
     
     # Verifica chat
-    chat = await db.chats.find_one({"id": chat_id}, {"_id": 0})
+    chat = await db.chats.find_one({"id": chat_id}, CHAT_PROJECTION)
     if not chat:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -220,27 +430,34 @@ async def get_chat_messages(
             detail="Você não é participante deste chat"
         )
     
-    # Busca mensagens (exceto bloqueadas)
-    messages = await db.messages.find(
-        {"chat_id": chat_id, "blocked": False},
-        {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
-    
-    response = []
-    for msg_dict in messages:
-        response.append(MessageResponse(
-            id=msg_dict["id"],
-            chat_id=msg_dict["chat_id"],
-            sender_id=msg_dict["sender_id"],
-            content=msg_dict["content"],
-            attachments=msg_dict.get("attachments", []),
-            blocked=msg_dict.get("blocked", False),
-            blocked_reason=msg_dict.get("blocked_reason"),
-            created_at=datetime.fromisoformat(msg_dict["created_at"]) if isinstance(msg_dict["created_at"], str) else msg_dict["created_at"],
-            read_at=datetime.fromisoformat(msg_dict["read_at"]) if msg_dict.get("read_at") and isinstance(msg_dict["read_at"], str) else msg_dict.get("read_at")
-        ))
-    
-    return response
+    # Busca mensagens (exceto bloqueadas) pelo índice parcial chat_history;
+    # uma a mais indica se a página tem continuação
+    query = {"chat_id": chat_id, "blocked": False, **cursor_filter(before, after)}
+    direction = 1 if after else -1
+    messages = await db.messages.find(query, {"_id": 0}).sort(
+        [("created_at", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if direction == -1:
+        messages.reverse()
+    
+    headers = {}
+    if messages:
+        oldest, newest = messages[0], messages[-1]
+        if has_more and not after:
+            headers["X-Cursor-Before"] = encode_cursor(oldest["created_at"], oldest["id"])
+        headers["X-Cursor-After"] = encode_cursor(newest["created_at"], newest["id"])
+    elif after:
+        headers["X-Cursor-After"] = after
+    
+    return model_list_response(
+        MessageResponse,
+        messages,
+        defaults={"attachments": [], "blocked": False},
+        headers=headers
+    )
 
 @router.post("/attachment")
 async def upload_attachment(
@@ -277,9 +494,83 @@ async def upload_attachment(
         "message": "Arquivo enviado"
     }
 
+@router.post("/{chat_id}/read")
+async def mark_chat_read(
+    chat_id: str,
+    request: Optional[MarkReadRequest] = None,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Marca como lidas as mensagens recebidas no chat
+    
+    Sem `until`, todas; com `until` (cursor de `X-Cursor-After`), as mensagens
+    até essa posição. Atualiza `read_at` e o contador de não lidas numa única
+    operação em lote.
+    """
+    
+    chat = await db.chats.find_one({"id": chat_id}, CHAT_PROJECTION)
+    if not chat:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat não encontrado"
+        )
+    
+    if user["sub"] not in [chat["client_id"], chat["videomaker_id"]]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Você não é participante deste chat"
+        )
+    
+    result = await chat_summary.mark_read(chat, user["sub"], request.until if request else None)
+    
+    # Confirmação de leitura para quem está com o chat aberto
+    if result["marked"]:
+        await manager.broadcast({
+            "type": "read",
+            "chat_id": chat_id,
+            "user_id": user["sub"],
+            "read_at": result["read_at"]
+        }, chat_id)
+    
+    return {"success": True, **result}
+
+@router.get("/presence")
+async def get_presence(
+    user_ids: str = Query(..., description="IDs separados por vírgula"),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Presença (online e último acesso) dos usuários com quem o usuário tem chat
+    
+    Tudo vem da memória, sem consulta ao banco: só são respondidos os
+    participantes dos chats abertos nas conexões WebSocket do usuário ou da
+    sua última listagem de chats (`/chat/my-chats`); demais IDs são omitidos.
+    Quem está com o WebSocket aberto recebe as mudanças como eventos
+    `presence`, sem precisar consultar esta rota.
+    """
+    
+    ids = list(dict.fromkeys(user_id.strip() for user_id in user_ids.split(",") if user_id.strip()))
+    if len(ids) > PRESENCE_MAX_QUERY:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo de {PRESENCE_MAX_QUERY} usuários por consulta"
+        )
+    
+    allowed = manager.peers(user["sub"]) | chat_summary.known_peers(user["sub"])
+    
+    return {"users": [
+        {key: value for key, value in presence_service.status(user_id).items() if key != "type"}
+        for user_id in ids if user_id in allowed
+    ]}
+
 @router.get("/my-chats")
 async def get_my_chats(user: dict = Depends(get_current_user)):
-    """Lista todos os chats do usuário"""
+    """
+    Lista todos os chats do usuário, mais recentes primeiro
+    
+    Uma única consulta: última mensagem, título do job e não lidas vêm do
+    resumo mantido no próprio chat.
+    """
     
     # Busca chats onde usuário é participante
     query = {
@@ -289,28 +580,29 @@ async def get_my_chats(user: dict = Depends(get_current_user)):
         ]
     }
     
-    chats = await db.chats.find(query, {"_id": 0}).to_list(1000)
+    chats = await db.chats.find(query, SUMMARY_PROJECTION).sort(
+        [("last_message_at", -1), ("created_at", -1)]
+    ).to_list(1000)
+    
+    # Participantes lembrados para a consulta de presença
+    chat_summary.remember_peers(user["sub"], chats)
     
-    # Para cada chat, busca última mensagem
     result = []
     for chat in chats:
-        last_message = await db.messages.find_one(
-            {"chat_id": chat["id"]},
-            {"_id": 0},
-            sort=[("created_at", -1)]
-        )
-        
-        # Busca informações do job
-        job = await db.jobs.find_one({"id": chat["job_id"]}, {"_id": 0, "titulo": 1})
+        # Chats anteriores aos resumos: calculados uma única vez
+        if "unread" not in chat:
+            chat = await chat_summary.backfill(chat)
         
         result.append({
             "chat_id": chat["id"],
             "job_id": chat["job_id"],
-            "job_titulo": job.get("titulo") if job else "Job não encontrado",
+            "job_titulo": chat.get("job_titulo") or "Job não encontrado",
             "client_id": chat["client_id"],
             "videomaker_id": chat["videomaker_id"],
-            "last_message": last_message.get("content") if last_message else None,
-            "last_message_at": last_message.get("created_at") if last_message else None,
+            "last_message": chat.get("last_message"),
+            "last_message_at": chat.get("last_message_at"),
+            "last_sender_id": chat.get("last_sender_id"),
+            "unread_count": chat["unread"].get(user["sub"], 0),
             "created_at": chat["created_at"]
         })
     
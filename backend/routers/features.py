@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
 from middleware.auth_middleware import get_current_user, require_role
 from models.features import (
     Favorite, FavoriteResponse, Badge, UserBadge,
@@ -9,6 +9,8 @@ from models.features import (
     PortfolioItem, PortfolioItemCreate, PortfolioItemUpdate
 )
 from services.security_service import AuditService
+from services.entity_cache import user_cache, job_cache
+from utils.http_cache import cached_json
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
 import uuid
@@ -41,8 +43,8 @@ async def add_favorite(
     client_id = user["sub"]
     
     # Verifica se videomaker existe
-    videomaker = await db.users.find_one({"id": videomaker_id, "role": "videomaker"})
-    if not videomaker:
+    videomaker = await user_cache.get(videomaker_id)
+    if not videomaker or videomaker.get("role") != "videomaker":
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Videomaker não encontrado"
@@ -110,8 +112,8 @@ async def get_my_favorites(user: dict = Depends(get_current_user)):
     # Enriquece com dados do videomaker
     response = []
     for fav in favorites:
-        videomaker = await db.users.find_one(
-            {"id": fav["videomaker_id"]},
+        videomaker = await user_cache.get(
+            fav["videomaker_id"],
             {"_id": 0, "nome": 1, "email": 1, "rating_medio": 1, "total_avaliacoes": 1, "cidade": 1, "estado": 1}
         )
         
@@ -134,15 +136,15 @@ async def get_my_favorites(user: dict = Depends(get_current_user)):
 # ==================== BADGES ====================
 
 @router.get("/badges")
-async def list_badges():
+async def list_badges(request: Request):
     """Lista todos os badges disponíveis"""
     
     badges = await db.badges.find({"active": True}, {"_id": 0}).to_list(100)
-    return badges
+    return cached_json(request, badges, "badges")
 
 
 @router.get("/badges/user/{user_id}")
-async def get_user_badges(user_id: str):
+async def get_user_badges(user_id: str, request: Request):
     """Lista badges de um usuário"""
     
     user_badges = await db.user_badges.find(
@@ -160,7 +162,7 @@ async def get_user_badges(user_id: str):
                 "badge": badge
             })
     
-    return response
+    return cached_json(request, response, "user_badges")
 
 
 @router.post("/badges/award", dependencies=[Depends(admin_only)])
@@ -320,7 +322,7 @@ async def create_dispute(
     """Abre uma disputa"""
     
     # Verifica se job existe e se usuário faz parte
-    job = await db.jobs.find_one({"id": dispute_data.job_id}, {"_id": 0})
+    job = await job_cache.get(dispute_data.job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -353,6 +355,7 @@ async def create_dispute(
         {"id": dispute_data.job_id},
         {"$set": {"status": "disputed"}}
     )
+    job_cache.invalidate(dispute_data.job_id)
     
     return {
         "success": True,
@@ -425,6 +428,7 @@ async def resolve_dispute(
         {"id": dispute["job_id"]},
         {"$set": {"status": "completed" if resolution_data.action == "release" else "cancelled"}}
     )
+    job_cache.invalidate(dispute["job_id"])
     
     # Audit log
     await AuditService.log(
@@ -453,7 +457,7 @@ async def upload_job_document(
     """Faz upload de documento para o job"""
     
     # Verifica se job existe e se usuário faz parte
-    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job = await job_cache.get(job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -497,7 +501,7 @@ async def get_job_documents(
     """Lista documentos do job"""
     
     # Verifica permissão
-    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job = await job_cache.get(job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -586,6 +590,7 @@ async def add_portfolio_item(
 @router.get("/portfolio/{user_id}")
 async def get_user_portfolio(
     user_id: str,
+    request: Request,
     category: Optional[str] = None,
     featured_only: bool = False
 ):
@@ -600,7 +605,7 @@ async def get_user_portfolio(
     
     items = await db.portfolio_items.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     
-    return items
+    return cached_json(request, items, "portfolio")
 
 
 @router.put("/portfolio/{item_id}")
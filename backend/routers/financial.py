@@ -4,6 +4,7 @@ from models.coupon import (
     CouponCreate, Coupon, CouponResponse, 
     CouponValidation, CouponValidationResponse, CouponUsage
 )
+from services.entity_cache import user_cache, job_cache
 from datetime import datetime, timezone
 from typing import List, Optional
 
@@ -251,7 +252,7 @@ async def get_my_transactions(
     # Enriquece com dados do job
     transactions = []
     for payment in payments:
-        job = await db.jobs.find_one({"id": payment["job_id"]}, {"_id": 0, "titulo": 1, "categoria": 1})
+        job = await job_cache.get(payment["job_id"], {"_id": 0, "titulo": 1, "categoria": 1})
         
         transaction = {
             "id": payment["id"],
@@ -398,7 +399,7 @@ async def get_financial_report(
     # Enriquece com dados dos videomakers
     top_vm_details = []
     for vm_id, earnings in top_videomakers:
-        vm = await db.users.find_one({"id": vm_id}, {"_id": 0, "nome": 1, "email": 1})
+        vm = await user_cache.get(vm_id, {"_id": 0, "nome": 1, "email": 1})
         if vm:
             top_vm_details.append({
                 "id": vm_id,
@@ -2,6 +2,10 @@ from fastapi import APIRouter, HTTPException, status, Depends, Query
 from middleware.auth_middleware import get_current_user
 from models.job import JobCreate, Job, JobResponse
 from services.value_calculator import ValueCalculator
+from services.config_service import config_service
+from services.entity_cache import job_cache
+from utils.serialization import model_list_response
+from utils.field_selection import parse_fields, build_projection
 from typing import Optional, List
 from datetime import datetime, timezone
 
@@ -20,9 +24,9 @@ async def create_job(job_data: JobCreate, user: dict = Depends(get_current_user)
             detail="Apenas clientes podem criar jobs"
         )
     
-    # Busca configurações da plataforma
-    config = await db.platform_config.find_one({"id": "platform_config"})
-    valor_hora_base = config.get("valor_hora_base", 120.0) if config else 120.0
+    # Configurações da plataforma (cache em memória)
+    config = await config_service.get()
+    valor_hora_base = config.get("valor_hora_base", 120.0)
     
     # Calcula valor mínimo
     valor_minimo = ValueCalculator.calculate_minimum_value(
@@ -75,10 +79,13 @@ async def list_jobs(
     status_filter: Optional[str] = Query(None, alias="status"),
     cidade: Optional[str] = Query(None),
     categoria: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
     user: dict = Depends(get_current_user)
 ):
     """Lista jobs com filtros"""
     
+    selected = parse_fields("jobs", fields, user.get("role"))
+    
     query = {}
     
     # Clientes veem apenas seus jobs
@@ -101,37 +108,16 @@ async def list_jobs(
     if categoria:
         query["categoria"] = categoria
     
-    jobs = await db.jobs.find(query, {"_id": 0}).to_list(1000)
+    jobs = await db.jobs.find(query, build_projection(selected)).to_list(1000)
     
-    # Converte para JobResponse
-    response = []
-    for job_dict in jobs:
-        from models.job import JobLocation
-        
-        response.append(JobResponse(
-            id=job_dict["id"],
-            client_id=job_dict["client_id"],
-            titulo=job_dict["titulo"],
-            descricao=job_dict["descricao"],
-            categoria=job_dict["categoria"],
-            data_gravacao=datetime.fromisoformat(job_dict["data_gravacao"]) if isinstance(job_dict["data_gravacao"], str) else job_dict["data_gravacao"],
-            duracao_horas=job_dict["duracao_horas"],
-            local=JobLocation(**job_dict["local"]),
-            extras=job_dict.get("extras", []),
-            valor_minimo=job_dict["valor_minimo"],
-            status=job_dict["status"],
-            videomaker_id=job_dict.get("videomaker_id"),
-            created_at=datetime.fromisoformat(job_dict["created_at"]) if isinstance(job_dict["created_at"], str) else job_dict["created_at"],
-            updated_at=datetime.fromisoformat(job_dict["updated_at"]) if isinstance(job_dict["updated_at"], str) else job_dict["updated_at"]
-        ))
-    
-    return response
+    # Serializa direto dos documentos (sem revalidar via response_model)
+    return model_list_response(JobResponse, jobs, defaults={"extras": []}, fields=selected)
 
 @router.get("/{job_id}", response_model=JobResponse)
 async def get_job(job_id: str, user: dict = Depends(get_current_user)):
     """Obtém detalhes de um job"""
     
-    job_dict = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job_dict = await job_cache.get(job_id)
     if not job_dict:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -173,7 +159,7 @@ async def update_job(
     """Atualiza um job (apenas cliente dono pode atualizar)"""
     
     # Busca job
-    job_dict = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job_dict = await job_cache.get(job_id)
     if not job_dict:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -203,8 +189,8 @@ async def update_job(
     
     # Recalcula valor mínimo se necessário
     if "duracao_horas" in update_dict or "extras" in update_dict:
-        config = await db.platform_config.find_one({"id": "platform_config"})
-        valor_hora_base = config.get("valor_hora_base", 120.0) if config else 120.0
+        config = await config_service.get()
+        valor_hora_base = config.get("valor_hora_base", 120.0)
         
         duracao = update_dict.get("duracao_horas", job_dict["duracao_horas"])
         extras = update_dict.get("extras", job_dict["extras"])
@@ -215,13 +201,21 @@ async def update_job(
     
     update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    await db.jobs.update_one(
-        {"id": job_id},
+    # O cache pode estar defasado: a condição vale no próprio update
+    result = await db.jobs.update_one(
+        {"id": job_id, "client_id": user["sub"], "status": "open"},
         {"$set": update_dict}
     )
+    job_cache.invalidate(job_id)
+    
+    if result.matched_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job não está mais aberto para atualização"
+        )
     
     # Retorna job atualizado
-    job_dict = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job_dict = await job_cache.get(job_id)
     from models.job import JobLocation
     
     return JobResponse(
@@ -245,7 +239,7 @@ async def update_job(
 async def cancel_job(job_id: str, user: dict = Depends(get_current_user)):
     """Cancela um job"""
     
-    job_dict = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job_dict = await job_cache.get(job_id)
     if not job_dict:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -259,14 +253,21 @@ async def cancel_job(job_id: str, user: dict = Depends(get_current_user)):
             detail="Sem permissão para cancelar este job"
         )
     
-    # Atualiza status
-    await db.jobs.update_one(
-        {"id": job_id},
+    # Atualiza status (condição no próprio update: o cache pode estar defasado)
+    result = await db.jobs.update_one(
+        {"id": job_id, "client_id": user["sub"], "status": {"$nin": ["completed", "cancelled"]}},
         {"$set": {
             "status": "cancelled",
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    job_cache.invalidate(job_id)
+    
+    if result.matched_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job já foi concluído ou cancelado"
+        )
     
     return {
         "success": True,
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from middleware.auth_middleware import get_current_user, require_role
 from models.notification import DeviceTokenCreate, NotificationCreate, BroadcastNotification
 from services.notification_service import NotificationService
+from services.entity_cache import user_cache
 from datetime import datetime, timezone
 import uuid
 
@@ -54,6 +55,7 @@ async def register_device_token(
         {"id": user_id},
         {"$set": {"device_token": token_data.device_token}}
     )
+    user_cache.invalidate(user_id)
     
     return {
         "success": True,
@@ -78,6 +80,7 @@ async def unregister_device_token(user: dict = Depends(get_current_user)):
         {"id": user_id},
         {"$unset": {"device_token": ""}}
     )
+    user_cache.invalidate(user_id)
     
     return {
         "success": True,
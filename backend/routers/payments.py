@@ -3,8 +3,10 @@ from middleware.auth_middleware import get_current_user
 from models.payment import PaymentCreate, Payment, PaymentResponse, TransactionLog
 from services.payment_service import PaymentService
 from services.value_calculator import ValueCalculator
+from services.config_service import config_service
 from datetime import datetime, timezone
 from services.notification_service import notify_payment_released, notify_job_completed
+from services.entity_cache import user_cache, job_cache
 
 router = APIRouter(prefix="/payments", tags=["Pagamentos"])
 
@@ -26,8 +28,11 @@ async def create_payment_hold(
             detail="Apenas clientes podem realizar pagamentos"
         )
     
-    # Busca job
-    job = await db.jobs.find_one({"id": payment_data.job_id}, {"_id": 0})
+    # Busca job direto do banco: dono e videomaker são pré-condições
+    job = await db.jobs.find_one(
+        {"id": payment_data.job_id},
+        {"_id": 0, "client_id": 1, "videomaker_id": 1}
+    )
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -56,15 +61,15 @@ async def create_payment_hold(
             detail="Pagamento já realizado para este job"
         )
     
-    # Busca configuração de comissão
-    config = await db.platform_config.find_one({"id": "platform_config"})
-    taxa_comissao = config.get("taxa_comissao", 0.20) if config else 0.20
+    # Configuração de comissão (cache em memória)
+    config = await config_service.get()
+    taxa_comissao = config.get("taxa_comissao", 0.20)
     
     # Calcula valores
     valores = ValueCalculator.calculate_commission(payment_data.valor_total, taxa_comissao)
     
     # Busca cliente para email
-    client = await db.users.find_one({"id": user["sub"]}, {"_id": 0})
+    client = await user_cache.get(user["sub"])
     
     # Cria PaymentIntent no Stripe
     stripe_result = await payment_service.create_payment_intent(
@@ -187,6 +192,7 @@ async def release_payment(
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    job_cache.invalidate(payment_dict["job_id"])
     
     # Log de transação
     transaction_log = TransactionLog(
@@ -273,6 +279,7 @@ async def refund_payment(
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    job_cache.invalidate(payment_dict["job_id"])
     
     # Log de transação
     transaction_log = TransactionLog(
@@ -4,6 +4,8 @@ from models.proposal import ProposalCreate, Proposal, ProposalResponse
 from typing import List
 from datetime import datetime, timezone
 from services.notification_service import notify_new_proposal, notify_proposal_accepted, notify_proposal_rejected
+from services.entity_cache import job_cache
+from utils.serialization import model_list_response
 
 router = APIRouter(prefix="/proposals", tags=["Propostas"])
 
@@ -24,7 +26,7 @@ async def create_proposal(
         )
     
     # Verifica se job existe e está aberto
-    job = await db.jobs.find_one({"id": proposal_data.job_id}, {"_id": 0})
+    job = await job_cache.get(proposal_data.job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -96,7 +98,7 @@ async def get_job_proposals(
     """Lista propostas de um job"""
     
     # Verifica se job existe
-    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job = await job_cache.get(job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -116,21 +118,7 @@ async def get_job_proposals(
         {"_id": 0}
     ).to_list(1000)
     
-    # Converte para ProposalResponse
-    response = []
-    for prop_dict in proposals:
-        response.append(ProposalResponse(
-            id=prop_dict["id"],
-            job_id=prop_dict["job_id"],
-            videomaker_id=prop_dict["videomaker_id"],
-            valor_proposto=prop_dict["valor_proposto"],
-            mensagem=prop_dict.get("mensagem"),
-            data_entrega_estimada=datetime.fromisoformat(prop_dict["data_entrega_estimada"]) if isinstance(prop_dict["data_entrega_estimada"], str) else prop_dict["data_entrega_estimada"],
-            status=prop_dict["status"],
-            created_at=datetime.fromisoformat(prop_dict["created_at"]) if isinstance(prop_dict["created_at"], str) else prop_dict["created_at"]
-        ))
-    
-    return response
+    return model_list_response(ProposalResponse, proposals)
 
 @router.put("/{proposal_id}/accept")
 async def accept_proposal(
@@ -155,7 +143,7 @@ async def accept_proposal(
         )
     
     # Busca job
-    job = await db.jobs.find_one({"id": proposal["job_id"]}, {"_id": 0})
+    job = await job_cache.get(proposal["job_id"])
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -176,6 +164,25 @@ async def accept_proposal(
             detail="Job não está mais aberto"
         )
     
+    # Atualiza job primeiro: a condição (aberto e do cliente) vale no próprio
+    # update, porque o cache pode estar defasado. Só um aceite vence.
+    result = await db.jobs.update_one(
+        {"id": proposal["job_id"], "status": "open", "client_id": user["sub"]},
+        {"$set": {
+            "status": "in_progress",
+            "videomaker_id": proposal["videomaker_id"],
+            "proposta_aceita_id": proposal_id,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    job_cache.invalidate(proposal["job_id"])
+    
+    if result.matched_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job não está mais aberto"
+        )
+    
     # Aceita proposta
     await db.proposals.update_one(
         {"id": proposal_id},
@@ -198,23 +205,14 @@ async def accept_proposal(
         }}
     )
     
-    # Atualiza job
-    await db.jobs.update_one(
-        {"id": proposal["job_id"]},
-        {"$set": {
-            "status": "in_progress",
-            "videomaker_id": proposal["videomaker_id"],
-            "proposta_aceita_id": proposal_id,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
-    
     # Cria chat entre cliente e videomaker
     from models.chat import Chat
     chat = Chat(
         job_id=proposal["job_id"],
         client_id=user["sub"],
-        videomaker_id=proposal["videomaker_id"]
+        videomaker_id=proposal["videomaker_id"],
+        job_titulo=job.get("titulo"),
+        unread={user["sub"]: 0, proposal["videomaker_id"]: 0}
     )
     
     chat_dict = chat.model_dump()
@@ -261,7 +259,7 @@ async def reject_proposal(
         )
     
     # Busca job
-    job = await db.jobs.find_one({"id": proposal["job_id"]}, {"_id": 0})
+    job = await job_cache.get(proposal["job_id"])
     if not job or job["client_id"] != user["sub"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from middleware.auth_middleware import get_current_user
 from models.rating import RatingCreate, Rating, RatingResponse
+from services.entity_cache import user_cache
+from utils.serialization import model_list_response
+from utils.http_cache import make_etag, not_modified, cached_json
 from typing import List
 from datetime import datetime, timezone
 
@@ -15,8 +18,11 @@ async def create_rating(
 ):
     """Cria avaliação após job concluído"""
     
-    # Busca job
-    job = await db.jobs.find_one({"id": rating_data.job_id}, {"_id": 0})
+    # Busca job direto do banco: status e participantes são pré-condições
+    job = await db.jobs.find_one(
+        {"id": rating_data.job_id},
+        {"_id": 0, "status": 1, "client_id": 1, "videomaker_id": 1}
+    )
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -96,6 +102,7 @@ async def create_rating(
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        user_cache.invalidate(rating_data.to_user_id)
     
     return RatingResponse(
         id=rating.id,
@@ -108,27 +115,22 @@ async def create_rating(
     )
 
 @router.get("/user/{user_id}", response_model=List[RatingResponse])
-async def get_user_ratings(user_id: str):
+async def get_user_ratings(user_id: str, request: Request):
     """Obtém todas as avaliações de um usuário"""
     
+    # Toda nova avaliação atualiza o agregado do usuário, que serve de versão
+    stamp = await user_cache.get(user_id, {"_id": 0, "rating_medio": 1, "total_avaliacoes": 1, "updated_at": 1})
+    etag = make_etag("ratings", user_id, stamp) if stamp else None
+    cached = not_modified(request, etag, "ratings")
+    if cached:
+        return cached
+    
     ratings = await db.ratings.find(
         {"to_user_id": user_id},
         {"_id": 0}
     ).to_list(1000)
     
-    response = []
-    for rating_dict in ratings:
-        response.append(RatingResponse(
-            id=rating_dict["id"],
-            job_id=rating_dict["job_id"],
-            from_user_id=rating_dict["from_user_id"],
-            to_user_id=rating_dict["to_user_id"],
-            rating=rating_dict["rating"],
-            comentario=rating_dict.get("comentario"),
-            created_at=datetime.fromisoformat(rating_dict["created_at"]) if isinstance(rating_dict["created_at"], str) else rating_dict["created_at"]
-        ))
-    
-    return response
+    return cached_json(request, model_list_response(RatingResponse, ratings), "ratings", etag=etag)
 
 @router.get("/job/{job_id}", response_model=List[RatingResponse])
 async def get_job_ratings(
@@ -142,16 +144,4 @@ async def get_job_ratings(
         {"_id": 0}
     ).to_list(100)
     
-    response = []
-    for rating_dict in ratings:
-        response.append(RatingResponse(
-            id=rating_dict["id"],
-            job_id=rating_dict["job_id"],
-            from_user_id=rating_dict["from_user_id"],
-            to_user_id=rating_dict["to_user_id"],
-            rating=rating_dict["rating"],
-            comentario=rating_dict.get("comentario"),
-            created_at=datetime.fromisoformat(rating_dict["created_at"]) if isinstance(rating_dict["created_at"], str) else rating_dict["created_at"]
-        ))
-    
-    return response
+    return model_list_response(RatingResponse, ratings)
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from models.search import (
     VideomakerSearchFilters, VideomakerSearchResult,
-    VideomakerSearchResponse, SearchAggregations
+    VideomakerSearchResponse, SearchAggregations, SortOrder
 )
 from services.search_service import SearchService, GeoService
-from middleware.auth_middleware import get_current_user
+from middleware.auth_middleware import get_current_user, get_optional_user
+from utils.field_selection import parse_fields, build_projection
+from utils.http_cache import cached_json
 from typing import Optional
 import math
 
@@ -12,9 +14,18 @@ router = APIRouter(prefix="/search", tags=["Search"])
 
 from server import db
 
+# Campos lidos mesmo quando não selecionados: usados em distância, ordenação e agregações
+SEARCH_INTERNAL_FIELDS = (
+    "id", "latitude", "longitude", "rating_medio", "total_avaliacoes",
+    "preco_hora", "preco_minimo", "especialidades", "cidade", "estado", "created_at"
+)
 
 @router.post("/videomakers", response_model=VideomakerSearchResponse)
-async def search_videomakers(filters: VideomakerSearchFilters):
+async def search_videomakers(
+    filters: VideomakerSearchFilters,
+    fields: Optional[str] = Query(None, description="Campos de cada resultado, separados por vírgula"),
+    viewer: Optional[dict] = Depends(get_optional_user)
+):
     """
     Busca avançada de videomakers com filtros combinados
     
@@ -31,13 +42,24 @@ async def search_videomakers(filters: VideomakerSearchFilters):
     - available_on: Data de disponibilidade
     - sort_by: Ordenação (nearest, highest_rated, lowest_price, most_experienced, newest)
     - page/limit: Paginação
+    
+    Com `fields`, apenas os campos pedidos de cada resultado são lidos e
+    retornados (email e telefone só para admin).
     """
     
+    selected = parse_fields("videomakers", fields, viewer.get("role") if viewer else None)
+    wants = (lambda name: True) if selected is None else (lambda name: name in selected)
+    
     # 1. Constrói query base
     query = await SearchService.build_search_query(db, filters)
     
     # 2. Busca videomakers
-    videomakers = await db.users.find(query, {"_id": 0, "password_hash": 0}).to_list(10000)
+    projection = build_projection(
+        selected,
+        extra=SEARCH_INTERNAL_FIELDS,
+        default={"_id": 0, "password_hash": 0}
+    )
+    videomakers = await db.users.find(query, projection).to_list(10000)
     
     # 3. Filtra por badges (se especificado)
     if filters.badges and videomakers:
@@ -69,7 +91,7 @@ async def search_videomakers(filters: VideomakerSearchFilters):
             videomakers = SearchService.filter_by_radius(videomakers, filters.radius_km)
     
     # 6. Enriquece com badges
-    for vm in videomakers:
+    for vm in (videomakers if wants("badges") else []):
         user_badges = await db.user_badges.find(
             {"user_id": vm["id"]},
             {"_id": 0}
@@ -84,7 +106,8 @@ async def search_videomakers(filters: VideomakerSearchFilters):
         vm["badges"] = badges_data
     
     # 7. Enriquece com estatísticas
-    for vm in videomakers:
+    needs_total_jobs = wants("total_jobs_completed") or filters.sort_by == SortOrder.MOST_EXPERIENCED
+    for vm in (videomakers if needs_total_jobs else []):
         # Total jobs concluídos
         total_jobs = await db.jobs.count_documents({
             "videomaker_id": vm["id"],
@@ -105,13 +128,14 @@ async def search_videomakers(filters: VideomakerSearchFilters):
     
     paginated_videomakers = videomakers[skip:skip + filters.limit]
     
-    # 11. Monta response
+    # 11. Monta response (com seleção de campos, os não lidos ficam de fora sem validar)
+    make_result = VideomakerSearchResult if selected is None else VideomakerSearchResult.model_construct
     results = []
     for vm in paginated_videomakers:
-        results.append(VideomakerSearchResult(
+        results.append(make_result(
             id=vm["id"],
-            nome=vm["nome"],
-            email=vm["email"],
+            nome=vm.get("nome"),
+            email=vm.get("email"),
             telefone=vm.get("telefone"),
             bio=vm.get("bio"),
             cidade=vm.get("cidade"),
@@ -133,17 +157,26 @@ async def search_videomakers(filters: VideomakerSearchFilters):
     
     aggregations = SearchAggregations(**aggregations_data)
     
-    return VideomakerSearchResponse(
+    response = VideomakerSearchResponse(
         results=results,
         aggregations=aggregations,
         page=filters.page,
         limit=filters.limit,
         total_pages=total_pages
     )
+    
+    if selected is None:
+        return response
+    
+    unselected = set(VideomakerSearchResult.model_fields) - set(selected)
+    return Response(
+        content=response.model_dump_json(exclude={"results": {"__all__": unselected}}),
+        media_type="application/json"
+    )
 
 
 @router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """Lista todas as categorias/especialidades disponíveis com contadores"""
     
     pipeline = [
@@ -158,14 +191,14 @@ async def get_categories():
     
     categories = await db.users.aggregate(pipeline).to_list(100)
     
-    return [
+    return cached_json(request, [
         {"name": cat["_id"], "count": cat["count"]}
         for cat in categories
-    ]
+    ], "facets")
 
 
 @router.get("/locations")
-async def get_locations():
+async def get_locations(request: Request):
     """Lista todas as localizações disponíveis com contadores"""
     
     pipeline = [
@@ -182,18 +215,18 @@ async def get_locations():
     
     locations = await db.users.aggregate(pipeline).to_list(1000)
     
-    return [
+    return cached_json(request, [
         {
             "cidade": loc["_id"].get("cidade"),
             "estado": loc["_id"]["estado"],
             "count": loc["count"]
         }
         for loc in locations
-    ]
+    ], "facets")
 
 
 @router.get("/price-range")
-async def get_price_range():
+async def get_price_range(request: Request):
     """Retorna faixa de preços dos videomakers"""
     
     pipeline = [
@@ -212,16 +245,16 @@ async def get_price_range():
     result = await db.users.aggregate(pipeline).to_list(1)
     
     if result:
-        return result[0]
+        return cached_json(request, result[0], "facets")
     
-    return {
+    return cached_json(request, {
         "min_preco_hora": None,
         "max_preco_hora": None,
         "avg_preco_hora": None,
         "min_preco_minimo": None,
         "max_preco_minimo": None,
         "avg_preco_minimo": None
-    }
+    }, "facets")
 
 
 @router.get("/suggestions")
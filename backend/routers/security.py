@@ -5,6 +5,7 @@ from models.security import (
     AccountDeletion, IdentityVerification
 )
 from services.security_service import AuditService, LGPDService
+from services.entity_cache import user_cache
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
 import pyotp
@@ -193,6 +194,7 @@ async def enable_2fa(
         {"id": user_id},
         {"$set": {"two_factor_enabled": True}}
     )
+    user_cache.invalidate(user_id)
     
     # Log
     await AuditService.log(
@@ -260,6 +262,7 @@ async def disable_2fa(user: dict = Depends(get_current_user)):
         {"id": user_id},
         {"$set": {"two_factor_enabled": False}}
     )
+    user_cache.invalidate(user_id)
     
     # Log
     await AuditService.log(
@@ -469,6 +472,7 @@ async def review_identity_verification(
             {"id": verification["user_id"]},
             {"$set": {"verificado": True}}
         )
+        user_cache.invalidate(verification["user_id"])
     
     # Log
     await AuditService.log(
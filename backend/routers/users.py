@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query
-from middleware.auth_middleware import get_current_user
-from models.user import UserResponse
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query, Request
+from middleware.auth_middleware import get_current_user, get_optional_user
+from models.user import UserResponse, USER_RESPONSE_DEFAULTS
 from services.storage_service import StorageService
 from services.geolocation_service import find_nearby_users
+from services.entity_cache import user_cache
 from utils.constants import MAX_VIDEO_SIZE_BYTES
+from utils.field_selection import parse_fields, build_projection
+from utils.serialization import model_response
+from utils.http_cache import make_etag, not_modified, with_cache_headers
 from typing import Optional, List
 from datetime import datetime, timezone
 
@@ -17,7 +21,7 @@ storage_service = StorageService(db)
 async def get_current_user_profile(user: dict = Depends(get_current_user)):
     """Obtém perfil do usuário autenticado"""
     
-    user_dict = await db.users.find_one({"id": user["sub"]}, {"_id": 0})
+    user_dict = await user_cache.get(user["sub"])
     if not user_dict:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -64,6 +68,7 @@ async def update_profile(update_data: dict, user: dict = Depends(get_current_use
         {"id": user["sub"]},
         {"$set": update_dict}
     )
+    user_cache.invalidate(user["sub"])
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -72,7 +77,7 @@ async def update_profile(update_data: dict, user: dict = Depends(get_current_use
         )
     
     # Retorna perfil atualizado
-    user_dict = await db.users.find_one({"id": user["sub"]}, {"_id": 0})
+    user_dict = await user_cache.get(user["sub"])
     
     return UserResponse(
         id=user_dict["id"],
@@ -133,6 +138,7 @@ async def upload_portfolio_video(
         {"id": user["sub"]},
         {"$push": {"portfolio_videos": file_id}}
     )
+    user_cache.invalidate(user["sub"])
     
     return {
         "success": True,
@@ -152,6 +158,7 @@ async def delete_portfolio_video(
         {"id": user["sub"]},
         {"$pull": {"portfolio_videos": file_id}}
     )
+    user_cache.invalidate(user["sub"])
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -223,28 +230,32 @@ async def search_videomakers(
     return response
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user_by_id(user_id: str):
+async def get_user_by_id(
+    user_id: str,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
+    viewer: Optional[dict] = Depends(get_optional_user)
+):
     """Obtém perfil público de um usuário"""
     
-    user_dict = await db.users.find_one({"id": user_id}, {"_id": 0})
+    selected = parse_fields("users", fields, viewer.get("role") if viewer else None)
+    
+    user_dict = await user_cache.get(user_id, build_projection(selected) if selected else None)
     if not user_dict:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuário não encontrado"
         )
     
-    return UserResponse(
-        id=user_dict["id"],
-        email=user_dict["email"],
-        nome=user_dict["nome"],
-        telefone=user_dict["telefone"],
-        role=user_dict["role"],
-        cidade=user_dict.get("cidade"),
-        estado=user_dict.get("estado"),
-        verificado=user_dict.get("verificado", False),
-        rating_medio=user_dict.get("rating_medio", 0.0),
-        total_avaliacoes=user_dict.get("total_avaliacoes", 0),
-        portfolio_videos=user_dict.get("portfolio_videos", []),
-        raio_atuacao_km=user_dict.get("raio_atuacao_km", 50.0),
-        created_at=datetime.fromisoformat(user_dict["created_at"]) if isinstance(user_dict["created_at"], str) else user_dict["created_at"]
+    # Os campos da resposta (do documento em cache) são o carimbo de versão do
+    # perfil; campos internos, como o hash da senha, ficam de fora
+    etag = make_etag(
+        {field: user_dict[field] for field in (selected or UserResponse.model_fields) if field in user_dict},
+        selected
     )
+    cached = not_modified(request, etag, "profile")
+    if cached:
+        return cached
+    
+    response = model_response(UserResponse, user_dict, defaults=USER_RESPONSE_DEFAULTS, fields=selected)
+    return with_cache_headers(response, etag, "profile")
@@ -1,11 +1,8 @@
-from fastapi import FastAPI, APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, Request, HTTPException
+from fastapi.responses import JSONResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 import os
 import logging
 from pathlib import Path
@@ -13,12 +10,11 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
+# MongoDB connection (latência dos comandos alimenta o controle de admissão)
+from middleware.admission_control import db_latency_tracker
 
-# MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[db_latency_tracker])
 db = client[os.environ.get('DB_NAME', 'videomakers_platform')]
 
 # Create the main app without a prefix
@@ -28,13 +24,10 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    default_response_class=ORJSONResponse  # Mesmo JSON compacto, serializado pelo orjson
 )
 
-# Add rate limiter to app
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -86,6 +79,28 @@ api_router.include_router(search.router)
 # Include the router in the main app
 app.include_router(api_router)
 
+# Idempotency-Key em POSTs (mais interno: guarda a resposta antes da compressão)
+from middleware.idempotency import idempotency_store, IdempotencyMiddleware
+
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+
+# Compressão de respostas (gzip; brotli/zstd se instalados)
+from middleware.compression import response_compressor, CompressionMiddleware, COMPRESSION_ENABLED
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, compressor=response_compressor)
+
+# Monitor de event loop (registra a rota atendida por cada task)
+from middleware.loop_monitor import loop_monitor, LoopMonitorMiddleware, LOOP_MONITOR_ENABLED
+
+app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
+# Controle de admissão (503 rápido por classe de rota sob pressão do banco)
+from middleware.admission_control import admission_controller, AdmissionControlMiddleware, ADMISSION_CONTROL_ENABLED
+
+if ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware, controller=admission_controller)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -93,6 +108,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cursor-Before", "X-Cursor-After"],
 )
 
 # Rate Limiter Middleware
@@ -106,10 +122,11 @@ async def rate_limit_middleware(request: Request, call_next):
     
     try:
         await rate_limiter.check_rate_limit(request)
-    except Exception as e:
+    except HTTPException as e:
         return JSONResponse(
-            status_code=429,
-            content={"detail": str(e)}
+            status_code=e.status_code,
+            content={"detail": e.detail},
+            headers=e.headers
         )
     
     response = await call_next(request)
@@ -127,20 +144,82 @@ async def startup_event():
     logger.info("🚀 Plataforma de Videomakers API iniciada")
     logger.info(f"📦 Banco de dados: {os.environ.get('DB_NAME', 'videomakers_platform')}")
     
-    # Inicializa configuração padrão se não existir
-    config_exists = await db.platform_config.find_one({"id": "platform_config"})
-    if not config_exists:
-        from models.config import PlatformConfig
-        from datetime import datetime, timezone
-        
-        default_config = PlatformConfig()
-        config_dict = default_config.model_dump()
-        config_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
-        
-        await db.platform_config.insert_one(config_dict)
-        logger.info("✅ Configuração padrão criada")
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    
+    # Lista de tokens revogados (carga inicial + atualização incremental)
+    from services.revocation_service import revocation_list
+    await revocation_list.start(db)
+    
+    # Backend dos contadores de rate limit (memória ou compartilhado via MongoDB)
+    await rate_limiter.configure(db)
+    
+    # Respostas de requisições com Idempotency-Key (coleção TTL compartilhada)
+    await idempotency_store.start(db)
+    
+    # Pré-carrega os certificados do Google Sign-In em background
+    from services.google_auth_service import google_token_verifier
+    google_token_verifier.warm_up()
+    
+    # Configuração da plataforma em cache (cria a padrão se não existir)
+    from services.config_service import config_service
+    await config_service.start(db)
+    
+    # Cache de usuários e jobs (invalidação por change stream entre workers)
+    from services.entity_cache import user_cache, job_cache
+    await user_cache.start(db)
+    await job_cache.start(db)
+    
+    # Histórico de chat paginado por (chat_id, created_at, id), sem mensagens bloqueadas
+    await db.messages.create_index(
+        [("chat_id", 1), ("created_at", 1), ("id", 1)],
+        name="chat_history",
+        partialFilterExpression={"blocked": False}
+    )
+    
+    # Lista de chats por participante, mais recentes primeiro
+    await db.chats.create_index([("client_id", 1), ("last_message_at", -1)])
+    await db.chats.create_index([("videomaker_id", 1), ("last_message_at", -1)])
+    
+    # Regras de moderação do chat (recarregadas da configuração)
+    from services.moderation_service import moderation_service
+    moderation_service.start()
+    
+    # Gravação em lote das mensagens de chat
+    from services.message_writer import message_writer
+    message_writer.start(db)
+    
+    # Broker de eventos de chat (entre workers com CHAT_BROKER=mongo)
+    from services.chat_broker import chat_broker
+    await chat_broker.start(db)
+    
+    # Presença e digitação (memória, propagadas pelo broker)
+    from services.presence_service import presence_service
+    presence_service.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    from services.revocation_service import revocation_list
+    from services.google_auth_service import google_token_verifier
+    from services.config_service import config_service
+    from services.entity_cache import user_cache, job_cache
+    from services.chat_broker import chat_broker
+    from services.chat_connections import connection_manager
+    from services.message_writer import message_writer
+    from services.moderation_service import moderation_service
+    from services.presence_service import presence_service
+    
+    await loop_monitor.stop()
+    await revocation_list.stop()
+    await rate_limiter.stop()
+    await config_service.stop()
+    await moderation_service.stop()
+    await user_cache.stop()
+    await job_cache.stop()
+    await connection_manager.stop()
+    await message_writer.stop()  # Grava o que restou no buffer
+    await presence_service.stop()
+    await chat_broker.stop()
+    await google_token_verifier.close()
     client.close()
     logger.info("🔌 Conexão com banco de dados fechada")
\ No newline at end of file
@@ -1,7 +1,12 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import threading
+import time
+import uuid
 import os
 
 # Configurações JWT
@@ -11,7 +16,12 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Configurações de hashing de senha
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def hash_password(password: str) -> str:
     """Gera hash da senha usando bcrypt"""
@@ -21,6 +31,112 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se a senha corresponde ao hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Verifica se o hash usa esquema obsoleto ou custo diferente do configurado"""
+    if pwd_context.needs_update(hashed_password):
+        return True
+    
+    # Formato bcrypt: $2b$<custo>$<salt+hash>
+    try:
+        rounds = int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    
+    return rounds != BCRYPT_ROUNDS
+
+def _verify_and_rehash(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica a senha e, se o custo mudou, gera novo hash na mesma chamada"""
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    
+    if password_needs_rehash(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    
+    return True, None
+
+
+class PasswordHasherBusy(Exception):
+    """Fila do pool de hashing cheia"""
+    pass
+
+
+class PasswordHasher:
+    """
+    Executa bcrypt em um pool de threads limitado, fora do event loop.
+    
+    bcrypt libera o GIL, então as threads rodam em paralelo de verdade. O número
+    de operações pendentes (em execução + na fila) é limitado: acima disso a
+    requisição é rejeitada imediatamente em vez de acumular atraso.
+    """
+    
+    def __init__(self, max_workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+    
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+    
+    async def _run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.pending += 1
+        
+        def job():
+            # Libera a vaga só quando o bcrypt termina, mesmo se a requisição for cancelada
+            try:
+                return func(*args)
+            finally:
+                self._release()
+        
+        try:
+            future = self.executor.submit(job)
+        except RuntimeError:
+            self._release()
+            raise
+        
+        return await asyncio.wrap_future(future)
+    
+    async def hash(self, password: str) -> str:
+        """Gera hash da senha no pool"""
+        return await self._run(pwd_context.hash, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifica a senha no pool
+        
+        Returns:
+            (válida, novo_hash) - novo_hash vem preenchido quando o hash
+            armazenado precisa ser atualizado para o custo atual
+        """
+        if not hashed_password:
+            # Usuários do Google não têm senha
+            return False, None
+        
+        return await self._run(_verify_and_rehash, plain_password, hashed_password)
+    
+    def snapshot(self) -> dict:
+        """Métricas do pool"""
+        return {
+            "workers": self.max_workers,
+            "capacity": self.capacity,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "bcrypt_rounds": BCRYPT_ROUNDS
+        }
+
+# Instância global
+password_hasher = PasswordHasher()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Cria JWT access token"""
     to_encode = data.copy()
@@ -29,7 +145,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire, "type": "access"})
+    # iat fracionário: permite revogar por corte de emissão sem ambiguidade dentro do mesmo segundo
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -37,7 +154,7 @@ def create_refresh_token(data: dict) -> str:
     """Cria JWT refresh token"""
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex, "type": "refresh"})
     encoded_jwt = jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
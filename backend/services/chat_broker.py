@@ -0,0 +1,345 @@
+from datetime import datetime, timedelta, timezone
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CHAT_BROKER = os.getenv("CHAT_BROKER", "local")  # local | mongo
+CHAT_EVENT_TTL_SECONDS = int(os.getenv("CHAT_EVENT_TTL_SECONDS", "60"))
+CHAT_BROKER_POLL_MS = float(os.getenv("CHAT_BROKER_POLL_MS", "100"))  # Sem change streams
+CHAT_BROKER_FLUSH_MS = float(os.getenv("CHAT_BROKER_FLUSH_MS", "5"))  # Espera máxima de um evento antes do insert_many
+CHAT_BROKER_BATCH_SIZE = int(os.getenv("CHAT_BROKER_BATCH_SIZE", "500"))
+CHAT_BROKER_MAX_BUFFER = int(os.getenv("CHAT_BROKER_MAX_BUFFER", "10000"))  # Acima disso os mais antigos são descartados
+CHAT_EPHEMERAL_BYTES = int(os.getenv("CHAT_EPHEMERAL_BYTES", str(8 * 1024 * 1024)))  # Tamanho da coleção capped
+CHAT_BROKER_RESUBSCRIBE_MS = float(os.getenv("CHAT_BROKER_RESUBSCRIBE_MS", "250"))  # Atraso para refazer o filtro do change stream
+
+# Espera após uma gravação que falhou (o lote volta para o buffer)
+FLUSH_RETRY_SECONDS = 1
+
+# Janela revisitada a cada consulta no modo polling
+POLL_OVERLAP = timedelta(seconds=2)
+
+# Identifica este processo nos eventos publicados
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+EventHandler = Callable[[str, dict], Awaitable[None]]
+
+
+class ChatBroker:
+    """
+    Pub/sub de eventos de chat entre as conexões WebSocket.
+    
+    Cada worker registra um handler por chat que tem conexões locais; eventos
+    publicados são entregues na hora aos handlers locais. Com `CHAT_BROKER=mongo`
+    os eventos também são gravados na coleção `chat_events` (TTL curto) e os
+    demais workers os recebem por change stream (ou por polling, se o MongoDB
+    não suportar change streams). Cada worker só busca os eventos dos canais
+    com handler local: o filtro do change stream é refeito (retomando do
+    último evento visto) quando esse conjunto muda.
+    
+    A gravação não fica no caminho de quem publica: os eventos entram num
+    buffer gravado em segundo plano com `insert_many`, a cada
+    `CHAT_BROKER_FLUSH_MS` ou `CHAT_BROKER_BATCH_SIZE` eventos. Um lote que
+    falha volta para o buffer (limitado a `CHAT_BROKER_MAX_BUFFER`).
+    
+    Eventos efêmeros (presença, digitação) não vão para `chat_events`: passam
+    pela coleção capped `chat_ephemeral`, sem índice nem TTL, que o MongoDB
+    sobrescreve em ciclo, e chegam aos outros workers por um cursor tailable.
+    Não há nova tentativa para eles: um aviso atrasado já não vale nada.
+    """
+    
+    def __init__(self, backend: str = CHAT_BROKER):
+        self.backend = backend
+        self.watching = False
+        self.published = 0
+        self.delivered = 0
+        self.received_remote = 0
+        self.dropped_remote = 0
+        self.errors = 0
+        self.flushes = 0
+        self.dropped_buffer = 0
+        self._db = None
+        self._handlers: Dict[str, Set[EventHandler]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._outbox: List[dict] = []
+        self._ephemeral_outbox: List[dict] = []
+        self._pending = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._tailer: Optional[asyncio.Task] = None
+        self._channels_changed = asyncio.Event()
+    
+    async def start(self, db):
+        """Inicia o recebimento de eventos de outros workers (backend mongo)"""
+        if self.backend != "mongo":
+            return
+        
+        self._db = db
+        await db.chat_events.create_index("created_at", expireAfterSeconds=CHAT_EVENT_TTL_SECONDS)
+        await db.chat_events.create_index([("chat_id", 1), ("created_at", 1)])  # Polling por canal
+        try:
+            await db.create_collection("chat_ephemeral", capped=True, size=CHAT_EPHEMERAL_BYTES)
+        except CollectionInvalid:
+            pass  # Já existe
+        self._task = asyncio.create_task(self._watch())
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._tailer = asyncio.create_task(self._tail_ephemeral())
+        logger.info(f"Broker de chat compartilhado via MongoDB (worker {WORKER_ID})")
+    
+    async def stop(self):
+        for task in (self._task, self._flusher, self._tailer):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._flusher = self._tailer = None
+        
+        # Eventos ainda no buffer (uma tentativa, se o banco estiver fora)
+        while (self._outbox or self._ephemeral_outbox) and self._db is not None:
+            if not await self._flush():
+                break
+    
+    def subscribe(self, chat_id: str, handler: EventHandler):
+        if chat_id not in self._handlers:
+            self._handlers[chat_id] = set()
+            self._channels_changed.set()
+        self._handlers[chat_id].add(handler)
+    
+    def unsubscribe(self, chat_id: str, handler: EventHandler):
+        handlers = self._handlers.get(chat_id)
+        if handlers is None:
+            return
+        handlers.discard(handler)
+        if not handlers:
+            del self._handlers[chat_id]
+            self._channels_changed.set()
+    
+    def is_subscribed(self, chat_id: str) -> bool:
+        return chat_id in self._handlers
+    
+    async def publish(self, chat_id: str, event: dict, ephemeral: bool = False):
+        """
+        Entrega o evento às conexões locais e, se houver, aos outros workers
+        
+        Eventos efêmeros (presença, digitação) vão aos outros workers pela
+        coleção capped `chat_ephemeral`, nunca por `chat_events`.
+        """
+        self.published += 1
+        await self._dispatch(chat_id, event)
+        
+        if self._db is None:
+            return
+        outbox = self._ephemeral_outbox if ephemeral else self._outbox
+        outbox.append({"chat_id": chat_id, "origin": WORKER_ID, "event": event})
+        self._trim_outbox(outbox)
+        self._pending.set()
+    
+    def _trim_outbox(self, outbox: List[dict]):
+        # Banco indisponível: eventos antigos já perderam o sentido
+        overflow = len(outbox) - CHAT_BROKER_MAX_BUFFER
+        if overflow > 0:
+            del outbox[:overflow]
+            self.dropped_buffer += overflow
+    
+    async def _flush_loop(self):
+        while True:
+            await self._pending.wait()
+            await asyncio.sleep(CHAT_BROKER_FLUSH_MS / 1000)
+            if not await self._flush():
+                await asyncio.sleep(FLUSH_RETRY_SECONDS)
+    
+    async def _flush(self) -> bool:
+        """Grava um lote do buffer; se falhar, o lote volta para o início do buffer"""
+        batch, self._outbox = self._outbox[:CHAT_BROKER_BATCH_SIZE], self._outbox[CHAT_BROKER_BATCH_SIZE:]
+        ephemeral = self._ephemeral_outbox[:CHAT_BROKER_BATCH_SIZE]
+        del self._ephemeral_outbox[:CHAT_BROKER_BATCH_SIZE]
+        if not self._outbox and not self._ephemeral_outbox:
+            self._pending.clear()
+        
+        # Horário da gravação: o polling e o TTL contam a partir dela, mesmo
+        # para eventos que esperaram uma nova tentativa
+        created_at = datetime.now(timezone.utc)
+        
+        if ephemeral:
+            try:
+                await self._db.chat_ephemeral.insert_many(
+                    [{**document, "created_at": created_at} for document in ephemeral], ordered=False
+                )
+            except PyMongoError as e:
+                self.errors += 1
+                logger.warning(f"Falha ao publicar {len(ephemeral)} eventos efêmeros, descartados: {str(e)}")
+        
+        if not batch:
+            return True
+        
+        documents = [{**document, "created_at": created_at} for document in batch]
+        try:
+            await self._db.chat_events.insert_many(documents, ordered=False)
+            self.flushes += 1
+            return True
+        except PyMongoError as e:
+            self.errors += 1
+            logger.warning(f"Falha ao publicar {len(batch)} eventos de chat, nova tentativa: {str(e)}")
+            self._outbox[:0] = batch
+            self._trim_outbox(self._outbox)
+            self._pending.set()
+            return False
+    
+    async def _dispatch(self, chat_id: str, event: dict):
+        handlers = self._handlers.get(chat_id)
+        if not handlers:
+            return
+        
+        self.delivered += 1
+        results = await asyncio.gather(*(handler(chat_id, event) for handler in list(handlers)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self.errors += 1
+                logger.warning(f"Erro ao entregar evento do chat {chat_id}: {str(result)}")
+    
+    async def _receive(self, document: dict):
+        if document.get("origin") == WORKER_ID:
+            return
+        
+        chat_id = document.get("chat_id")
+        if chat_id not in self._handlers:
+            self.dropped_remote += 1
+            return
+        
+        self.received_remote += 1
+        await self._dispatch(chat_id, document["event"])
+    
+    def _pipeline(self) -> list:
+        return [{"$match": {
+            "operationType": "insert",
+            "fullDocument.origin": {"$ne": WORKER_ID},
+            "fullDocument.chat_id": {"$in": list(self._handlers)}
+        }}]
+    
+    async def _watch(self):
+        """
+        Recebe eventos de outros workers pelo change stream de `chat_events`
+        
+        Só dos canais com handler local. Quando o conjunto muda, o stream é
+        reaberto com o novo filtro a partir do último evento visto (no máximo
+        a cada `CHAT_BROKER_RESUBSCRIBE_MS`).
+        """
+        resume_token = None
+        while True:
+            try:
+                self._channels_changed.clear()
+                async with self._db.chat_events.watch(
+                    self._pipeline(),
+                    resume_after=resume_token,
+                    max_await_time_ms=int(CHAT_BROKER_RESUBSCRIBE_MS)
+                ) as stream:
+                    self.watching = True
+                    while not self._channels_changed.is_set():
+                        change = await stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is not None:
+                            await self._receive(change["fullDocument"])
+            except asyncio.CancelledError:
+                self.watching = False
+                raise
+            except OperationFailure as e:
+                # Mongo standalone não suporta change streams: consulta periódica
+                self.watching = False
+                logger.info(f"Change stream de chat indisponível, usando polling de {CHAT_BROKER_POLL_MS:.0f}ms: {str(e)}")
+                await self._poll()
+                return
+            except Exception as e:
+                self.watching = False
+                logger.warning(f"Change stream de chat interrompido: {str(e)}")
+                await asyncio.sleep(1)
+    
+    async def _tail_ephemeral(self):
+        """
+        Recebe os eventos efêmeros de outros workers (cursor tailable em `chat_ephemeral`)
+        
+        Sem filtro por canal: reabrir o cursor perderia eventos, e o volume é
+        pequeno (digitação com debounce, mudanças de presença e um heartbeat
+        por worker). Eventos de canais sem conexão local são descartados na
+        chegada.
+        """
+        since = datetime.now(timezone.utc)
+        while True:
+            try:
+                cursor = self._db.chat_ephemeral.find(
+                    {"origin": {"$ne": WORKER_ID}, "created_at": {"$gt": since}},
+                    cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for document in cursor:
+                        since = max(since, document["created_at"].replace(tzinfo=timezone.utc))
+                        await self._receive(document)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cursor de eventos efêmeros interrompido: {str(e)}")
+            # Coleção vazia encerra o cursor tailable na hora
+            await asyncio.sleep(1)
+    
+    async def _poll(self):
+        """
+        Alternativa ao change stream: consulta eventos novos por `created_at`
+        
+        Relógios de workers diferentes não são exatos, então cada consulta volta
+        `POLL_OVERLAP` no tempo e descarta os eventos já vistos.
+        """
+        since = datetime.now(timezone.utc)
+        seen: Dict[object, datetime] = {}
+        
+        while True:
+            await asyncio.sleep(CHAT_BROKER_POLL_MS / 1000)
+            try:
+                documents = await self._db.chat_events.find({
+                    "origin": {"$ne": WORKER_ID},
+                    "chat_id": {"$in": list(self._handlers)},
+                    "created_at": {"$gte": since - POLL_OVERLAP}
+                }).sort("created_at", 1).to_list(1000)
+            except PyMongoError as e:
+                self.errors += 1
+                logger.warning(f"Falha ao consultar eventos de chat: {str(e)}")
+                continue
+            
+            for document in documents:
+                if document["_id"] in seen:
+                    continue
+                created_at = document["created_at"].replace(tzinfo=timezone.utc)
+                seen[document["_id"]] = created_at
+                since = max(since, created_at)
+                await self._receive(document)
+            
+            # Sem eventos dos canais locais a janela também avança
+            since = max(since, datetime.now(timezone.utc) - POLL_OVERLAP)
+            cutoff = since - POLL_OVERLAP
+            seen = {event_id: created_at for event_id, created_at in seen.items() if created_at >= cutoff}
+    
+    def snapshot(self) -> dict:
+        return {
+            "backend": self.backend,
+            "worker_id": WORKER_ID,
+            "watching": self.watching,
+            "local_chats": len(self._handlers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "received_remote": self.received_remote,
+            "dropped_remote": self.dropped_remote,
+            "buffered": len(self._outbox) + len(self._ephemeral_outbox),
+            "flushes": self.flushes,
+            "dropped_buffer": self.dropped_buffer,
+            "errors": self.errors
+        }
+
+
+# Instância global
+chat_broker = ChatBroker()
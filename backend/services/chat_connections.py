@@ -0,0 +1,399 @@
+from fastapi import WebSocket, WebSocketDisconnect
+from services.chat_broker import chat_broker
+from services.presence_service import presence_service
+from services.revocation_service import revocation_list
+from typing import Dict, Optional, Set, Tuple, Union
+import asyncio
+import json
+import logging
+import msgpack
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "256"))  # Mensagens pendentes por conexão
+CHAT_SEND_TIMEOUT_SECONDS = float(os.getenv("CHAT_SEND_TIMEOUT_SECONDS", "10"))
+CHAT_PING_INTERVAL_SECONDS = float(os.getenv("CHAT_PING_INTERVAL_SECONDS", "20"))
+CHAT_IDLE_TIMEOUT_SECONDS = float(os.getenv("CHAT_IDLE_TIMEOUT_SECONDS", "60"))
+
+# Códigos de fechamento
+CLOSE_IDLE = 1001  # Going away: cliente sem responder aos pings
+CLOSE_POLICY = 1008  # Policy violation: token inválido, revogado ou expirado
+CLOSE_SLOW_CONSUMER = 1013  # Try again later: fila de envio estourou
+
+# Canal do broker com os eventos de um usuário (notificações, lista de chats)
+USER_CHANNEL_PREFIX = "user:"
+
+# Protocolo negociado pelo header Sec-WebSocket-Protocol. Sem subprotocolo o
+# cliente fica na versão 1 (frames de texto JSON).
+PROTOCOL_VERSION = 2
+SUBPROTOCOLS = {
+    "videomakers.chat.v2.msgpack": "msgpack",  # Frames binários MessagePack
+    "videomakers.chat.v2.json": "json"
+}
+
+Frame = Union[str, bytes]
+
+
+def encode_event(event: dict, encoding: str) -> Frame:
+    if encoding == "msgpack":
+        return msgpack.packb(event, use_bin_type=True)
+    return json.dumps(event)
+
+def negotiate_subprotocol(websocket: WebSocket) -> Optional[str]:
+    """Primeiro subprotocolo suportado entre os pedidos pelo cliente"""
+    for name in websocket.scope.get("subprotocols", []):
+        if name in SUBPROTOCOLS:
+            return name
+    return None
+
+
+class EncodedEvent:
+    """Evento serializado sob demanda, uma vez por codificação"""
+    
+    __slots__ = ("event", "_frames")
+    
+    def __init__(self, event: dict):
+        self.event = event
+        self._frames: Dict[str, Frame] = {}
+    
+    def frame(self, encoding: str) -> Frame:
+        frame = self._frames.get(encoding)
+        if frame is None:
+            frame = self._frames[encoding] = encode_event(self.event, encoding)
+        return frame
+
+
+def _peer(connection: "ChatConnection", chat_id: str) -> str:
+    client_id, videomaker_id = connection.chats[chat_id]
+    return videomaker_id if client_id == connection.user_id else client_id
+
+
+class ChatConnection:
+    """
+    Uma conexão WebSocket com fila de envio própria.
+    
+    Os envios entram numa fila limitada e uma task escritora os descarrega, de
+    modo que um cliente lento não atrasa os demais. Se a fila encher, a conexão
+    é encerrada (o cliente reconecta e busca o histórico).
+    
+    O usuário é autenticado uma vez, na conexão; os participantes de cada chat
+    ficam em `chats` durante a sessão, sem consultar o banco a cada mensagem.
+    """
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        manager: "ConnectionManager",
+        user: dict,
+        multiplexed: bool = False,
+        encoding: str = "json",
+        queue_size: int = CHAT_SEND_QUEUE_SIZE
+    ):
+        self.websocket = websocket
+        self.manager = manager
+        self.multiplexed = multiplexed  # Conexão do usuário (todos os chats) ou de um chat só
+        self.encoding = encoding
+        self.user = user
+        self.user_id: str = user["sub"]
+        self.chats: Dict[str, Tuple[str, ...]] = {}  # chat_id -> participantes
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.last_activity = time.monotonic()
+        self.closed = False
+        self._writer: Optional[asyncio.Task] = None
+    
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+    
+    def touch(self):
+        """Registra atividade do cliente (qualquer frame recebido)"""
+        self.last_activity = time.monotonic()
+    
+    def is_authorized(self) -> bool:
+        """Token da sessão ainda válido (não revogado nem expirado)"""
+        exp = self.user.get("exp")
+        if exp is not None and exp < time.time():
+            return False
+        return not revocation_list.is_revoked(self.user)
+    
+    def send(self, message: Frame) -> bool:
+        """Enfileira uma mensagem sem bloquear; False se a conexão foi descartada"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.manager.evicted_slow += 1
+            logger.info(f"Conexão de chat descartada por fila cheia ({self.queue.maxsize} mensagens)")
+            if self._detach():
+                asyncio.create_task(self._close_socket(CLOSE_SLOW_CONSUMER))
+            return False
+    
+    def send_event(self, event: dict) -> bool:
+        return self.send(encode_event(event, self.encoding))
+    
+    async def receive_event(self) -> dict:
+        """Próximo frame do cliente, decodificado (texto JSON ou binário MessagePack)"""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        
+        self.touch()
+        if message.get("bytes") is not None:
+            return msgpack.unpackb(message["bytes"], raw=False)
+        return json.loads(message["text"])
+    
+    async def _write_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                if isinstance(message, bytes):
+                    sending = self.websocket.send_bytes(message)
+                else:
+                    sending = self.websocket.send_text(message)
+                await asyncio.wait_for(sending, CHAT_SEND_TIMEOUT_SECONDS)
+                self.manager.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Socket morto ou envio travado: encerra sem afetar as outras conexões
+            self.manager.send_errors += 1
+            logger.debug(f"Falha ao enviar para conexão de chat: {str(e)}")
+            await self.close(CLOSE_SLOW_CONSUMER)
+    
+    def _detach(self) -> bool:
+        """Tira a conexão do gerenciador e para a escrita; False se já estava fechada"""
+        if self.closed:
+            return False
+        self.closed = True
+        self.manager.disconnect(self)
+        
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        return True
+    
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # Já fechado pelo cliente
+    
+    async def close(self, code: int = 1000):
+        if self._detach():
+            await self._close_socket(code)
+
+
+class ConnectionManager:
+    """
+    Conexões WebSocket de chat deste worker, agrupadas por chat e por usuário.
+    
+    Eventos chegam pelo broker e são enfileirados em todas as conexões locais
+    do chat de uma vez (sem aguardar envios). Uma task de heartbeat envia pings
+    periódicos e encerra conexões sem atividade além do limite.
+    """
+    
+    def __init__(self, ping_interval: float = CHAT_PING_INTERVAL_SECONDS, idle_timeout: float = CHAT_IDLE_TIMEOUT_SECONDS):
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.active_connections: Dict[str, Set[ChatConnection]] = {}
+        self.user_connections: Dict[str, Set[ChatConnection]] = {}
+        self.presence_watchers: Dict[str, Set[ChatConnection]] = {}  # user_id -> conexões com chat aberto com ele
+        self.sessions: Dict[str, Set[ChatConnection]] = {}  # user_id -> todas as conexões do usuário
+        self.connections: Set[ChatConnection] = set()
+        self.messages_sent = 0
+        self.send_errors = 0
+        self.evicted_slow = 0
+        self.evicted_idle = 0
+        self.closed_unauthorized = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+        presence_service.add_listener(self.deliver_presence)
+    
+    async def connect(self, websocket: WebSocket, user: dict, multiplexed: bool = False) -> ChatConnection:
+        """
+        Aceita a conexão (já autenticada) e inicia sua task escritora
+        
+        Conexões multiplexadas também recebem os eventos do usuário. Clientes
+        que negociam um subprotocolo recebem um `hello` com a versão e a
+        codificação do protocolo.
+        """
+        subprotocol = negotiate_subprotocol(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        
+        encoding = SUBPROTOCOLS.get(subprotocol, "json")
+        connection = ChatConnection(websocket, self, user, multiplexed=multiplexed, encoding=encoding)
+        connection.start()
+        self.connections.add(connection)
+        self.sessions.setdefault(connection.user_id, set()).add(connection)
+        presence_service.connected(connection.user_id)
+        
+        if subprotocol:
+            connection.send_event({
+                "type": "hello",
+                "protocol": PROTOCOL_VERSION,
+                "encoding": encoding,
+                "ping_interval": self.ping_interval
+            })
+        
+        if multiplexed:
+            user_id = connection.user_id
+            if user_id not in self.user_connections:
+                self.user_connections[user_id] = set()
+                chat_broker.subscribe(USER_CHANNEL_PREFIX + user_id, self.deliver_to_user)
+            self.user_connections[user_id].add(connection)
+        
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        return connection
+    
+    def join(self, connection: ChatConnection, chat: dict):
+        """
+        Passa a entregar os eventos do chat à conexão (participante já verificado)
+        
+        A conexão recebe a presença atual do outro participante e, daí em
+        diante, suas mudanças.
+        """
+        chat_id = chat["id"]
+        if chat_id not in self.active_connections:
+            self.active_connections[chat_id] = set()
+            chat_broker.subscribe(chat_id, self.deliver)
+        self.active_connections[chat_id].add(connection)
+        connection.chats[chat_id] = (chat["client_id"], chat["videomaker_id"])
+        
+        peer_id = _peer(connection, chat_id)
+        self.presence_watchers.setdefault(peer_id, set()).add(connection)
+        connection.send_event(presence_service.status(peer_id))
+    
+    def leave(self, connection: ChatConnection, chat_id: str):
+        if chat_id in connection.chats:
+            peer_id = _peer(connection, chat_id)
+            del connection.chats[chat_id]
+            
+            # Outro chat aberto com o mesmo participante mantém a presença
+            if not any(peer_id in participants for participants in connection.chats.values()):
+                watchers = self.presence_watchers.get(peer_id)
+                if watchers is not None:
+                    watchers.discard(connection)
+                    if not watchers:
+                        del self.presence_watchers[peer_id]
+        
+        connections = self.active_connections.get(chat_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[chat_id]
+            chat_broker.unsubscribe(chat_id, self.deliver)
+    
+    def disconnect(self, connection: ChatConnection):
+        for chat_id in list(connection.chats):
+            self.leave(connection, chat_id)
+        self.connections.discard(connection)
+        
+        sessions = self.sessions.get(connection.user_id)
+        if sessions is not None:
+            sessions.discard(connection)
+            if not sessions:
+                del self.sessions[connection.user_id]
+        
+        connections = self.user_connections.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.user_connections[connection.user_id]
+                chat_broker.unsubscribe(USER_CHANNEL_PREFIX + connection.user_id, self.deliver_to_user)
+        
+        presence_service.disconnected(connection.user_id)
+    
+    def peers(self, user_id: str) -> Set[str]:
+        """Com quem o usuário tem chat aberto em alguma conexão deste worker"""
+        return {
+            _peer(connection, chat_id)
+            for connection in self.sessions.get(user_id, ())
+            for chat_id in connection.chats
+        }
+    
+    async def broadcast(self, event: dict, chat_id: str, ephemeral: bool = False):
+        """Publica o evento para todas as conexões do chat, em qualquer worker (efêmero: só neste)"""
+        await chat_broker.publish(chat_id, event, ephemeral=ephemeral)
+    
+    async def notify_user(self, user_id: str, event: dict):
+        """Publica um evento para as conexões multiplexadas do usuário, em qualquer worker"""
+        await chat_broker.publish(USER_CHANNEL_PREFIX + user_id, event)
+    
+    async def close_chat(self, chat_id: str):
+        """Encerra as sessões do chat em todos os workers (chat removido)"""
+        await chat_broker.publish(chat_id, {"type": "chat_closed", "chat_id": chat_id})
+    
+    async def deliver(self, chat_id: str, event: dict):
+        """Entrega um evento do broker às conexões locais do chat (serializa uma vez por codificação)"""
+        encoded = EncodedEvent(event)
+        connections = list(self.active_connections.get(chat_id, ()))
+        for connection in connections:
+            connection.send(encoded.frame(connection.encoding))
+        
+        # Participantes em cache deixam de valer
+        if event.get("type") == "chat_closed":
+            for connection in connections:
+                self.leave(connection, chat_id)
+    
+    async def deliver_to_user(self, channel: str, event: dict):
+        """Entrega um evento do broker às conexões multiplexadas do usuário"""
+        encoded = EncodedEvent(event)
+        for connection in list(self.user_connections.get(channel[len(USER_CHANNEL_PREFIX):], ())):
+            connection.send(encoded.frame(connection.encoding))
+    
+    async def deliver_presence(self, status: dict):
+        """Entrega uma mudança de presença às conexões com chat aberto com o usuário"""
+        encoded = EncodedEvent(status)
+        for connection in list(self.presence_watchers.get(status["user_id"], ())):
+            connection.send(encoded.frame(connection.encoding))
+    
+    async def _heartbeat_loop(self):
+        ping = EncodedEvent({"type": "ping"})
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            now = time.monotonic()
+            for connection in list(self.connections):
+                if now - connection.last_activity > self.idle_timeout:
+                    self.evicted_idle += 1
+                    await connection.close(CLOSE_IDLE)
+                elif not connection.is_authorized():
+                    self.closed_unauthorized += 1
+                    await connection.close(CLOSE_POLICY)
+                else:
+                    connection.send(ping.frame(connection.encoding))
+    
+    async def stop(self):
+        """Encerra o heartbeat e todas as conexões (desligamento do worker)"""
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        
+        for connection in list(self.connections):
+            await connection.close(CLOSE_IDLE)
+    
+    def snapshot(self) -> dict:
+        depths = [connection.queue.qsize() for connection in self.connections]
+        return {
+            "connections": len(self.connections),
+            "users": len(self.user_connections),
+            "chats": len(self.active_connections),
+            "presence_watched": len(self.presence_watchers),
+            "queue_depth_max": max(depths, default=0),
+            "queue_depth_total": sum(depths),
+            "messages_sent": self.messages_sent,
+            "send_errors": self.send_errors,
+            "evicted_slow": self.evicted_slow,
+            "evicted_idle": self.evicted_idle,
+            "closed_unauthorized": self.closed_unauthorized
+        }
+
+
+# Instância global
+connection_manager = ConnectionManager()
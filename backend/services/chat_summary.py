@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Set, Tuple
+from services.entity_cache import job_cache
+from services.message_writer import MessageWriter, message_writer
+from utils.cursor import cursor_filter, decode_cursor
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tamanho da prévia da última mensagem guardada no chat
+PREVIEW_LENGTH = 100
+
+# Participantes dos chats de cada usuário, lembrados da última listagem
+CHAT_PEERS_CACHE_SIZE = int(os.getenv("CHAT_PEERS_CACHE_SIZE", "10000"))
+CHAT_PEERS_TTL_SECONDS = float(os.getenv("CHAT_PEERS_TTL_SECONDS", "600"))
+
+# Campos do resumo mantidos no documento do chat
+SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "job_id": 1,
+    "job_titulo": 1,
+    "client_id": 1,
+    "videomaker_id": 1,
+    "last_message": 1,
+    "last_message_at": 1,
+    "last_sender_id": 1,
+    "unread": 1,
+    "created_at": 1
+}
+
+
+def preview(content: str) -> str:
+    return content[:PREVIEW_LENGTH] + "..." if len(content) > PREVIEW_LENGTH else content
+
+def other_participant(chat: dict, user_id: str) -> str:
+    return chat["client_id"] if chat["videomaker_id"] == user_id else chat["videomaker_id"]
+
+
+class ChatSummaryService:
+    """
+    Resumo de cada chat mantido no próprio documento `chats`
+    
+    A cada mensagem gravada, o chat recebe a prévia e o horário da última
+    mensagem e incrementa o contador de não lidas do destinatário
+    (`unread.<user_id>`). Assim a lista de chats sai de uma única consulta, sem
+    buscar a última mensagem e o job de cada chat.
+    """
+    
+    def __init__(self, db, writer: MessageWriter = message_writer):
+        self.db = db
+        self.writer = writer
+        self._peers: "OrderedDict[str, Tuple[Set[str], float]]" = OrderedDict()
+    
+    def remember_peers(self, user_id: str, chats: Iterable[dict]):
+        """Guarda com quem o usuário tem chat (a partir da lista de chats)"""
+        self._peers[user_id] = ({other_participant(chat, user_id) for chat in chats}, time.monotonic())
+        self._peers.move_to_end(user_id)
+        if len(self._peers) > CHAT_PEERS_CACHE_SIZE:
+            self._peers.popitem(last=False)
+    
+    def known_peers(self, user_id: str) -> Set[str]:
+        """Com quem o usuário tem chat, segundo a última listagem (vazio se expirou)"""
+        entry = self._peers.get(user_id)
+        if entry is None or time.monotonic() - entry[1] > CHAT_PEERS_TTL_SECONDS:
+            return set()
+        return entry[0]
+    
+    def record_message(self, chat_id: str, sender_id: str, recipient_id: str, content: str, created_at: str) -> asyncio.Future:
+        """
+        Atualiza o resumo do chat com uma mensagem gravada (não bloqueada)
+        
+        A atualização vai no próximo lote do `message_writer`, sem esperar o banco.
+        """
+        return self.writer.submit_update(
+            "chats",
+            {"id": chat_id},
+            {
+                "$set": {
+                    "last_message": preview(content),
+                    "last_message_at": created_at,
+                    "last_sender_id": sender_id
+                },
+                "$inc": {f"unread.{recipient_id}": 1}
+            }
+        )
+    
+    async def mark_read(self, chat: dict, user_id: str, until: Optional[str] = None) -> dict:
+        """
+        Marca como lidas, de uma vez, as mensagens recebidas pelo usuário
+        
+        Com `until` (cursor do histórico), apenas as mensagens até essa posição,
+        inclusive; o contador passa a refletir as que ficaram depois dela.
+        """
+        query = {
+            "chat_id": chat["id"],
+            "blocked": False,
+            "sender_id": {"$ne": user_id},
+            "read_at": None
+        }
+        read_query = query
+        if until:
+            created_at, message_id = decode_cursor(until)
+            read_query = {**query, "$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lte": message_id}}
+            ]}
+        
+        read_at = datetime.now(timezone.utc).isoformat()
+        result = await self.db.messages.update_many(read_query, {"$set": {"read_at": read_at}})
+        
+        unread = 0
+        if until:
+            # Recebidas depois do cursor continuam não lidas
+            unread = await self.db.messages.count_documents({**query, **cursor_filter(after=until)})
+        
+        # Pelo writer, depois dos incrementos já enfileirados para este chat
+        await self.writer.submit_update("chats", {"id": chat["id"]}, {"$set": {f"unread.{user_id}": unread}})
+        return {"marked": result.modified_count, "unread": unread, "read_at": read_at}
+    
+    async def backfill(self, chat: dict) -> dict:
+        """
+        Calcula e grava o resumo de um chat criado antes dos resumos existirem
+        
+        Executado uma vez por chat, na primeira listagem.
+        """
+        last_message = await self.db.messages.find_one(
+            {"chat_id": chat["id"], "blocked": False},
+            {"_id": 0, "content": 1, "created_at": 1, "sender_id": 1},
+            sort=[("created_at", -1), ("id", -1)]
+        )
+        job = await job_cache.get(chat["job_id"], {"_id": 0, "titulo": 1})
+        
+        summary = {
+            "job_titulo": job.get("titulo") if job else None,
+            "last_message": preview(last_message["content"]) if last_message else None,
+            "last_message_at": last_message["created_at"] if last_message else None,
+            "last_sender_id": last_message["sender_id"] if last_message else None,
+            "unread": {}
+        }
+        for user_id in (chat["client_id"], chat["videomaker_id"]):
+            summary["unread"][user_id] = await self.db.messages.count_documents({
+                "chat_id": chat["id"],
+                "blocked": False,
+                "sender_id": {"$ne": user_id},
+                "read_at": None
+            })
+        
+        await self.db.chats.update_one({"id": chat["id"]}, {"$set": summary})
+        logger.info(f"Resumo do chat {chat['id']} calculado")
+        return {**chat, **summary}
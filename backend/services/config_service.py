@@ -0,0 +1,151 @@
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+from typing import Optional
+import asyncio
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+CONFIG_ID = "platform_config"
+CONFIG_CACHE_TTL_SECONDS = float(os.getenv("CONFIG_CACHE_TTL_SECONDS", "5"))
+
+
+class PlatformConfigService:
+    """
+    Configuração da plataforma mantida em memória por worker.
+    
+    Cada escrita incrementa `version` no documento. Com replica set, um change
+    stream entrega as alterações a todos os workers assim que acontecem; sem
+    change streams (Mongo standalone) o cache expira após
+    `CONFIG_CACHE_TTL_SECONDS` e é relido do banco.
+    """
+    
+    def __init__(self, ttl: float = CONFIG_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.watching = False
+        self.hits = 0
+        self.loads = 0
+        self.updates_received = 0
+        self._db = None
+        self._config: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self, db):
+        """Garante a configuração padrão, carrega e inicia o watcher"""
+        self._db = db
+        await self.load()
+        self._task = asyncio.create_task(self._watch())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def _is_fresh(self) -> bool:
+        if self._config is None:
+            return False
+        return self.watching or time.monotonic() - self._loaded_at < self.ttl
+    
+    async def get(self) -> dict:
+        """Retorna a configuração atual (cópia rasa)"""
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self.load()
+        else:
+            self.hits += 1
+        
+        return dict(self._config)
+    
+    async def load(self):
+        """Lê a configuração do banco, criando a padrão se não existir"""
+        from models.config import PlatformConfig
+        
+        config = await self._db.platform_config.find_one({"id": CONFIG_ID}, {"_id": 0})
+        if not config:
+            default_config = PlatformConfig().model_dump()
+            default_config['updated_at'] = default_config['updated_at'].isoformat()
+            default_config.pop("id")  # Já vem do filtro do upsert
+            
+            config = await self._db.platform_config.find_one_and_update(
+                {"id": CONFIG_ID},
+                {"$setOnInsert": default_config},
+                upsert=True,
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            logger.info("✅ Configuração padrão criada")
+        
+        self.loads += 1
+        self._set(config, force=True)
+    
+    def _set(self, config: dict, force: bool = False):
+        config.pop("_id", None)
+        current = self._config
+        # Ignora versões antigas que cheguem fora de ordem
+        if not force and current is not None and config.get("version", 0) < current.get("version", 0):
+            return
+        self._config = config
+        self._loaded_at = time.monotonic()
+    
+    async def update(self, update_dict: dict) -> dict:
+        """Grava alterações incrementando a versão e atualiza o cache local"""
+        config = await self._db.platform_config.find_one_and_update(
+            {"id": CONFIG_ID},
+            {"$set": update_dict, "$inc": {"version": 1}},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        self._set(config)
+        return dict(config)
+    
+    async def _watch(self):
+        """Recebe alterações de outros workers pelo change stream"""
+        while True:
+            try:
+                async with self._db.platform_config.watch(full_document="updateLookup") as stream:
+                    self.watching = True
+                    # Alterações feitas antes do stream abrir
+                    await self.load()
+                    async for change in stream:
+                        document = change.get("fullDocument")
+                        if document and document.get("id") == CONFIG_ID:
+                            self.updates_received += 1
+                            self._set(document)
+                        elif change.get("operationType") in ("delete", "drop", "invalidate"):
+                            self._config = None
+            except asyncio.CancelledError:
+                self.watching = False
+                raise
+            except OperationFailure as e:
+                # Mongo standalone não suporta change streams: fica com o TTL
+                self.watching = False
+                logger.info(f"Change stream de configuração indisponível, usando TTL de {self.ttl}s: {str(e)}")
+                return
+            except Exception as e:
+                self.watching = False
+                logger.warning(f"Change stream de configuração interrompido: {str(e)}")
+                await asyncio.sleep(5)
+    
+    def snapshot(self) -> dict:
+        """Métricas do cache de configuração"""
+        return {
+            "version": self._config.get("version", 0) if self._config else None,
+            "watching": self.watching,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "loads": self.loads,
+            "updates_received": self.updates_received
+        }
+
+# Instância global
+config_service = PlatformConfigService()
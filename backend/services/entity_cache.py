@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from pymongo.errors import OperationFailure
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "5000"))
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv("ENTITY_CACHE_TTL_SECONDS", "10"))
+
+CacheKey = Tuple[str, tuple]
+
+
+class EntityCache:
+    """
+    Cache read-through de documentos buscados por `id` (usuários, jobs).
+    
+    A chave inclui a projeção, então `{"_id": 0}` e `{"_id": 0, "nome": 1}`
+    são entradas distintas do mesmo documento; invalidar um id remove todas.
+    As entradas expiram após o TTL e são invalidadas:
+    
+    - localmente, pelos routers logo após cada escrita (`invalidate`)
+    - entre workers, por change stream quando o MongoDB suporta
+    
+    Os documentos retornados são cópias rasas: podem ser alterados no primeiro
+    nível, mas listas e dicts internos são compartilhados com o cache.
+    """
+    
+    def __init__(self, collection_name: str, maxsize: int = ENTITY_CACHE_SIZE, ttl: float = ENTITY_CACHE_TTL_SECONDS):
+        self.collection_name = collection_name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.watching = False
+        self._db = None
+        self._entries: "OrderedDict[CacheKey, Tuple[dict, float]]" = OrderedDict()
+        self._keys_by_id: Dict[str, Set[CacheKey]] = {}
+        self._id_by_oid: Dict[object, str] = {}
+        self._oid_by_id: Dict[str, object] = {}
+        self._invalidated_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.stale_served_ms = 0.0  # Maior idade de uma entrada servida
+    
+    @staticmethod
+    def _projection_key(projection: Optional[dict]) -> tuple:
+        return tuple(sorted((projection or {"_id": 0}).items()))
+    
+    @staticmethod
+    def _query_projection(projection: Optional[dict]) -> Optional[dict]:
+        """Projeção usada na consulta: sempre traz o `_id` (para o change stream)"""
+        query_projection = {k: v for k, v in (projection or {}).items() if k != "_id"}
+        return query_projection or None
+    
+    async def get(self, entity_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """
+        Equivalente a `find_one({"id": entity_id}, projection)`, com cache
+        
+        O `_id` do Mongo nunca é retornado (projeção padrão `{"_id": 0}`).
+        """
+        key = (entity_id, self._projection_key(projection))
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        
+        if entry is not None:
+            doc, loaded_at = entry
+            age = now - loaded_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.stale_served_ms = max(self.stale_served_ms, age * 1000)
+                return dict(doc)
+            self._remove(key)
+            self.expired += 1
+        
+        self.misses += 1
+        collection = self._db[self.collection_name]
+        doc = await collection.find_one({"id": entity_id}, self._query_projection(projection))
+        if doc is None:
+            return None
+        
+        oid = doc.pop("_id", None)
+        
+        # Não armazena se o documento foi invalidado durante a leitura
+        if self._invalidated_at.get(entity_id, 0.0) < now:
+            self._put(key, doc, oid)
+        
+        return dict(doc)
+    
+    def _put(self, key: CacheKey, doc: dict, oid):
+        self._entries[key] = (doc, time.monotonic())
+        self._entries.move_to_end(key)
+        self._keys_by_id.setdefault(key[0], set()).add(key)
+        if oid is not None:
+            self._id_by_oid[oid] = key[0]
+            self._oid_by_id[key[0]] = oid
+        
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+    
+    def _remove(self, key: CacheKey):
+        self._entries.pop(key, None)
+        keys = self._keys_by_id.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[key[0]]
+                self._id_by_oid.pop(self._oid_by_id.pop(key[0], None), None)
+    
+    def invalidate(self, entity_id: str):
+        """Remove todas as projeções de um documento (chamar após escrever nele)"""
+        self.invalidations += 1
+        self._invalidated_at[entity_id] = time.monotonic()
+        for key in list(self._keys_by_id.get(entity_id, ())):
+            self._remove(key)
+        
+        # Marcas de invalidação só importam para leituras em andamento
+        if len(self._invalidated_at) > self.maxsize:
+            cutoff = time.monotonic() - self.ttl
+            self._invalidated_at = {k: t for k, t in self._invalidated_at.items() if t >= cutoff}
+    
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_id.clear()
+        self._id_by_oid.clear()
+        self._oid_by_id.clear()
+    
+    async def start(self, db):
+        self._db = db
+        self._task = asyncio.create_task(self._watch())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _watch(self):
+        """Invalida por change stream as escritas feitas por outros workers"""
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        while True:
+            try:
+                async with self._db[self.collection_name].watch(pipeline) as stream:
+                    self.watching = True
+                    # Pode ter perdido alterações enquanto o stream estava fechado
+                    self.clear()
+                    async for change in stream:
+                        entity_id = self._id_by_oid.get(change["documentKey"]["_id"])
+                        if entity_id is not None:
+                            self.invalidate(entity_id)
+            except asyncio.CancelledError:
+                self.watching = False
+                raise
+            except OperationFailure as e:
+                # Mongo standalone: só o TTL limita a defasagem entre workers
+                self.watching = False
+                logger.info(f"Change stream de {self.collection_name} indisponível, usando TTL de {self.ttl}s: {str(e)}")
+                return
+            except Exception as e:
+                self.watching = False
+                logger.warning(f"Change stream de {self.collection_name} interrompido: {str(e)}")
+                await asyncio.sleep(5)
+    
+    def snapshot(self) -> dict:
+        """Métricas do cache"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "watching": self.watching,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+            "max_age_served_ms": round(self.stale_served_ms, 1)
+        }
+
+
+# Instâncias globais
+user_cache = EntityCache("users")
+job_cache = EntityCache("jobs")
@@ -0,0 +1,177 @@
+from jose import JWTError, jwt
+from typing import Optional
+import asyncio
+import httpx
+import logging
+import re
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")  # Se definido, valida o `aud` do token
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+
+DEFAULT_MAX_AGE_SECONDS = 3600
+REFRESH_AHEAD_SECONDS = 60  # Renova em background quando falta menos que isso para expirar
+MIN_FORCED_REFRESH_SECONDS = 30  # Intervalo mínimo entre recargas por `kid` desconhecido
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+def parse_max_age(cache_control: Optional[str]) -> int:
+    """Extrai o max-age do header Cache-Control"""
+    if cache_control:
+        match = MAX_AGE_PATTERN.search(cache_control)
+        if match:
+            return int(match.group(1))
+    return DEFAULT_MAX_AGE_SECONDS
+
+
+class GoogleTokenVerifier:
+    """
+    Verifica ID tokens do Google localmente, com as chaves públicas em cache.
+    
+    As chaves (JWKS) são buscadas por um cliente HTTP assíncrono com pool de
+    conexões e mantidas pelo tempo indicado no Cache-Control da resposta. Perto
+    do vencimento a renovação acontece em background, sem bloquear o sign-in.
+    A verificação da assinatura roda em thread, fora do event loop.
+    """
+    
+    def __init__(
+        self,
+        certs_url: str = GOOGLE_CERTS_URL,
+        audience: Optional[str] = GOOGLE_CLIENT_ID,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.certs_url = certs_url
+        self.audience = audience
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._jwks: Optional[dict] = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.fetches = 0
+        self.cache_hits = 0
+        self.background_refreshes = 0
+    
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=5.0,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+            )
+        return self._client
+    
+    async def _fetch(self):
+        response = await self._http().get(self.certs_url)
+        response.raise_for_status()
+        
+        now = time.monotonic()
+        self._jwks = response.json()
+        self._fetched_at = now
+        self._expires_at = now + parse_max_age(response.headers.get("cache-control"))
+        self.fetches += 1
+    
+    async def get_keys(self, force: bool = False) -> dict:
+        """Retorna o JWKS em cache, buscando apenas quando expirado (ou forçado)"""
+        now = time.monotonic()
+        
+        if self._jwks is not None and not force and now < self._expires_at:
+            if self._expires_at - now <= REFRESH_AHEAD_SECONDS:
+                self._schedule_refresh()
+            self.cache_hits += 1
+            return self._jwks
+        
+        async with self._lock:
+            now = time.monotonic()
+            if self._jwks is not None:
+                if not force and now < self._expires_at:
+                    return self._jwks
+                if force and now - self._fetched_at < MIN_FORCED_REFRESH_SECONDS:
+                    return self._jwks
+            await self._fetch()
+        
+        return self._jwks
+    
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+    
+    async def _background_refresh(self):
+        try:
+            async with self._lock:
+                if self._expires_at - time.monotonic() <= REFRESH_AHEAD_SECONDS:
+                    await self._fetch()
+                    self.background_refreshes += 1
+        except Exception as e:
+            logger.error(f"Erro ao renovar certificados do Google: {str(e)}")
+    
+    def warm_up(self):
+        """Carrega as chaves em background (ex: na inicialização)"""
+        self._schedule_refresh()
+    
+    def _decode(self, token: str, key: dict) -> dict:
+        options = {"verify_aud": self.audience is not None, "verify_at_hash": False}
+        try:
+            claims = jwt.decode(token, key, algorithms=["RS256"], audience=self.audience, options=options)
+        except JWTError as e:
+            raise ValueError(f"Token do Google inválido: {str(e)}")
+        
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError("Emissor do token inválido")
+        
+        return claims
+    
+    async def verify(self, token: str) -> dict:
+        """
+        Verifica um ID token do Google
+        
+        Raises:
+            ValueError: token malformado, assinatura inválida, expirado ou de outro emissor
+        """
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError as e:
+            raise ValueError(f"Token do Google malformado: {str(e)}")
+        
+        jwks = await self.get_keys()
+        key = find_key(jwks, kid)
+        if key is None:
+            # Chave nova (rotação): recarrega uma vez
+            key = find_key(await self.get_keys(force=True), kid)
+        if key is None:
+            raise ValueError("Chave de assinatura desconhecida")
+        
+        return await asyncio.to_thread(self._decode, token, key)
+    
+    async def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def snapshot(self) -> dict:
+        """Métricas do cache de certificados"""
+        return {
+            "fetches": self.fetches,
+            "cache_hits": self.cache_hits,
+            "background_refreshes": self.background_refreshes,
+            "expires_in_seconds": max(0, round(self._expires_at - time.monotonic())) if self._jwks else 0
+        }
+
+
+def find_key(jwks: Optional[dict], kid: Optional[str]) -> Optional[dict]:
+    """Localiza a chave pelo `kid` no JWKS"""
+    keys = (jwks or {}).get("keys", [])
+    for key in keys:
+        if kid is None or key.get("kid") == kid:
+            return key
+    return None
+
+# Instância global
+google_token_verifier = GoogleTokenVerifier()
@@ -0,0 +1,194 @@
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import Dict, List, Optional, Tuple, Union
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_WRITER_BATCH_SIZE = int(os.getenv("MESSAGE_WRITER_BATCH_SIZE", "100"))
+MESSAGE_WRITER_MAX_DELAY_MS = float(os.getenv("MESSAGE_WRITER_MAX_DELAY_MS", "5"))
+
+DUPLICATE_KEY = 11000
+
+# Documento a inserir ou atualização (UpdateOne)
+PendingWrite = Tuple[str, Union[dict, UpdateOne], asyncio.Future]
+
+
+def _retrieve(future: asyncio.Future):
+    # Gravações sem ninguém aguardando: falha já registrada no log
+    if not future.cancelled():
+        future.exception()
+
+
+class MessageWriter:
+    """
+    Gravação em lote (group commit) de mensagens de chat, logs de moderação e
+    resumos de chat
+    
+    Os documentos entram num buffer e são gravados com um `insert_many` por
+    coleção (atualizações, com um `bulk_write` ordenado) quando o lote enche
+    (`MESSAGE_WRITER_BATCH_SIZE`) ou quando o mais antigo espera
+    `MESSAGE_WRITER_MAX_DELAY_MS`. Cada gravação devolve um future resolvido
+    quando o lote é confirmado pelo MongoDB, usado para o ack de durabilidade
+    ao remetente. No desligamento o buffer é descarregado.
+    """
+    
+    def __init__(self, batch_size: int = MESSAGE_WRITER_BATCH_SIZE, max_delay_ms: float = MESSAGE_WRITER_MAX_DELAY_MS):
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.flush_ms_total = 0.0
+        self._db = None
+        self._buffer: List[PendingWrite] = []
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Future] = None
+    
+    def start(self, db):
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Para o laço e grava o que estiver no buffer"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        # Lote em andamento termina antes da descarga final
+        if self._flushing:
+            await self._flushing
+        while self._buffer:
+            await self._flush()
+    
+    def submit(self, collection: str, document: dict) -> asyncio.Future:
+        """Enfileira um documento; o future resolve quando ele estiver gravado"""
+        return self._enqueue(collection, document)
+    
+    def submit_update(self, collection: str, query: dict, update: dict) -> asyncio.Future:
+        """Enfileira um update_one; no mesmo lote, aplicados na ordem de chegada"""
+        return self._enqueue(collection, UpdateOne(query, update))
+    
+    def _enqueue(self, collection: str, operation: Union[dict, UpdateOne]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        self._buffer.append((collection, operation, future))
+        
+        if self._task is None:
+            # Sem o laço (ex.: fora do servidor): grava sem esperar lote
+            asyncio.create_task(self._flush())
+        elif len(self._buffer) >= self.batch_size:
+            self._full.set()
+        self._pending.set()
+        return future
+    
+    async def write(self, collection: str, document: dict):
+        """Grava um documento no próximo lote e aguarda a confirmação"""
+        await self.submit(collection, document)
+    
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            if len(self._buffer) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            # Cancelar o laço não interrompe um lote já enviado ao banco
+            self._flushing = asyncio.ensure_future(self._flush())
+            await asyncio.shield(self._flushing)
+    
+    async def _flush(self):
+        batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+        if not self._buffer:
+            self._pending.clear()
+        if len(self._buffer) < self.batch_size:
+            self._full.clear()
+        if not batch:
+            return
+        
+        started = time.perf_counter()
+        inserts: Dict[str, List[PendingWrite]] = {}
+        updates: Dict[str, List[PendingWrite]] = {}
+        for pending in batch:
+            group = updates if isinstance(pending[1], UpdateOne) else inserts
+            group.setdefault(pending[0], []).append(pending)
+        
+        await asyncio.gather(
+            *(self._insert(collection, pendings) for collection, pendings in inserts.items()),
+            *(self._update(collection, pendings) for collection, pendings in updates.items())
+        )
+        
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        self.flush_ms_total += (time.perf_counter() - started) * 1000
+    
+    async def _insert(self, collection: str, pendings: List[PendingWrite]):
+        errors: Dict[int, Exception] = {}
+        try:
+            await self._db[collection].insert_many([document for _, document, _ in pendings], ordered=False)
+        except BulkWriteError as e:
+            # Chave duplicada = documento já gravado (reenvio); demais falham
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != DUPLICATE_KEY:
+                    errors[error["index"]] = PyMongoError(error.get("errmsg", "Falha ao gravar"))
+        except Exception as e:
+            logger.error(f"Falha ao gravar lote de {len(pendings)} documentos em {collection}: {str(e)}")
+            errors = {index: e for index in range(len(pendings))}
+        
+        self._resolve(pendings, errors)
+    
+    async def _update(self, collection: str, pendings: List[PendingWrite]):
+        # Ordenado: atualizações do mesmo documento (ex.: última mensagem do
+        # chat) são aplicadas na ordem de chegada
+        errors: Dict[int, Exception] = {}
+        try:
+            await self._db[collection].bulk_write([operation for _, operation, _ in pendings], ordered=True)
+        except BulkWriteError as e:
+            # A primeira falha interrompe o lote: ela e as seguintes falham
+            failed = min((error["index"] for error in e.details.get("writeErrors", [])), default=0)
+            error = PyMongoError(e.details.get("writeErrors", [{}])[0].get("errmsg", "Falha ao gravar"))
+            errors = {index: error for index in range(failed, len(pendings))}
+        except Exception as e:
+            logger.error(f"Falha ao gravar lote de {len(pendings)} atualizações em {collection}: {str(e)}")
+            errors = {index: e for index in range(len(pendings))}
+        
+        self._resolve(pendings, errors)
+    
+    def _resolve(self, pendings: List[PendingWrite], errors: Dict[int, Exception]):
+        for index, (_, _, future) in enumerate(pendings):
+            if future.done():
+                continue
+            if index in errors:
+                self.failed += 1
+                future.set_exception(errors[index])
+            else:
+                self.written += 1
+                future.set_result(None)
+    
+    def snapshot(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "max_delay_ms": self.max_delay * 1000,
+            "buffered": len(self._buffer),
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "max_batch": self.max_batch,
+            "avg_batch": round(self.written / self.batches, 1) if self.batches else 0,
+            "avg_flush_ms": round(self.flush_ms_total / self.batches, 2) if self.batches else 0
+        }
+
+
+# Instância global
+message_writer = MessageWriter()
@@ -0,0 +1,230 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+MODERATION_WINDOW_SECONDS = float(os.getenv("MODERATION_WINDOW_SECONDS", "120"))
+MODERATION_WINDOW_SENDERS = int(os.getenv("MODERATION_WINDOW_SENDERS", "10000"))  # Remetentes com estado por worker
+MODERATION_RULES_REFRESH_SECONDS = float(os.getenv("MODERATION_RULES_REFRESH_SECONDS", "5"))
+
+# Regras padrão (nome -> regex), aplicadas ao texto normalizado (minúsculo). A
+# ordem desempata regras que casam na mesma posição. O email começa pelo "@"
+# (equivale a \S+@\S+\.\S+) para não ser tentado em toda posição do texto.
+DEFAULT_RULES: Dict[str, str] = {
+    "phone_number": r"\d{8,11}",
+    "email": r"@(?<=\S@)\S+\.\S+",
+    "url": r"http[s]?://|www\."
+}
+
+RULE_NAME = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+# Números por extenso (inclui "meia" = seis, comum ao ditar telefones)
+NUMBER_WORDS = {
+    "zero": "0", "um": "1", "uma": "1", "dois": "2", "duas": "2", "tres": "3",
+    "três": "3", "quatro": "4", "cinco": "5", "seis": "6", "meia": "6",
+    "sete": "7", "oito": "8", "nove": "9"
+}
+
+# Um dígito ou número por extenso. Cada alternativa começa por um literal, o que
+# deixa o regex descartar rápido as posições que não podem iniciar um número.
+_DIGIT = "(?:{})".format("|".join(
+    [str(digit) for digit in range(10)]
+    + [rf"{word[0]}(?<!\w{word[0]}){word[1:]}(?!\w)" for word in sorted(NUMBER_WORDS, key=len, reverse=True)]
+))
+
+# Sequências de dois ou mais números separados por espaços, pontos, hífens ou
+# parênteses, com os números por extenso trocados por dígitos
+# ("(11) nove 8765-4321" -> "(11) 9 8765-4321")
+_NUMBER_RUN = re.compile(rf"{_DIGIT}(?:[\s.\-()]*{_DIGIT})+")
+_NUMBER_WORD = re.compile(r"[^\W\d]+")
+
+# Grupos de dígitos separados só por espaços ou hífens, com DDD opcional entre
+# parênteses. Pontos não separam: datas, horários e valores ("15.03.2025",
+# "10.30", "1.500") nunca são emendados.
+_DIGIT_GROUPS = r"(?:\(\s*\d{2}\s*\)[\s\-]*)?\d+(?:[\s\-]+\d+)*"
+_PHONE_RUN = re.compile(r"\(\s*\d{2}\s*\)[\s\-]*\d+(?:[\s\-]+\d+)*|\d+(?:[\s\-]+\d+)+")
+_LEADING_GROUPS = re.compile(_DIGIT_GROUPS)
+_TRAILING_GROUPS = re.compile(_DIGIT_GROUPS + "$")
+_ANY_DIGIT = re.compile(r"\d")
+_NON_DIGITS = re.compile(r"\D+")
+
+
+def is_phone_shaped(digits: str) -> bool:
+    """DDD + número (10 ou 11 dígitos) ou celular sem DDD (9 dígitos, começa com 9)"""
+    return len(digits) in (10, 11) or (len(digits) == 9 and digits[0] == "9")
+
+def _join_phone(match: re.Match) -> str:
+    # Só emenda o que tem forma de telefone; datas, CEPs e listas de valores
+    # ("2025-03-15", "01310-100", "1500 2000") ficam como estão
+    digits = _NON_DIGITS.sub("", match.group())
+    return digits if is_phone_shaped(digits) else match.group()
+
+def _spell_numbers(match: re.Match) -> str:
+    return _NUMBER_WORD.sub(lambda word: NUMBER_WORDS.get(word.group(), word.group()), match.group())
+
+def normalize(text: str) -> str:
+    """
+    Texto minúsculo com números por extenso convertidos, sequências com forma
+    de telefone emendadas e "arroba" trocado por "@"
+    
+    A conversão de números por extenso (mais cara) só roda quando o texto tem
+    mais de um deles, ou um deles e algum dígito.
+    """
+    text = text.lower()
+    
+    words = NUMBER_WORDS.keys() & text.split()
+    has_digit = _ANY_DIGIT.search(text) is not None
+    if words and (len(words) > 1 or has_digit):
+        text = _NUMBER_RUN.sub(_spell_numbers, text)
+        has_digit = True
+    if has_digit:
+        text = _PHONE_RUN.sub(_join_phone, text)
+    
+    if " arroba " in text:
+        text = text.replace(" arroba ", "@")
+    return text
+
+def compile_rules(rules: Dict[str, str]) -> re.Pattern:
+    """Combina as regras num único regex com um grupo nomeado por regra"""
+    for name, pattern in rules.items():
+        if not RULE_NAME.match(name):
+            raise ValueError(f"Nome de regra inválido: {name}")
+        re.compile(pattern)
+    
+    return re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in rules.items()))
+
+
+class ModerationService:
+    """
+    Moderação de mensagens de chat em uma passada
+    
+    As regras são compiladas num único regex (um grupo nomeado por regra) e
+    aplicadas ao texto normalizado. Para pegar contatos divididos entre
+    mensagens, cada remetente de cada chat guarda os dígitos finais das suas
+    mensagens recentes (`MODERATION_WINDOW_SECONDS`); uma mensagem que começa
+    com dígitos é bloqueada se, emendada a eles, formar um telefone com DDD
+    (10 ou 11 dígitos).
+    
+    As regras podem ser trocadas em tempo de execução pela configuração da
+    plataforma (`moderation_rules`), relida a cada
+    `MODERATION_RULES_REFRESH_SECONDS`.
+    """
+    
+    def __init__(self, rules: Optional[Dict[str, str]] = None, window_seconds: float = MODERATION_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.checked = 0
+        self.blocked: Dict[str, int] = {}
+        self.blocked_split = 0
+        self.reloads = 0
+        self.rules: Dict[str, str] = {}
+        self._pattern: Optional[re.Pattern] = None
+        self._windows: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.load(rules)
+    
+    def load(self, rules: Optional[Dict[str, str]] = None):
+        """Compila e ativa um conjunto de regras (None = padrão); ValueError se inválido"""
+        rules = dict(rules or DEFAULT_RULES)
+        if rules == self.rules:
+            return
+        
+        try:
+            pattern = compile_rules(rules)
+        except re.error as e:
+            raise ValueError(f"Regex inválido: {str(e)}")
+        
+        self.rules, self._pattern = rules, pattern
+        self.reloads += 1
+        logger.info(f"Regras de moderação carregadas: {', '.join(rules)}")
+    
+    def start(self):
+        self._task = asyncio.create_task(self._refresh_loop())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _refresh_loop(self):
+        from services.config_service import config_service
+        
+        while True:
+            try:
+                config = await config_service.get()
+                self.load(config.get("moderation_rules"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao recarregar regras de moderação: {str(e)}")
+            await asyncio.sleep(MODERATION_RULES_REFRESH_SECONDS)
+    
+    def scan(self, text: str) -> Tuple[bool, Optional[str]]:
+        """Verifica uma mensagem isolada; retorna (bloqueada, regra)"""
+        match = self._pattern.search(normalize(text))
+        return (True, match.lastgroup) if match else (False, None)
+    
+    def check(self, chat_id: str, sender_id: str, text: str) -> Tuple[bool, Optional[str]]:
+        """Verifica a mensagem e, emendada às anteriores do remetente, contatos divididos"""
+        self.checked += 1
+        normalized = normalize(text)
+        key = (chat_id, sender_id)
+        now = time.monotonic()
+        
+        match = self._pattern.search(normalized)
+        reason = match.lastgroup if match else None
+        stripped = normalized.strip()
+        stripped = NUMBER_WORDS.get(stripped, stripped)
+        carry = ""
+        
+        if not reason and "phone_number" in self.rules:
+            tail, updated_at = self._windows.get(key, ("", 0.0))
+            if tail and now - updated_at <= self.window_seconds:
+                head = _LEADING_GROUPS.match(stripped)
+                if head:
+                    if len(tail) + len(_NON_DIGITS.sub("", head.group())) in (10, 11):
+                        reason = "phone_number"
+                        self.blocked_split += 1
+                    carry = tail
+        
+        if reason:
+            self._windows.pop(key, None)
+            self.blocked[reason] = self.blocked.get(reason, 0) + 1
+            return True, reason
+        
+        # Dígitos finais ficam para a próxima mensagem (mensagem só de dígitos acumula)
+        trailing = _TRAILING_GROUPS.search(stripped) if stripped[-1:].isdigit() else None
+        if trailing:
+            digits = _NON_DIGITS.sub("", trailing.group())
+            tail = carry + digits if trailing.start() == 0 else digits
+            if len(tail) < 11:
+                self._windows[key] = (tail, now)
+                self._windows.move_to_end(key)
+                if len(self._windows) > MODERATION_WINDOW_SENDERS:
+                    self._windows.popitem(last=False)
+                return False, None
+        
+        self._windows.pop(key, None)
+        return False, None
+    
+    def snapshot(self) -> dict:
+        return {
+            "rules": list(self.rules),
+            "reloads": self.reloads,
+            "checked": self.checked,
+            "blocked": dict(self.blocked),
+            "blocked_split": self.blocked_split,
+            "window_senders": len(self._windows)
+        }
+
+
+# Instância global
+moderation_service = ModerationService()
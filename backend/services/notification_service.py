@@ -4,6 +4,8 @@ import os
 import logging
 from typing import List, Optional, Dict
 from datetime import datetime, timezone
+from services.entity_cache import user_cache, job_cache
+from services.chat_connections import connection_manager
 
 logger = logging.getLogger(__name__)
 
@@ -202,31 +204,54 @@ class NotificationService:
 
 # Funções auxiliares para notificações específicas do negócio
 
+async def notify_user(user: Optional[dict], title: str, body: str, data: Dict):
+    """
+    Notifica um usuário: evento em tempo real no WebSocket (se conectado) e
+    push no dispositivo (se houver device token)
+    """
+    if not user:
+        return
+    
+    await connection_manager.notify_user(user["id"], {
+        "type": "notification",
+        "title": title,
+        "body": body,
+        "data": data
+    })
+    
+    if user.get("device_token"):
+        await NotificationService.send_notification(
+            token=user["device_token"],
+            title=title,
+            body=body,
+            data=data
+        )
+
+
 async def notify_new_proposal(db, proposal_id: str):
     """Notifica cliente sobre nova proposta recebida"""
     proposal = await db.proposals.find_one({"id": proposal_id}, {"_id": 0})
     if not proposal:
         return
     
-    job = await db.jobs.find_one({"id": proposal["job_id"]}, {"_id": 0})
+    job = await job_cache.get(proposal["job_id"])
     if not job:
         return
     
-    videomaker = await db.users.find_one({"id": proposal["videomaker_id"]}, {"_id": 0})
-    client = await db.users.find_one({"id": job["client_id"]}, {"_id": 0})
+    videomaker = await user_cache.get(proposal["videomaker_id"])
+    client = await user_cache.get(job["client_id"])
     
-    if client and client.get("device_token"):
-        await NotificationService.send_notification(
-            token=client["device_token"],
-            title="🎬 Nova Proposta Recebida!",
-            body=f"{videomaker.get('nome', 'Um videomaker')} enviou uma proposta de R$ {proposal['valor_proposto']:.2f}",
-            data={
-                "type": "new_proposal",
-                "proposal_id": proposal_id,
-                "job_id": job["id"],
-                "screen": "ProposalsScreen"
-            }
-        )
+    await notify_user(
+        client,
+        title="🎬 Nova Proposta Recebida!",
+        body=f"{videomaker.get('nome', 'Um videomaker')} enviou uma proposta de R$ {proposal['valor_proposto']:.2f}",
+        data={
+            "type": "new_proposal",
+            "proposal_id": proposal_id,
+            "job_id": job["id"],
+            "screen": "ProposalsScreen"
+        }
+    )
 
 
 async def notify_proposal_accepted(db, proposal_id: str):
@@ -235,21 +260,20 @@ async def notify_proposal_accepted(db, proposal_id: str):
     if not proposal:
         return
     
-    job = await db.jobs.find_one({"id": proposal["job_id"]}, {"_id": 0})
-    videomaker = await db.users.find_one({"id": proposal["videomaker_id"]}, {"_id": 0})
+    job = await job_cache.get(proposal["job_id"])
+    videomaker = await user_cache.get(proposal["videomaker_id"])
     
-    if videomaker and videomaker.get("device_token"):
-        await NotificationService.send_notification(
-            token=videomaker["device_token"],
-            title="🎉 Proposta Aceita!",
-            body=f"Sua proposta para '{job.get('titulo', 'o job')}' foi aceita!",
-            data={
-                "type": "proposal_accepted",
-                "proposal_id": proposal_id,
-                "job_id": job["id"],
-                "screen": "MyJobsScreen"
-            }
-        )
+    await notify_user(
+        videomaker,
+        title="🎉 Proposta Aceita!",
+        body=f"Sua proposta para '{job.get('titulo', 'o job')}' foi aceita!",
+        data={
+            "type": "proposal_accepted",
+            "proposal_id": proposal_id,
+            "job_id": job["id"],
+            "screen": "MyJobsScreen"
+        }
+    )
 
 
 async def notify_proposal_rejected(db, proposal_id: str):
@@ -258,20 +282,19 @@ async def notify_proposal_rejected(db, proposal_id: str):
     if not proposal:
         return
     
-    job = await db.jobs.find_one({"id": proposal["job_id"]}, {"_id": 0})
-    videomaker = await db.users.find_one({"id": proposal["videomaker_id"]}, {"_id": 0})
+    job = await job_cache.get(proposal["job_id"])
+    videomaker = await user_cache.get(proposal["videomaker_id"])
     
-    if videomaker and videomaker.get("device_token"):
-        await NotificationService.send_notification(
-            token=videomaker["device_token"],
-            title="❌ Proposta Não Aceita",
-            body=f"Sua proposta para '{job.get('titulo', 'o job')}' não foi selecionada desta vez.",
-            data={
-                "type": "proposal_rejected",
-                "proposal_id": proposal_id,
-                "job_id": job["id"]
-            }
-        )
+    await notify_user(
+        videomaker,
+        title="❌ Proposta Não Aceita",
+        body=f"Sua proposta para '{job.get('titulo', 'o job')}' não foi selecionada desta vez.",
+        data={
+            "type": "proposal_rejected",
+            "proposal_id": proposal_id,
+            "job_id": job["id"]
+        }
+    )
 
 
 async def notify_new_message(db, chat_id: str, sender_id: str, message_content: str):
@@ -283,24 +306,23 @@ async def notify_new_message(db, chat_id: str, sender_id: str, message_content:
     # Encontra o destinatário (não é o remetente)
     recipient_id = chat["client_id"] if chat["videomaker_id"] == sender_id else chat["videomaker_id"]
     
-    sender = await db.users.find_one({"id": sender_id}, {"_id": 0})
-    recipient = await db.users.find_one({"id": recipient_id}, {"_id": 0})
+    sender = await user_cache.get(sender_id)
+    recipient = await user_cache.get(recipient_id)
     
-    if recipient and recipient.get("device_token"):
-        # Truncar mensagem se muito longa
-        preview = message_content[:50] + "..." if len(message_content) > 50 else message_content
-        
-        await NotificationService.send_notification(
-            token=recipient["device_token"],
-            title=f"💬 {sender.get('nome', 'Alguém')}",
-            body=preview,
-            data={
-                "type": "new_message",
-                "chat_id": chat_id,
-                "sender_id": sender_id,
-                "screen": "ChatScreen"
-            }
-        )
+    # Truncar mensagem se muito longa
+    preview = message_content[:50] + "..." if len(message_content) > 50 else message_content
+    
+    await notify_user(
+        recipient,
+        title=f"💬 {sender.get('nome', 'Alguém')}",
+        body=preview,
+        data={
+            "type": "new_message",
+            "chat_id": chat_id,
+            "sender_id": sender_id,
+            "screen": "ChatScreen"
+        }
+    )
 
 
 async def notify_payment_released(db, payment_id: str):
@@ -309,37 +331,35 @@ async def notify_payment_released(db, payment_id: str):
     if not payment:
         return
     
-    videomaker = await db.users.find_one({"id": payment["videomaker_id"]}, {"_id": 0})
+    videomaker = await user_cache.get(payment["videomaker_id"])
     
-    if videomaker and videomaker.get("device_token"):
-        await NotificationService.send_notification(
-            token=videomaker["device_token"],
-            title="💰 Pagamento Liberado!",
-            body=f"Você recebeu R$ {payment['valor_videomaker']:.2f}",
-            data={
-                "type": "payment_released",
-                "payment_id": payment_id,
-                "amount": str(payment["valor_videomaker"])
-            }
-        )
+    await notify_user(
+        videomaker,
+        title="💰 Pagamento Liberado!",
+        body=f"Você recebeu R$ {payment['valor_videomaker']:.2f}",
+        data={
+            "type": "payment_released",
+            "payment_id": payment_id,
+            "amount": str(payment["valor_videomaker"])
+        }
+    )
 
 
 async def notify_job_completed(db, job_id: str):
     """Notifica cliente que o job foi marcado como concluído"""
-    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    job = await job_cache.get(job_id)
     if not job:
         return
     
-    client = await db.users.find_one({"id": job["client_id"]}, {"_id": 0})
+    client = await user_cache.get(job["client_id"])
     
-    if client and client.get("device_token"):
-        await NotificationService.send_notification(
-            token=client["device_token"],
-            title="✅ Job Concluído!",
-            body=f"O job '{job.get('titulo', 'seu job')}' foi marcado como concluído. Avalie o videomaker!",
-            data={
-                "type": "job_completed",
-                "job_id": job_id,
-                "screen": "RatingScreen"
-            }
-        )
+    await notify_user(
+        client,
+        title="✅ Job Concluído!",
+        body=f"O job '{job.get('titulo', 'seu job')}' foi marcado como concluído. Avalie o videomaker!",
+        data={
+            "type": "job_completed",
+            "job_id": job_id,
+            "screen": "RatingScreen"
+        }
+    )
@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from services.chat_broker import chat_broker, WORKER_ID
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL_SECONDS = float(os.getenv("PRESENCE_TTL_SECONDS", "60"))
+PRESENCE_HEARTBEAT_SECONDS = float(os.getenv("PRESENCE_HEARTBEAT_SECONDS", "20"))
+PRESENCE_MAX_USERS = int(os.getenv("PRESENCE_MAX_USERS", "100000"))  # Usuários com last_seen guardado
+TYPING_DEBOUNCE_SECONDS = float(os.getenv("TYPING_DEBOUNCE_SECONDS", "3"))
+TYPING_TTL_SECONDS = float(os.getenv("TYPING_TTL_SECONDS", "6"))  # Cliente apaga o indicador sem novo aviso
+
+# Canal do broker com os eventos de presença de todos os workers
+PRESENCE_CHANNEL = "presence"
+
+PresenceListener = Callable[[dict], Awaitable[None]]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class PresenceService:
+    """
+    Presença (online/offline) e indicador de digitação, só em memória
+    
+    Cada worker conta as conexões WebSocket locais de cada usuário e publica,
+    como evento efêmero do broker, quando o usuário entra ou sai;
+    periodicamente publica, num único evento, os usuários que continuam
+    conectados nele. O estado guarda, por usuário, até quando cada worker o
+    declarou online (TTL) — um worker que cai sem avisar expira sozinho.
+    
+    Nenhum estado de presença é gravado no MongoDB: com `CHAT_BROKER=mongo`,
+    os eventos efêmeros atravessam os workers pela coleção capped
+    `chat_ephemeral` do broker (sobrescrita em ciclo, sem consultas), nunca
+    por `chat_events`.
+    
+    O indicador de digitação é filtrado no servidor: por chat e usuário, no
+    máximo um aviso de "digitando" a cada `TYPING_DEBOUNCE_SECONDS`, e o aviso
+    de parada só sai se o início saiu.
+    """
+    
+    def __init__(self, ttl: float = PRESENCE_TTL_SECONDS, heartbeat_interval: float = PRESENCE_HEARTBEAT_SECONDS):
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.published = 0
+        self.typing_published = 0
+        self.typing_coalesced = 0
+        self._local: Dict[str, int] = {}  # user_id -> conexões neste worker
+        self._online: Dict[str, Dict[str, float]] = {}  # user_id -> worker -> expira em
+        self._last_seen: "OrderedDict[str, str]" = OrderedDict()
+        self._typing: Dict[Tuple[str, str], float] = {}  # (chat_id, user_id) -> último aviso
+        self._listeners: List[PresenceListener] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+    
+    def add_listener(self, listener: PresenceListener):
+        """Recebe os eventos de mudança de presença (online <-> offline)"""
+        self._listeners.append(listener)
+    
+    def start(self):
+        chat_broker.subscribe(PRESENCE_CHANNEL, self._receive)
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+    
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        chat_broker.unsubscribe(PRESENCE_CHANNEL, self._receive)
+    
+    def connected(self, user_id: str):
+        self._local[user_id] = self._local.get(user_id, 0) + 1
+        if self._local[user_id] == 1:
+            self._publish_soon({"type": "online", "worker": WORKER_ID, "user_id": user_id})
+    
+    def disconnected(self, user_id: str):
+        count = self._local.get(user_id, 0) - 1
+        if count > 0:
+            self._local[user_id] = count
+            return
+        
+        self._local.pop(user_id, None)
+        self._publish_soon({"type": "offline", "worker": WORKER_ID, "user_id": user_id, "last_seen": _now_iso()})
+    
+    def _publish_soon(self, event: dict):
+        # Chamado fora de corrotinas (desconexão); mantém referência até terminar
+        task = asyncio.create_task(self._publish(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _publish(self, event: dict):
+        self.published += 1
+        await chat_broker.publish(PRESENCE_CHANNEL, event, ephemeral=True)
+    
+    def is_online(self, user_id: str) -> bool:
+        # Entradas vencidas saem no próximo heartbeat (_expire)
+        return user_id in self._online
+    
+    def status(self, user_id: str) -> dict:
+        online = self.is_online(user_id)
+        return {
+            "type": "presence",
+            "user_id": user_id,
+            "online": online,
+            "last_seen": None if online else self._last_seen.get(user_id)
+        }
+    
+    async def _receive(self, channel: str, event: dict):
+        """Eventos de presença de qualquer worker (inclusive este)"""
+        worker = event.get("worker")
+        expires_at = time.monotonic() + self.ttl
+        
+        if event.get("type") == "heartbeat":
+            for user_id in event.get("user_ids", []):
+                await self._set_worker(user_id, worker, expires_at)
+        elif event.get("type") == "online":
+            await self._set_worker(event["user_id"], worker, expires_at)
+        elif event.get("type") == "offline":
+            await self._set_worker(event["user_id"], worker, None, event.get("last_seen"))
+    
+    async def _set_worker(self, user_id: str, worker: str, expires_at: Optional[float], last_seen: Optional[str] = None):
+        was_online = self.is_online(user_id)
+        
+        workers = self._online.setdefault(user_id, {})
+        if expires_at is None:
+            workers.pop(worker, None)
+        else:
+            workers[worker] = expires_at
+        if not workers:
+            del self._online[user_id]
+        
+        if was_online != self.is_online(user_id):
+            if was_online:
+                self._remember(user_id, last_seen or _now_iso())
+            await self._notify(user_id)
+    
+    def _remember(self, user_id: str, last_seen: str):
+        self._last_seen[user_id] = last_seen
+        self._last_seen.move_to_end(user_id)
+        if len(self._last_seen) > PRESENCE_MAX_USERS:
+            self._last_seen.popitem(last=False)
+    
+    async def _notify(self, user_id: str):
+        status = self.status(user_id)
+        for listener in self._listeners:
+            try:
+                await listener(status)
+            except Exception as e:
+                logger.warning(f"Erro ao entregar presença de {user_id}: {str(e)}")
+    
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                # Um evento por worker com todos os usuários conectados nele
+                if self._local:
+                    await self._publish({"type": "heartbeat", "worker": WORKER_ID, "user_ids": list(self._local)})
+                await self._expire()
+            except Exception as e:
+                logger.warning(f"Erro no heartbeat de presença: {str(e)}")
+    
+    async def _expire(self):
+        """Usuários cujos workers pararam de confirmar a presença ficam offline"""
+        now = time.monotonic()
+        for user_id, workers in list(self._online.items()):
+            for worker, expires_at in list(workers.items()):
+                if expires_at <= now:
+                    await self._set_worker(user_id, worker, None)
+    
+    def clear_typing(self, chat_id: str, user_id: str):
+        """Mensagem enviada encerra a digitação (o próximo aviso sai na hora)"""
+        self._typing.pop((chat_id, user_id), None)
+    
+    def typing_changed(self, chat_id: str, user_id: str, typing: bool) -> bool:
+        """Se o aviso de digitação deve ser publicado (debounce e coalescência)"""
+        key = (chat_id, user_id)
+        now = time.monotonic()
+        
+        if not typing:
+            # Parada só interessa se o início foi publicado
+            return self._typing.pop(key, None) is not None
+        
+        last = self._typing.get(key)
+        if last is not None and now - last < TYPING_DEBOUNCE_SECONDS:
+            self.typing_coalesced += 1
+            return False
+        
+        self._typing[key] = now
+        self.typing_published += 1
+        if len(self._typing) > PRESENCE_MAX_USERS:
+            cutoff = now - TYPING_TTL_SECONDS
+            self._typing = {k: t for k, t in self._typing.items() if t >= cutoff}
+        return True
+    
+    def snapshot(self) -> dict:
+        return {
+            "local_users": len(self._local),
+            "online_users": len(self._online),
+            "last_seen_users": len(self._last_seen),
+            "published": self.published,
+            "typing_published": self.typing_published,
+            "typing_coalesced": self.typing_coalesced
+        }
+
+
+# Instância global
+presence_service = PresenceService()
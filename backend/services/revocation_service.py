@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import os
+from services.auth_service import REFRESH_TOKEN_EXPIRE_DAYS
+from services.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "3600"))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+
+# Margem para não perder revogações gravadas fora de ordem por outros workers
+REFRESH_OVERLAP = timedelta(seconds=2)
+
+
+class BloomFilter:
+    """Filtro de Bloom simples (bytearray + double hashing com blake2b)"""
+    
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+    
+    def __contains__(self, item: str) -> bool:
+        for pos in self._positions(item):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class TokenRevocationList:
+    """
+    Lista de tokens revogados mantida em memória por worker.
+    
+    A fonte de verdade é a coleção `revoked_tokens` (com índice TTL em
+    `expires_at`). Cada worker mantém um filtro de Bloom com todas as chaves
+    revogadas e, para confirmar positivos, os conjuntos exatos:
+    
+    - jtis revogados individualmente (logout)
+    - usuários com corte por data de emissão (ban, troca de senha): todo token
+      desse usuário emitido até o corte é considerado revogado
+    
+    Quase todas as requisições terminam na primeira consulta ao Bloom, sem
+    acessar o banco. Revogações de outros workers chegam pela atualização
+    incremental periódica.
+    """
+    
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY):
+        self.capacity = capacity
+        self.bloom = BloomFilter(capacity)
+        self.revoked_jtis: Dict[str, float] = {}  # jti -> expira em (timestamp)
+        self.subject_cutoffs: Dict[str, float] = {}  # user_id -> revoga tokens com iat <= corte
+        self.checks = 0
+        self.bloom_positives = 0
+        self.revoked_hits = 0
+        self._db = None
+        self._last_seen: Optional[datetime] = None
+        self._last_rebuild = 0.0
+        self._task: Optional[asyncio.Task] = None
+    
+    def is_revoked(self, payload: dict) -> bool:
+        """Verifica se um token (payload já decodificado) foi revogado"""
+        self.checks += 1
+        
+        jti = payload.get("jti")
+        if jti and f"jti:{jti}" in self.bloom:
+            self.bloom_positives += 1
+            if jti in self.revoked_jtis:
+                self.revoked_hits += 1
+                return True
+        
+        sub = payload.get("sub")
+        if sub and f"sub:{sub}" in self.bloom:
+            self.bloom_positives += 1
+            cutoff = self.subject_cutoffs.get(sub)
+            # Tokens antigos sem iat são tratados como emitidos antes do corte
+            if cutoff is not None and payload.get("iat", 0) <= cutoff:
+                self.revoked_hits += 1
+                return True
+        
+        return False
+    
+    def _apply(self, doc: dict):
+        expires_at = doc["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        expires_ts = expires_at.timestamp()
+        
+        if expires_ts <= time.time():
+            return
+        
+        if doc["kind"] == "jti":
+            if doc["key"] not in self.revoked_jtis:
+                self.bloom.add(f"jti:{doc['key']}")
+            self.revoked_jtis[doc["key"]] = expires_ts
+        else:
+            sub = doc["key"]
+            if sub not in self.subject_cutoffs:
+                self.bloom.add(f"sub:{sub}")
+            self.subject_cutoffs[sub] = max(self.subject_cutoffs.get(sub, 0.0), doc["cutoff"])
+    
+    async def _store(self, doc: dict):
+        self._apply(doc)
+        if doc["kind"] == "subject":
+            token_cache.invalidate_subject(doc["key"])
+        
+        if self._db is not None:
+            await self._db.revoked_tokens.insert_one(dict(doc))
+    
+    async def revoke_token(self, payload: dict, reason: str):
+        """Revoga um token específico até o seu vencimento (logout)"""
+        if not payload.get("jti"):
+            return
+        
+        await self._store({
+            "kind": "jti",
+            "key": payload["jti"],
+            "sub": payload.get("sub"),
+            "reason": reason,
+            "revoked_at": datetime.now(timezone.utc),
+            "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc)
+        })
+    
+    async def revoke_subject(self, user_id: str, reason: str):
+        """Revoga todos os tokens já emitidos para o usuário (ban, troca de senha)"""
+        now = datetime.now(timezone.utc)
+        await self._store({
+            "kind": "subject",
+            "key": user_id,
+            "cutoff": time.time(),
+            "reason": reason,
+            "revoked_at": now,
+            # Depois do maior tempo de vida de um token, o corte não é mais necessário
+            "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        })
+    
+    async def start(self, db):
+        """Cria índices, carrega a lista completa e inicia a atualização incremental"""
+        self._db = db
+        await db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+        await db.revoked_tokens.create_index("revoked_at")
+        await self.rebuild()
+        self._task = asyncio.create_task(self._refresh_loop())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def rebuild(self):
+        """Recarrega tudo, descartando entradas vencidas e recriando o Bloom"""
+        started_at = datetime.now(timezone.utc)
+        docs = await self._db.revoked_tokens.find(
+            {"expires_at": {"$gt": started_at}},
+            {"_id": 0}
+        ).to_list(None)
+        
+        self.bloom = BloomFilter(max(self.capacity, len(docs) * 2))
+        self.revoked_jtis = {}
+        self.subject_cutoffs = {}
+        for doc in docs:
+            self._apply(doc)
+        
+        self._last_seen = started_at
+        self._last_rebuild = time.monotonic()
+    
+    async def refresh(self):
+        """Busca apenas revogações novas desde a última atualização"""
+        started_at = datetime.now(timezone.utc)
+        docs = await self._db.revoked_tokens.find(
+            {"revoked_at": {"$gte": self._last_seen - REFRESH_OVERLAP}},
+            {"_id": 0}
+        ).sort("revoked_at", 1).to_list(None)
+        
+        for doc in docs:
+            self._apply(doc)
+        
+        self._last_seen = started_at
+    
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(REVOCATION_REFRESH_SECONDS)
+            try:
+                if time.monotonic() - self._last_rebuild >= REVOCATION_REBUILD_SECONDS:
+                    await self.rebuild()
+                else:
+                    await self.refresh()
+            except Exception as e:
+                logger.error(f"Erro ao atualizar lista de revogação: {str(e)}")
+    
+    def snapshot(self) -> dict:
+        """Métricas da lista de revogação"""
+        return {
+            "revoked_tokens": len(self.revoked_jtis),
+            "revoked_subjects": len(self.subject_cutoffs),
+            "bloom_entries": self.bloom.count,
+            "checks": self.checks,
+            "bloom_positives": self.bloom_positives,
+            "revoked_hits": self.revoked_hits
+        }
+
+# Instância global
+revocation_list = TokenRevocationList()
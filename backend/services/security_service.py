@@ -1,4 +1,6 @@
 from models.security import AuditLog
+from services.entity_cache import user_cache, job_cache
+from services.chat_connections import connection_manager
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 import logging
@@ -67,7 +69,7 @@ class AuditService:
                 f"Audit log created: {user_email} ({user_role}) {action} {resource} "
                 f"{resource_id or ''} - {status}"
             )
-            
+        
         except Exception as e:
             logger.error(f"Failed to create audit log: {str(e)}")
             # Não lança exceção para não quebrar a operação principal
@@ -125,7 +127,7 @@ class BackupService:
             else:
                 logger.error(f"Backup failed: {result.stderr}")
                 return None
-                
+        
         except Exception as e:
             logger.error(f"Error creating backup: {str(e)}")
             return None
@@ -206,11 +208,28 @@ class LGPDService:
             }
             
             return export_data
-            
+        
         except Exception as e:
             logger.error(f"Error exporting user data: {str(e)}")
             return None
     
+    @staticmethod
+    async def _refresh_rating_summary(db, user_id: str):
+        summary = await db.ratings.aggregate([
+            {"$match": {"to_user_id": user_id}},
+            {"$group": {"_id": None, "rating_medio": {"$avg": "$rating"}, "total_avaliacoes": {"$sum": 1}}}
+        ]).to_list(1)
+        
+        await db.users.update_one(
+            {"id": user_id},
+            {"$set": {
+                "rating_medio": round(summary[0]["rating_medio"], 2) if summary else 0.0,
+                "total_avaliacoes": summary[0]["total_avaliacoes"] if summary else 0,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+        user_cache.invalidate(user_id)
+    
     @staticmethod
     async def delete_user_account(db, user_id: str):
         """
@@ -240,10 +259,12 @@ class LGPDService:
             # Deleta usuário
             result = await db.users.delete_one({"id": user_id})
             deleted_count["user"] = result.deleted_count
+            user_cache.invalidate(user_id)
             
             # Deleta jobs criados
             result = await db.jobs.delete_many({"client_id": user_id})
             deleted_count["jobs"] = result.deleted_count
+            job_cache.clear()
             
             # Deleta propostas
             result = await db.proposals.delete_many({"videomaker_id": user_id})
@@ -258,12 +279,19 @@ class LGPDService:
                 }}
             )
             
-            # Deleta avaliações
+            # Deleta avaliações (campos do modelo Rating)
+            rated_ids = await db.ratings.distinct("to_user_id", {"from_user_id": user_id})
             result = await db.ratings.delete_many(
-                {"$or": [{"avaliador_id": user_id}, {"avaliado_id": user_id}]}
+                {"$or": [{"from_user_id": user_id}, {"to_user_id": user_id}]}
             )
             deleted_count["ratings"] = result.deleted_count
             
+            # Quem foi avaliado pelo usuário tem o agregado recalculado (é o
+            # carimbo do ETag de GET /ratings/user/{id})
+            for rated_id in rated_ids:
+                if rated_id != user_id:
+                    await LGPDService._refresh_rating_summary(db, rated_id)
+            
             # Deleta chats
             chats = await db.chats.find(
                 {"$or": [{"client_id": user_id}, {"videomaker_id": user_id}]},
@@ -278,6 +306,10 @@ class LGPDService:
                 
                 result = await db.chats.delete_many({"id": {"$in": chat_ids}})
                 deleted_count["chats"] = result.deleted_count
+                
+                # Encerra sessões de WebSocket abertas nesses chats
+                for chat_id in chat_ids:
+                    await connection_manager.close_chat(chat_id)
             
             # Deleta device tokens
             result = await db.device_tokens.delete_many({"user_id": user_id})
@@ -298,7 +330,7 @@ class LGPDService:
                 "deleted_count": deleted_count,
                 "message": "Conta e todos dados relacionados foram deletados com sucesso"
             }
-            
+        
         except Exception as e:
             logger.error(f"Error deleting user account: {str(e)}")
             return {
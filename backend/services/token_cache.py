@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import hashlib
+import time
+import os
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+class TokenCache:
+    """
+    Cache LRU de access tokens já verificados.
+    
+    A chave é o SHA-256 do token (o token em si não fica em memória) e o valor é
+    o payload decodificado junto com o `exp`. Um token encontrado no cache e
+    ainda não expirado dispensa a verificação da assinatura.
+    """
+    
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+    
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token: str) -> Optional[dict]:
+        """Retorna o payload se o token já foi verificado e não expirou"""
+        key = self._key(token)
+        entry = self._entries.get(key)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        payload, exp = entry
+        if exp <= time.time():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+    
+    def put(self, token: str, payload: dict):
+        """Armazena o payload de um token verificado"""
+        exp = payload.get("exp")
+        if not exp:
+            return
+        
+        key = self._key(token)
+        self._entries[key] = (payload, float(exp))
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, token: str):
+        """Remove um token específico"""
+        self._entries.pop(self._key(token), None)
+    
+    def invalidate_subject(self, user_id: str) -> int:
+        """Remove todos os tokens de um usuário (ex: ban)"""
+        keys = [key for key, (payload, _) in self._entries.items() if payload.get("sub") == user_id]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def snapshot(self) -> dict:
+        """Métricas do cache"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions
+        }
+
+# Instância global (compartilhada por HTTP e WebSocket)
+token_cache = TokenCache()
@@ -0,0 +1,101 @@
+"""
+Benchmark da moderação de chat
+
+Compara a verificação antiga (três regex aplicados em sequência) com o serviço
+de moderação (normalização + regex combinado + janela por remetente) num corpus
+de mensagens com tamanhos de conversa real.
+
+Uso (a partir de backend/):
+    python tests/benchmark_moderation.py [--messages 20000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.moderation_service import ModerationService  # noqa: E402
+
+# Implementação anterior de utils/validators.contains_blocked_content
+PHONE_PATTERN = re.compile(r'\d{8,11}')
+EMAIL_PATTERN = re.compile(r'\S+@\S+\.\S+')
+URL_PATTERN = re.compile(r'http[s]?://|www\.')
+
+def legacy_contains_blocked_content(text):
+    if PHONE_PATTERN.search(text):
+        return True, "phone_number"
+    if EMAIL_PATTERN.search(text):
+        return True, "email"
+    if URL_PATTERN.search(text):
+        return True, "url"
+    return False, None
+
+
+SENTENCES = [
+    "Olá, tudo bem? Vi sua proposta e gostei bastante do portfólio.",
+    "Consegue chegar às 14h no local? O evento começa às 15h.",
+    "Vamos precisar de duas câmeras e um drone para as tomadas externas.",
+    "O orçamento ficou em R$ 1.500,00 com edição básica incluída.",
+    "Pode mandar uma prévia do vídeo até sexta-feira?",
+    "A cerimônia deve durar umas três horas, depois tem a festa.",
+    "Perfeito, combinado então. Qualquer dúvida me avisa por aqui.",
+    "Sobre a trilha sonora, prefiro algo mais calmo no início.",
+    "O endereço é o mesmo que está no job, no salão principal.",
+    "Obrigado pelo trabalho, ficou excelente!"
+]
+
+CONTACTS = [
+    "me liga no 11987654321",
+    "meu email é fulano@example.com",
+    "dá uma olhada em www.meusite.com.br",
+    "(11) 9 8765-4321",
+    "nove oito sete seis cinco quatro três dois um",
+    "fulano arroba gmail.com"
+]
+
+def build_corpus(size, seed=42):
+    """Mensagens de 1 a 4 frases (~60 a ~300 caracteres), 2% com contato"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        message = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.02:
+            message = f"{message} {rng.choice(CONTACTS)}"
+        corpus.append(message)
+    return corpus
+
+def measure(label, corpus, check):
+    started = time.perf_counter()
+    blocked = sum(1 for text in corpus if check(text)[0])
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed * 1000:8.1f} ms  {elapsed / len(corpus) * 1e6:6.2f} µs/msg  bloqueadas: {blocked}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+    
+    corpus = build_corpus(args.messages)
+    average = sum(len(text) for text in corpus) / len(corpus)
+    print(f"{len(corpus)} mensagens, {average:.0f} caracteres em média\n")
+    
+    service = ModerationService()
+    measure("antiga (3 regex)", corpus, legacy_contains_blocked_content)
+    measure("regex combinado (sem normalizar)", corpus, lambda text: (service._pattern.search(text) is not None, None))
+    measure("serviço: scan", corpus, service.scan)
+    measure("serviço: check (janela)", corpus, lambda text: service.check("chat", "sender", text))
+    
+    # Contatos que a verificação antiga deixa passar
+    split = ["me liga", "no (11) 98765", "4321"]
+    print("\nContato dividido em 3 mensagens:")
+    print(f"  antiga:  {[legacy_contains_blocked_content(text)[0] for text in split]}")
+    print(f"  serviço: {[service.check('chat', 'outro', text)[0] for text in split]}")
+
+
+if __name__ == "__main__":
+    main()
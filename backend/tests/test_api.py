@@ -233,3 +233,1140 @@ class TestChatModeration:
         is_blocked, reason = contains_blocked_content("Olá, tudo bem? Vamos agendar a gravação?")
         assert is_blocked is False
         assert reason is None
+    
+    def test_block_obfuscated_and_split_contacts(self):
+        """Testa números por extenso, contatos divididos entre mensagens e troca de regras"""
+        from services.moderation_service import ModerationService
+        
+        service = ModerationService()
+        assert service.scan("(11) nove 8765-4321") == (True, "phone_number")
+        assert service.scan("fulano arroba gmail.com") == (True, "email")
+        assert service.scan("Vou levar uma câmera e dois microfones, R$ 1.500,00") == (False, None)
+        
+        assert service.check("chat-1", "u1", "me chama no (11) 98765") == (False, None)
+        assert service.check("chat-1", "u2", "4321") == (False, None)  # Outro remetente
+        assert service.check("chat-1", "u1", "43 21") == (True, "phone_number")
+        assert service.scan("98765-4321") == (True, "phone_number")
+        
+        service.load({"instagram": r"@\w{3,}"})
+        assert service.scan("me segue @fulano_videos") == (True, "instagram")
+        assert service.scan("www.example.com") == (False, None)
+        
+        with pytest.raises(ValueError):
+            service.load({"quebrada": r"(\d"})
+        assert service.rules == {"instagram": r"@\w{3,}"}
+    
+    def test_allow_dates_times_and_amounts(self):
+        """Testa que datas, horários, CEPs e valores não são confundidos com telefone"""
+        from services.moderation_service import ModerationService
+        
+        service = ModerationService()
+        for text in [
+            "Gravação dia 2025-03-15",
+            "entrega 15.03.2025",
+            "das 10.30 - 12.30",
+            "CEP 01310-100",
+            "orçamento 1500 2000 ou 3000 reais",
+            "duas câmeras e um drone por 1500 2000"
+        ]:
+            assert service.scan(text) == (False, None), text
+        
+        assert service.check("chat-1", "u1", "meu orçamento é 1500") == (False, None)
+        assert service.check("chat-1", "u1", "2000 reais com drone") == (False, None)
+
+class TestLoopMonitor:
+    """Testes do monitor de event loop"""
+    
+    @pytest.mark.asyncio
+    async def test_detects_blocking_call(self):
+        """Testa que uma chamada bloqueante é detectada com rota e pilha"""
+        import asyncio
+        import time
+        from middleware.loop_monitor import LoopLagMonitor
+        
+        monitor = LoopLagMonitor(interval_ms=10, threshold_ms=50)
+        monitor.start()
+        
+        async def blocking_handler():
+            monitor.track({"type": "http", "method": "POST", "path": "/api/auth/login"})
+            time.sleep(0.3)  # Simula bcrypt síncrono no event loop
+        
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(blocking_handler())
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        
+        metrics = monitor.snapshot()
+        assert metrics["stalls_total"] >= 1
+        assert metrics["stalls_by_route"].get("POST /api/auth/login") == 1
+        assert any("blocking_handler" in line for line in metrics["recent_stalls"][-1]["stack"])
+
+class TestPasswordHasher:
+    """Testes do pool de hashing de senha"""
+    
+    @pytest.mark.asyncio
+    async def test_rehash_when_cost_changes(self):
+        """Testa que hash com custo antigo é refeito no login"""
+        from passlib.context import CryptContext
+        from services.auth_service import password_hasher, BCRYPT_ROUNDS
+        
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("senha123")
+        
+        valid, new_hash = await password_hasher.verify("senha123", old_hash)
+        assert valid is True
+        assert new_hash.split("$")[2] == f"{BCRYPT_ROUNDS:02d}"
+        
+        valid, new_hash = await password_hasher.verify("senha_errada", old_hash)
+        assert valid is False
+        assert new_hash is None
+    
+    @pytest.mark.asyncio
+    async def test_rejects_when_saturated(self):
+        """Testa rejeição imediata quando o pool está cheio"""
+        import asyncio
+        import time
+        from services.auth_service import PasswordHasher, PasswordHasherBusy
+        
+        hasher = PasswordHasher(max_workers=1, max_queue=0)
+        running = asyncio.ensure_future(hasher._run(time.sleep, 0.2))
+        await asyncio.sleep(0)
+        
+        with pytest.raises(PasswordHasherBusy):
+            await hasher._run(time.sleep, 0.2)
+        
+        await running
+        assert hasher.snapshot()["rejected"] == 1
+        assert hasher.snapshot()["pending"] == 0
+
+class TestTokenCache:
+    """Testes do cache de tokens verificados"""
+    
+    def test_repeat_token_hits_cache(self):
+        """Testa que o mesmo token só é verificado uma vez"""
+        from services.auth_service import create_access_token
+        from services.token_cache import token_cache
+        from middleware.auth_middleware import authenticate_token
+        
+        token = create_access_token(data={"sub": "user-cache", "email": "c@example.com", "role": "client"})
+        hits_before = token_cache.hits
+        
+        first = authenticate_token(token)
+        second = authenticate_token(token)
+        
+        assert first["sub"] == second["sub"] == "user-cache"
+        assert token_cache.hits == hits_before + 1
+    
+    def test_expired_token_is_not_served(self):
+        """Testa que o cache respeita o exp"""
+        import time
+        from services.token_cache import TokenCache
+        
+        cache = TokenCache(maxsize=2)
+        cache.put("expirado", {"sub": "u1", "exp": time.time() - 1})
+        assert cache.get("expirado") is None
+        
+        cache.put("a", {"sub": "u1", "exp": time.time() + 60})
+        cache.put("b", {"sub": "u2", "exp": time.time() + 60})
+        cache.put("c", {"sub": "u3", "exp": time.time() + 60})
+        assert cache.get("a") is None  # Removido pelo LRU
+        assert cache.invalidate_subject("u2") == 1
+        assert cache.get("b") is None
+
+class TestTokenRevocation:
+    """Testes da lista de revogação de tokens"""
+    
+    @pytest.mark.asyncio
+    async def test_logout_revokes_only_that_token(self):
+        """Testa revogação por jti"""
+        from services.auth_service import create_access_token, decode_token
+        from services.revocation_service import TokenRevocationList
+        
+        revocations = TokenRevocationList(capacity=1000)
+        token_a = decode_token(create_access_token(data={"sub": "u1"}))
+        token_b = decode_token(create_access_token(data={"sub": "u1"}))
+        
+        await revocations.revoke_token(token_a, reason="logout")
+        
+        assert revocations.is_revoked(token_a) is True
+        assert revocations.is_revoked(token_b) is False
+    
+    @pytest.mark.asyncio
+    async def test_ban_revokes_tokens_issued_before(self):
+        """Testa revogação por usuário (corte por data de emissão)"""
+        from services.auth_service import create_access_token, create_refresh_token, decode_token
+        from services.revocation_service import TokenRevocationList
+        
+        revocations = TokenRevocationList(capacity=1000)
+        access = decode_token(create_access_token(data={"sub": "u2"}))
+        refresh = decode_token(create_refresh_token(data={"sub": "u2"}), "refresh")
+        other_user = decode_token(create_access_token(data={"sub": "u3"}))
+        
+        await revocations.revoke_subject("u2", reason="ban")
+        new_access = decode_token(create_access_token(data={"sub": "u2"}))
+        
+        assert revocations.is_revoked(access) is True
+        assert revocations.is_revoked(refresh) is True
+        assert revocations.is_revoked(other_user) is False
+        assert revocations.is_revoked(new_access) is False
+    
+    def test_bloom_filter(self):
+        """Testa que o filtro de Bloom não tem falsos negativos"""
+        from services.revocation_service import BloomFilter
+        
+        bloom = BloomFilter(capacity=1000)
+        for i in range(1000):
+            bloom.add(f"jti:{i}")
+        
+        assert all(f"jti:{i}" in bloom for i in range(1000))
+        false_positives = sum(f"outro:{i}" in bloom for i in range(10000))
+        assert false_positives < 100
+
+
+class TestGoogleTokenVerifier:
+    """Testes da verificação local de tokens do Google"""
+    
+    @staticmethod
+    def _make_keys():
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives import serialization
+        from jose import jwk
+        
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        public_jwk = jwk.construct(public_pem, "RS256").to_dict()
+        public_jwk.update({"kid": "k1", "use": "sig"})
+        return private_pem, {"keys": [public_jwk]}
+    
+    @pytest.mark.asyncio
+    async def test_verify_uses_cached_certs(self):
+        """Testa que os certificados são buscados uma vez e reutilizados"""
+        import httpx
+        import time
+        from jose import jwt
+        from services.google_auth_service import GoogleTokenVerifier
+        
+        private_pem, jwks = self._make_keys()
+        requests_made = []
+        
+        def handler(request):
+            requests_made.append(request)
+            return httpx.Response(200, json=jwks, headers={"Cache-Control": "public, max-age=3600"})
+        
+        verifier = GoogleTokenVerifier(
+            certs_url="https://certs.test/keys",
+            audience="client-id",
+            transport=httpx.MockTransport(handler)
+        )
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": "client-id",
+            "email": "user@example.com",
+            "exp": int(time.time()) + 600
+        }
+        token = jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": "k1"})
+        
+        for _ in range(3):
+            idinfo = await verifier.verify(token)
+            assert idinfo["email"] == "user@example.com"
+        
+        assert len(requests_made) == 1
+        
+        wrong_audience = jwt.encode({**claims, "aud": "outro"}, private_pem, algorithm="RS256", headers={"kid": "k1"})
+        with pytest.raises(ValueError):
+            await verifier.verify(wrong_audience)
+        
+        wrong_issuer = jwt.encode({**claims, "iss": "evil.com"}, private_pem, algorithm="RS256", headers={"kid": "k1"})
+        with pytest.raises(ValueError):
+            await verifier.verify(wrong_issuer)
+        
+        await verifier.close()
+    
+    def test_parse_max_age(self):
+        """Testa leitura do max-age do Cache-Control"""
+        from services.google_auth_service import parse_max_age, DEFAULT_MAX_AGE_SECONDS
+        
+        assert parse_max_age("public, max-age=19845, must-revalidate") == 19845
+        assert parse_max_age(None) == DEFAULT_MAX_AGE_SECONDS
+
+
+class TestRateLimiter:
+    """Testes do rate limiter de janela deslizante"""
+    
+    def test_sliding_window(self):
+        """Testa bloqueio ao exceder o limite e liberação gradual"""
+        from middleware.rate_limiter import RateLimiter
+        
+        limiter = RateLimiter()
+        results = [limiter.hit("ip:1", limit=5, window_seconds=60, now=1000 * 60 + t)[0] for t in range(6)]
+        assert results == [True] * 5 + [False]
+        
+        allowed, retry_after = limiter.hit("ip:1", limit=5, window_seconds=60, now=1000 * 60 + 10)
+        assert allowed is False
+        assert 0 < retry_after <= 120
+        
+        # Na janela seguinte a anterior ainda pesa proporcionalmente
+        assert limiter.hit("ip:1", limit=5, window_seconds=60, now=1001 * 60 + 1)[0] is False
+        assert limiter.hit("ip:1", limit=5, window_seconds=60, now=1001 * 60 + 30)[0] is True
+    
+    def test_cost_and_bounded_keys(self):
+        """Testa custo por rota e limite de chaves em memória"""
+        from middleware.rate_limiter import RateLimiter, route_cost
+        
+        limiter = RateLimiter(max_keys=100)
+        for i in range(1000):
+            limiter.hit(f"ip:{i}", limit=10, window_seconds=60, now=60.0)
+        assert limiter.snapshot()["keys"] == 100
+        
+        assert limiter.hit("user:a", limit=10, window_seconds=60, cost=10, now=60.0)[0] is True
+        assert limiter.hit("user:a", limit=10, window_seconds=60, now=60.0)[0] is False
+        assert route_cost("/api/security/lgpd/export-my-data") == 10
+        assert route_cost("/api/jobs") == 1
+    
+    @pytest.mark.asyncio
+    async def test_shared_counts_from_other_workers(self):
+        """Testa que consumos de outros workers entram na estimativa"""
+        from middleware.rate_limiter import MongoRateLimitStorage
+        
+        storage = MongoRateLimitStorage(db=None)
+        now = 1000 * 60 + 1
+        assert storage.hit("login:ip:1", limit=5, window_seconds=60, now=now)[0] is True
+        
+        # Contagem global lida do banco: 4 consumos de outros workers
+        storage._remote["login:ip:1|1000"] = 4
+        assert storage.hit("login:ip:1", limit=5, window_seconds=60, now=now)[0] is False
+        assert storage._pending == {"login:ip:1|1000": 1}
+
+
+class TestAdmissionControl:
+    """Testes do controle de admissão"""
+    
+    def test_sheds_low_priority_under_pressure(self):
+        """Testa descarte por prioridade quando o banco está lento"""
+        from middleware.admission_control import AdmissionController, DbLatencyTracker, classify
+        
+        tracker = DbLatencyTracker()
+        controller = AdmissionController(tracker, target_latency_ms=100)
+        analytics = classify("/api/admin/analytics/growth")
+        search = classify("/api/search/videomakers")
+        payments = classify("/api/payments/hold")
+        
+        assert controller.try_acquire(analytics) is None
+        controller.release(analytics)
+        
+        tracker.ewma_ms = 250  # Pressão nível 2
+        assert controller.try_acquire(analytics) is not None
+        assert controller.try_acquire(search) is not None
+        assert controller.try_acquire(payments) is None
+        assert controller.snapshot()["shed"] == {"admin_analytics:pressure": 1, "search:pressure": 1}
+    
+    def test_concurrency_limit(self):
+        """Testa limite de concorrência por classe"""
+        from middleware.admission_control import AdmissionController, DbLatencyTracker, classify
+        
+        controller = AdmissionController(DbLatencyTracker())
+        exports = classify("/api/security/lgpd/export-my-data")
+        
+        results = [controller.try_acquire(exports) for _ in range(exports.max_concurrency + 1)]
+        assert results[:-1] == [None] * exports.max_concurrency
+        assert results[-1] == 1
+
+
+class TestConfigCache:
+    """Testes do cache de configuração da plataforma"""
+    
+    @pytest.mark.asyncio
+    async def test_cached_config_and_versions(self):
+        """Testa leitura sem banco enquanto fresco e descarte de versões antigas"""
+        from services.config_service import PlatformConfigService
+        
+        service = PlatformConfigService(ttl=60)
+        service._set({"id": "platform_config", "taxa_comissao": 0.2, "version": 2})
+        
+        config = await service.get()
+        assert config["taxa_comissao"] == 0.2
+        config["taxa_comissao"] = 0.9  # Cópia: não altera o cache
+        
+        service._set({"id": "platform_config", "taxa_comissao": 0.1, "version": 1})
+        assert (await service.get())["taxa_comissao"] == 0.2
+        
+        service._set({"id": "platform_config", "taxa_comissao": 0.15, "version": 3})
+        assert (await service.get())["taxa_comissao"] == 0.15
+        assert service.snapshot()["hits"] == 3
+
+
+class TestEntityCache:
+    """Testes do cache de usuários e jobs"""
+    
+    @pytest.mark.asyncio
+    async def test_read_through_and_invalidation(self):
+        """Testa acertos por projeção e invalidação após escrita"""
+        from services.entity_cache import EntityCache
+        
+        class FakeCollection:
+            def __init__(self):
+                self.docs = {"u1": {"_id": 1, "id": "u1", "nome": "Ana", "email": "ana@example.com"}}
+                self.reads = 0
+            
+            async def find_one(self, query, projection=None):
+                self.reads += 1
+                doc = self.docs.get(query["id"])
+                if doc and projection:
+                    doc = {k: v for k, v in doc.items() if k == "_id" or projection.get(k)}
+                return dict(doc) if doc else None
+        
+        collection = FakeCollection()
+        cache = EntityCache("users", maxsize=10, ttl=60)
+        cache._db = {"users": collection}
+        
+        user = await cache.get("u1")
+        user["nome"] = "Alterado"  # Cópia: não altera o cache
+        assert (await cache.get("u1"))["nome"] == "Ana"
+        assert "_id" not in user
+        assert await cache.get("u1", {"_id": 0, "nome": 1}) == {"nome": "Ana"}
+        assert collection.reads == 2
+        
+        collection.docs["u1"]["nome"] = "Ana Maria"
+        cache.invalidate("u1")
+        assert (await cache.get("u1"))["nome"] == "Ana Maria"
+        assert await cache.get("inexistente") is None
+        
+        stats = cache.snapshot()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 4
+
+
+class TestSerialization:
+    """Testes da serialização rápida de respostas"""
+    
+    def test_fast_path_is_byte_compatible(self):
+        """Testa que a resposta rápida é idêntica à gerada via response_model"""
+        from fastapi import FastAPI
+        from fastapi.responses import ORJSONResponse
+        from fastapi.testclient import TestClient
+        from typing import List
+        from datetime import datetime
+        from models.job import JobResponse, JobLocation
+        from utils.serialization import model_list_response
+        
+        documents = [{
+            "id": "j1",
+            "client_id": "c1",
+            "titulo": "Vídeo de casamento",
+            "descricao": "Cerimônia e festa",
+            "categoria": "casamento",
+            "data_gravacao": "2025-03-01T15:30:00+00:00",
+            "duracao_horas": 4,
+            "local": {"endereco": "Rua A, 1", "cidade": "São Paulo", "estado": "SP", "latitude": -23.5, "longitude": -46},
+            "valor_minimo": 480.5,
+            "status": "open",
+            "created_at": "2025-01-10T08:00:00.123456+00:00",
+            "updated_at": datetime(2025, 1, 10, 9, 0)
+        }]
+        
+        app = FastAPI(default_response_class=ORJSONResponse)
+        
+        @app.get("/lento", response_model=List[JobResponse])
+        async def slow():
+            return [
+                JobResponse(
+                    id=doc["id"],
+                    client_id=doc["client_id"],
+                    titulo=doc["titulo"],
+                    descricao=doc["descricao"],
+                    categoria=doc["categoria"],
+                    data_gravacao=datetime.fromisoformat(doc["data_gravacao"]),
+                    duracao_horas=doc["duracao_horas"],
+                    local=JobLocation(**doc["local"]),
+                    extras=doc.get("extras", []),
+                    valor_minimo=doc["valor_minimo"],
+                    status=doc["status"],
+                    videomaker_id=doc.get("videomaker_id"),
+                    created_at=datetime.fromisoformat(doc["created_at"]),
+                    updated_at=doc["updated_at"]
+                )
+                for doc in documents
+            ]
+        
+        @app.get("/rapido", response_model=List[JobResponse])
+        async def fast():
+            return model_list_response(JobResponse, documents, defaults={"extras": []})
+        
+        client = TestClient(app)
+        slow_response = client.get("/lento")
+        fast_response = client.get("/rapido")
+        
+        assert fast_response.content == slow_response.content
+        assert fast_response.headers["content-type"] == slow_response.headers["content-type"]
+
+class TestFieldSelection:
+    """Testes da seleção de campos (?fields=)"""
+    
+    def test_projection_and_role_whitelist(self):
+        """Testa whitelist por role e projeção gerada"""
+        from fastapi import HTTPException
+        from utils.field_selection import parse_fields, build_projection
+        
+        selected = parse_fields("videomakers", "nome, rating_medio,nome")
+        assert selected == ["id", "nome", "rating_medio"]
+        assert build_projection(selected, extra=("latitude",)) == {
+            "_id": 0, "id": 1, "nome": 1, "rating_medio": 1, "latitude": 1
+        }
+        assert build_projection(None) == {"_id": 0}
+        
+        # Contato só para admin
+        with pytest.raises(HTTPException) as exc:
+            parse_fields("videomakers", "nome,email", "client")
+        assert exc.value.status_code == 400
+        assert "email" in parse_fields("videomakers", "nome,email", "admin")
+        
+        # Recurso administrativo não aceita seleção de outras roles
+        with pytest.raises(HTTPException):
+            parse_fields("admin_payments", "valor", "client")
+    
+    def test_list_response_only_selected(self):
+        """Testa que a resposta serializa apenas os campos pedidos"""
+        import json
+        from models.user import UserResponse, USER_RESPONSE_DEFAULTS
+        from utils.serialization import model_list_response
+        
+        documents = [{"id": "u1", "nome": "Ana", "rating_medio": 4}]
+        response = model_list_response(
+            UserResponse, documents, defaults=USER_RESPONSE_DEFAULTS, fields=["id", "nome", "rating_medio"]
+        )
+        
+        assert json.loads(response.body) == [{"id": "u1", "nome": "Ana", "rating_medio": 4.0}]
+
+class TestHttpCache:
+    """Testes de ETag e GET condicional"""
+    
+    def test_conditional_get(self):
+        """Testa 304 com If-None-Match e comparação fraca"""
+        from fastapi import FastAPI, Request
+        from fastapi.testclient import TestClient
+        from utils.http_cache import cached_json, etag_matches, make_etag
+        
+        app = FastAPI()
+        
+        @app.get("/facetas")
+        async def facets(request: Request):
+            return cached_json(request, [{"name": "casamento", "count": 3}], "facets")
+        
+        client = TestClient(app)
+        first = client.get("/facetas")
+        etag = first.headers["etag"]
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == "public, max-age=300"
+        
+        second = client.get("/facetas", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+        
+        stamp = make_etag({"id": "u1", "updated_at": "2024-01-01"})
+        assert etag_matches(f'"x", {stamp[2:]}', stamp)
+        assert not etag_matches(make_etag({"id": "u1", "updated_at": "2024-01-02"}), stamp)
+
+class TestCompression:
+    """Testes do middleware de compressão"""
+    
+    def test_thresholds_types_and_streaming(self):
+        """Testa limite de tamanho, tipos já comprimidos, exclusões e streams"""
+        from fastapi import FastAPI, Response
+        from fastapi.responses import StreamingResponse
+        from fastapi.testclient import TestClient
+        from middleware.compression import CompressionMiddleware, ResponseCompressor, choose_encoding
+        
+        app = FastAPI()
+        compressor = ResponseCompressor(min_size=100, route_min_size={"/api/auth/": None})
+        app.add_middleware(CompressionMiddleware, compressor=compressor)
+        big = b'{"items": "' + b"x" * 5000 + b'"}'
+        
+        @app.get("/grande")
+        async def large():
+            return Response(big, media_type="application/json")
+        
+        @app.get("/pequeno")
+        async def small():
+            return Response(b'{"ok": true}', media_type="application/json")
+        
+        @app.get("/video")
+        async def video():
+            return Response(b"\x00" * 5000, media_type="video/mp4")
+        
+        @app.get("/api/auth/me")
+        async def auth():
+            return Response(big, media_type="application/json")
+        
+        @app.get("/stream")
+        async def stream():
+            async def chunks():
+                for _ in range(3):
+                    yield b"linha," * 200
+            return StreamingResponse(chunks(), media_type="text/csv")
+        
+        client = TestClient(app)
+        headers = {"Accept-Encoding": "gzip"}
+        
+        raw = client.get("/grande", headers=headers)
+        assert raw.headers["content-encoding"] == "gzip"
+        assert raw.headers["vary"] == "Accept-Encoding"
+        assert raw.content == big
+        
+        assert "content-encoding" not in client.get("/pequeno", headers=headers).headers
+        assert "content-encoding" not in client.get("/video", headers=headers).headers
+        assert "content-encoding" not in client.get("/api/auth/me", headers=headers).headers
+        
+        streamed = client.get("/stream", headers=headers)
+        assert streamed.headers["content-encoding"] == "gzip"
+        assert streamed.content == b"linha," * 600
+        
+        assert choose_encoding("gzip;q=0, identity") is None
+        assert compressor.snapshot()["streamed"] == 1
+
+class TestIdempotency:
+    """Testes do middleware de Idempotency-Key"""
+    
+    @pytest.mark.asyncio
+    async def test_duplicates_wait_and_replay(self):
+        """Testa que requisições repetidas esperam a primeira e recebem a mesma resposta"""
+        import asyncio
+        import httpx
+        from fastapi import FastAPI, Request
+        from middleware.idempotency import IdempotencyMiddleware, IdempotencyStore
+        from services.auth_service import create_access_token
+        
+        app = FastAPI()
+        store = IdempotencyStore()
+        app.add_middleware(IdempotencyMiddleware, store=store)
+        executions = []
+        
+        @app.post("/pagamentos", status_code=201)
+        async def create(request: Request):
+            executions.append(await request.json())
+            await asyncio.sleep(0.05)
+            return {"id": len(executions)}
+        
+        token = create_access_token({"sub": "user-1", "role": "client"})
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "abc"}
+        
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first, second = await asyncio.gather(
+                client.post("/pagamentos", json={"valor": 10}, headers=headers),
+                client.post("/pagamentos", json={"valor": 10}, headers=headers)
+            )
+            retry = await client.post("/pagamentos", json={"valor": 10}, headers=headers)
+            conflict = await client.post("/pagamentos", json={"valor": 20}, headers=headers)
+            query_conflict = await client.post("/pagamentos?parcelas=3", json={"valor": 10}, headers=headers)
+        
+        assert len(executions) == 1
+        assert first.status_code == second.status_code == retry.status_code == 201
+        assert first.json() == second.json() == retry.json() == {"id": 1}
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert conflict.status_code == 422
+        assert query_conflict.status_code == 422
+
+class TestChatBroker:
+    """Testes do broker de eventos de chat"""
+    
+    @pytest.mark.asyncio
+    async def test_local_and_remote_delivery(self):
+        """Testa entrega local e filtragem de eventos vindos de outros workers"""
+        from services.chat_broker import ChatBroker, WORKER_ID
+        
+        broker = ChatBroker(backend="local")
+        received = []
+        
+        async def handler(chat_id, event):
+            received.append((chat_id, event["type"]))
+        
+        broker.subscribe("chat-1", handler)
+        await broker.publish("chat-1", {"type": "message"})
+        await broker.publish("chat-2", {"type": "message"})
+        
+        # Eventos de outros workers: só chats com conexão local, nunca os próprios
+        await broker._receive({"chat_id": "chat-1", "origin": "outro", "event": {"type": "remoto"}})
+        await broker._receive({"chat_id": "chat-1", "origin": WORKER_ID, "event": {"type": "eco"}})
+        await broker._receive({"chat_id": "chat-3", "origin": "outro", "event": {"type": "remoto"}})
+        
+        assert received == [("chat-1", "message"), ("chat-1", "remoto")]
+        assert broker.snapshot()["dropped_remote"] == 1
+        
+        broker.unsubscribe("chat-1", handler)
+        assert not broker.is_subscribed("chat-1")
+    
+    @pytest.mark.asyncio
+    async def test_mongo_publish_is_buffered(self):
+        """Testa que publicar não espera o banco e que os eventos são gravados em lote"""
+        import asyncio
+        from types import SimpleNamespace
+        from services.chat_broker import ChatBroker
+        
+        class FakeEvents:
+            def __init__(self):
+                self.batches = []
+            
+            async def insert_many(self, documents, ordered=True):
+                self.batches.append([document["event"]["n"] for document in documents])
+        
+        broker = ChatBroker(backend="mongo")
+        broker._db = SimpleNamespace(chat_events=FakeEvents(), chat_ephemeral=FakeEvents())
+        broker._flusher = asyncio.create_task(broker._flush_loop())
+        
+        for n in range(3):
+            await broker.publish("chat-1", {"type": "message", "n": n})
+        assert broker._db.chat_events.batches == []
+        
+        await asyncio.sleep(0.05)
+        assert broker._db.chat_events.batches == [[0, 1, 2]]
+        
+        await broker.publish("chat-1", {"type": "message", "n": 3})
+        await broker.publish("presence", {"type": "online", "n": 4}, ephemeral=True)
+        await broker.stop()
+        assert broker._db.chat_events.batches == [[0, 1, 2], [3]]
+        assert broker._db.chat_ephemeral.batches == [[4]]  # Efêmeros só na coleção capped
+    
+    @pytest.mark.asyncio
+    async def test_ephemeral_events_from_other_workers(self):
+        """Testa a entrega de eventos efêmeros de outros workers pelo cursor tailable"""
+        import asyncio
+        from datetime import datetime, timezone
+        from types import SimpleNamespace
+        from services.chat_broker import ChatBroker
+        
+        class FakeCursor:
+            def __init__(self, documents):
+                self.documents = documents
+            
+            @property
+            def alive(self):
+                return bool(self.documents)
+            
+            def __aiter__(self):
+                return self
+            
+            async def __anext__(self):
+                if not self.documents:
+                    raise StopAsyncIteration
+                return self.documents.pop(0)
+        
+        queries = []
+        
+        def find(query, cursor_type=None):
+            queries.append(query)
+            return FakeCursor([{
+                "chat_id": "presence",
+                "origin": "outro-worker",
+                "event": {"type": "online", "worker": "outro-worker", "user_id": "u1"},
+                "created_at": datetime.now(timezone.utc).replace(tzinfo=None)
+            }] if len(queries) == 1 else [])
+        
+        received = []
+        
+        async def handler(channel, event):
+            received.append(event["user_id"])
+        
+        broker = ChatBroker(backend="mongo")
+        broker._db = SimpleNamespace(chat_ephemeral=SimpleNamespace(find=find))
+        broker.subscribe("presence", handler)
+        tail = asyncio.create_task(broker._tail_ephemeral())
+        await asyncio.sleep(0.01)
+        tail.cancel()
+        
+        assert received == ["u1"]
+        assert queries[0]["origin"] == {"$ne": broker.snapshot()["worker_id"]}
+    
+    @pytest.mark.asyncio
+    async def test_mongo_watch_filters_local_channels_and_requeues(self):
+        """Testa o filtro do change stream pelos canais locais e a nova tentativa de lote"""
+        import asyncio
+        from types import SimpleNamespace
+        from pymongo.errors import AutoReconnect
+        from services.chat_broker import ChatBroker
+        
+        class FakeStream:
+            resume_token = {"_data": "1"}
+            
+            async def __aenter__(self):
+                return self
+            
+            async def __aexit__(self, *args):
+                pass
+            
+            async def try_next(self):
+                await asyncio.sleep(0.001)
+                return None
+        
+        class FakeEvents:
+            def __init__(self):
+                self.pipelines = []
+                self.failures = 1
+                self.batches = []
+            
+            def watch(self, pipeline, resume_after=None, max_await_time_ms=None):
+                self.pipelines.append((pipeline[0]["$match"]["fullDocument.chat_id"]["$in"], resume_after))
+                return FakeStream()
+            
+            async def insert_many(self, documents, ordered=True):
+                if self.failures:
+                    self.failures -= 1
+                    raise AutoReconnect("primário indisponível")
+                self.batches.append([document["event"]["n"] for document in documents])
+        
+        async def handler(chat_id, event):
+            pass
+        
+        broker = ChatBroker(backend="mongo")
+        broker._db = SimpleNamespace(chat_events=FakeEvents())
+        broker.subscribe("chat-1", handler)
+        watch = asyncio.create_task(broker._watch())
+        await asyncio.sleep(0.01)
+        broker.subscribe("chat-2", handler)
+        await asyncio.sleep(0.01)
+        watch.cancel()
+        
+        pipelines = broker._db.chat_events.pipelines
+        assert pipelines[0] == (["chat-1"], None)
+        assert sorted(pipelines[-1][0]) == ["chat-1", "chat-2"] and pipelines[-1][1] == {"_data": "1"}
+        
+        # Lote que falha volta para o buffer e é gravado na próxima vez
+        await broker.publish("chat-1", {"type": "message", "n": 0})
+        assert await broker._flush() is False
+        assert await broker._flush() is True
+        assert broker._db.chat_events.batches == [[0]]
+
+class TestChatConnections:
+    """Testes das filas de envio por conexão de chat"""
+    
+    @pytest.mark.asyncio
+    async def test_slow_consumer_is_evicted(self):
+        """Testa que um cliente lento é descartado sem atrasar os demais"""
+        import asyncio
+        from services.chat_connections import ConnectionManager, CLOSE_SLOW_CONSUMER
+        
+        class FakeWebSocket:
+            scope = {"subprotocols": []}
+            
+            def __init__(self, delay):
+                self.delay = delay
+                self.sent = []
+                self.close_code = None
+            
+            async def accept(self, subprotocol=None):
+                pass
+            
+            async def send_text(self, message):
+                await asyncio.sleep(self.delay)
+                self.sent.append(message)
+            
+            async def close(self, code=1000):
+                self.close_code = code
+        
+        manager = ConnectionManager(ping_interval=60)
+        fast_socket, slow_socket = FakeWebSocket(0), FakeWebSocket(60)
+        chat = {"id": "chat-1", "client_id": "c1", "videomaker_id": "v1"}
+        fast = await manager.connect(fast_socket, {"sub": "c1"})
+        slow = await manager.connect(slow_socket, {"sub": "v1"})
+        slow.queue = asyncio.Queue(maxsize=2)
+        manager.join(fast, chat)
+        manager.join(slow, chat)
+        
+        for i in range(5):
+            await manager.deliver("chat-1", {"type": "message", "n": i})
+        await asyncio.sleep(0.01)
+        
+        assert len([message for message in fast_socket.sent if '"message"' in message]) == 5
+        assert slow_socket.close_code == CLOSE_SLOW_CONSUMER
+        assert manager.active_connections["chat-1"] == {fast}
+        assert manager.snapshot()["evicted_slow"] == 1
+        
+        # Chat encerrado: participantes em cache são descartados
+        await manager.deliver("chat-1", {"type": "chat_closed", "chat_id": "chat-1"})
+        assert fast.chats == {}
+        assert "chat-1" not in manager.active_connections
+        
+        await manager.stop()
+    
+    @pytest.mark.asyncio
+    async def test_multiplexed_connection_routes_by_user(self):
+        """Testa que a conexão do usuário recebe eventos do usuário e dos chats assinados"""
+        import asyncio
+        import json
+        from services.chat_broker import chat_broker
+        from services.chat_connections import ConnectionManager, USER_CHANNEL_PREFIX
+        
+        class FakeWebSocket:
+            scope = {"subprotocols": []}
+            
+            def __init__(self):
+                self.sent = []
+            
+            async def accept(self, subprotocol=None):
+                pass
+            
+            async def send_text(self, message):
+                self.sent.append(json.loads(message))
+            
+            async def close(self, code=1000):
+                pass
+        
+        manager = ConnectionManager(ping_interval=60)
+        socket = FakeWebSocket()
+        connection = await manager.connect(socket, {"sub": "u1"}, multiplexed=True)
+        manager.join(connection, {"id": "chat-1", "client_id": "u1", "videomaker_id": "v1"})
+        manager.join(connection, {"id": "chat-2", "client_id": "c2", "videomaker_id": "u1"})
+        
+        await manager.notify_user("u1", {"type": "notification", "title": "Nova proposta"})
+        await manager.notify_user("u2", {"type": "notification", "title": "Outro usuário"})
+        await manager.broadcast({"type": "message", "data": {"chat_id": "chat-2"}}, "chat-2")
+        await asyncio.sleep(0.01)
+        
+        assert [event["type"] for event in socket.sent if event["type"] != "presence"] == ["notification", "message"]
+        assert manager.snapshot()["users"] == 1
+        
+        await connection.close()
+        assert not chat_broker.is_subscribed(USER_CHANNEL_PREFIX + "u1")
+        assert not chat_broker.is_subscribed("chat-1")
+        
+        await manager.stop()
+    
+    @pytest.mark.asyncio
+    async def test_msgpack_subprotocol(self):
+        """Testa a negociação do protocolo binário junto de clientes JSON"""
+        import asyncio
+        import json
+        import msgpack
+        from services.chat_connections import ConnectionManager, PROTOCOL_VERSION
+        
+        class FakeWebSocket:
+            def __init__(self, subprotocols, incoming=None):
+                self.scope = {"subprotocols": subprotocols}
+                self.subprotocol = None
+                self.sent = []
+                self.incoming = incoming
+            
+            async def accept(self, subprotocol=None):
+                self.subprotocol = subprotocol
+            
+            async def send_text(self, message):
+                self.sent.append(json.loads(message))
+            
+            async def send_bytes(self, message):
+                self.sent.append(msgpack.unpackb(message))
+            
+            async def receive(self):
+                return self.incoming
+            
+            async def close(self, code=1000):
+                pass
+        
+        manager = ConnectionManager(ping_interval=60)
+        chat = {"id": "chat-1", "client_id": "c1", "videomaker_id": "v1"}
+        frame = msgpack.packb({"type": "message", "chat_id": "chat-1", "content": "oi"})
+        binary_socket = FakeWebSocket(["outro", "videomakers.chat.v2.msgpack"], {"type": "websocket.receive", "bytes": frame})
+        legacy_socket = FakeWebSocket([])
+        binary = await manager.connect(binary_socket, {"sub": "c1"})
+        legacy = await manager.connect(legacy_socket, {"sub": "v1"})
+        manager.join(binary, chat)
+        manager.join(legacy, chat)
+        
+        assert binary_socket.subprotocol == "videomakers.chat.v2.msgpack"
+        assert legacy_socket.subprotocol is None
+        assert (await binary.receive_event())["content"] == "oi"
+        
+        await manager.deliver("chat-1", {"type": "message", "data": {"content": "olá"}})
+        await asyncio.sleep(0.01)
+        
+        binary_events = [event for event in binary_socket.sent if event["type"] != "presence"]
+        legacy_events = [event for event in legacy_socket.sent if event["type"] != "presence"]
+        assert binary_events[0] == {"type": "hello", "protocol": PROTOCOL_VERSION, "encoding": "msgpack", "ping_interval": 60}
+        assert binary_events[1] == legacy_events[0] == {"type": "message", "data": {"content": "olá"}}
+        
+        await manager.stop()
+
+
+class TestChatHistoryCursor:
+    """Testes da paginação por cursor do histórico de chat"""
+    
+    def test_cursor_roundtrip_and_filter(self):
+        """Testa o cursor opaco e o filtro por (created_at, id)"""
+        from fastapi import HTTPException
+        from utils.cursor import encode_cursor, decode_cursor, cursor_filter
+        
+        cursor = encode_cursor("2026-01-01T10:00:00+00:00", "msg-1")
+        assert decode_cursor(cursor) == ("2026-01-01T10:00:00+00:00", "msg-1")
+        
+        assert cursor_filter() == {}
+        assert cursor_filter(before=cursor) == {
+            "$or": [
+                {"created_at": {"$lt": "2026-01-01T10:00:00+00:00"}},
+                {"created_at": "2026-01-01T10:00:00+00:00", "id": {"$lt": "msg-1"}}
+            ]
+        }
+        
+        for invalid in ("nao-e-cursor", encode_cursor("x", "y")[:-2]):
+            with pytest.raises(HTTPException):
+                decode_cursor(invalid)
+        with pytest.raises(HTTPException):
+            cursor_filter(before=cursor, after=cursor)
+
+
+class TestChatSummary:
+    """Testes do resumo de chat (última mensagem e não lidas)"""
+    
+    @pytest.mark.asyncio
+    async def test_record_and_mark_read(self):
+        """Testa o contador de não lidas e a leitura em lote até um cursor"""
+        from types import SimpleNamespace
+        from services.chat_summary import ChatSummaryService, PREVIEW_LENGTH
+        from services.message_writer import MessageWriter
+        from utils.cursor import encode_cursor
+        
+        class FakeCollection:
+            def __init__(self):
+                self.calls = []
+            
+            async def bulk_write(self, operations, ordered=True):
+                self.calls.extend(("update_one", operation._filter, operation._doc) for operation in operations)
+            
+            async def update_many(self, query, update):
+                self.calls.append(("update_many", query, update))
+                return SimpleNamespace(modified_count=3)
+            
+            async def count_documents(self, query):
+                self.calls.append(("count_documents", query))
+                return 2
+        
+        db = SimpleNamespace(chats=FakeCollection(), messages=FakeCollection())
+        writer = MessageWriter(batch_size=100, max_delay_ms=1)
+        writer.start({"chats": db.chats})
+        service = ChatSummaryService(db, writer)
+        
+        await service.record_message("chat-1", "c1", "v1", "x" * 500, "2026-01-01T10:00:00+00:00")
+        _, query, update = db.chats.calls[-1]
+        assert query == {"id": "chat-1"}
+        assert update["$inc"] == {"unread.v1": 1}
+        assert len(update["$set"]["last_message"]) == PREVIEW_LENGTH + 3
+        
+        until = encode_cursor("2026-01-01T10:00:00+00:00", "msg-9")
+        result = await service.mark_read({"id": "chat-1"}, "v1", until)
+        assert result["marked"] == 3 and result["unread"] == 2
+        
+        _, read_query, _ = db.messages.calls[0]
+        assert read_query["sender_id"] == {"$ne": "v1"}
+        assert {"created_at": "2026-01-01T10:00:00+00:00", "id": {"$lte": "msg-9"}} in read_query["$or"]
+        assert db.chats.calls[-1][2] == {"$set": {"unread.v1": 2}}
+        await writer.stop()
+
+
+class TestMessageWriter:
+    """Testes da gravação em lote de mensagens"""
+    
+    @pytest.mark.asyncio
+    async def test_group_commit_and_flush_on_stop(self):
+        """Testa que as gravações são agrupadas em insert_many e descarregadas no desligamento"""
+        import asyncio
+        from services.message_writer import MessageWriter
+        
+        class FakeCollection:
+            def __init__(self):
+                self.batches = []
+            
+            async def insert_many(self, documents, ordered=True):
+                await asyncio.sleep(0.001)
+                self.batches.append(list(documents))
+        
+        collections = {"messages": FakeCollection(), "moderation_logs": FakeCollection()}
+        writer = MessageWriter(batch_size=100, max_delay_ms=50)
+        writer.start(collections)
+        
+        futures = [writer.submit("messages", {"id": str(i)}) for i in range(250)]
+        futures.append(writer.submit("moderation_logs", {"id": "log"}))
+        await asyncio.gather(*futures[:100])
+        
+        # Restante ainda no lote parcial: gravado ao parar
+        await writer.stop()
+        assert all(future.done() and future.exception() is None for future in futures)
+        assert [len(batch) for batch in collections["messages"].batches] == [100, 100, 50]
+        assert collections["moderation_logs"].batches == [[{"id": "log"}]]
+        assert writer.snapshot()["written"] == 251
+
+
+class TestPresence:
+    """Testes de presença e indicador de digitação"""
+    
+    @pytest.mark.asyncio
+    async def test_presence_transitions_and_typing_debounce(self):
+        """Testa presença entre workers (com expiração) e o debounce de digitação"""
+        import time
+        from services.presence_service import PresenceService
+        
+        service = PresenceService(ttl=60)
+        changes = []
+        
+        async def listener(status):
+            changes.append((status["online"], status["last_seen"]))
+        
+        service.add_listener(listener)
+        
+        # Conectado em dois workers: offline só quando os dois saem
+        await service._receive("presence", {"type": "online", "worker": "w1", "user_id": "u1"})
+        await service._receive("presence", {"type": "heartbeat", "worker": "w2", "user_ids": ["u1"]})
+        await service._receive("presence", {"type": "offline", "worker": "w1", "user_id": "u1", "last_seen": "t1"})
+        assert service.is_online("u1")
+        
+        # Worker que parou de enviar heartbeat expira sozinho
+        service._online["u1"]["w2"] = time.monotonic() - 1
+        await service._expire()
+        assert changes[0] == (True, None)
+        assert changes[1][0] is False and changes[1][1]
+        assert service.status("u1")["online"] is False
+        
+        assert service.typing_changed("chat-1", "u1", True)
+        assert not service.typing_changed("chat-1", "u1", True)
+        assert service.typing_changed("chat-1", "u1", False)
+        assert not service.typing_changed("chat-1", "u1", False)
+        assert service.snapshot()["typing_coalesced"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_presence_lookup_scope_from_memory(self):
+        """Testa que a consulta de presença só conhece participantes de chats do usuário"""
+        from services.chat_connections import ConnectionManager
+        from services.chat_summary import ChatSummaryService
+        
+        class FakeWebSocket:
+            scope = {"subprotocols": []}
+            
+            async def accept(self, subprotocol=None):
+                pass
+            
+            async def send_text(self, message):
+                pass
+            
+            async def close(self, code=1000):
+                pass
+        
+        manager = ConnectionManager(ping_interval=60)
+        connection = await manager.connect(FakeWebSocket(), {"sub": "c1"})
+        manager.join(connection, {"id": "chat-1", "client_id": "c1", "videomaker_id": "v1"})
+        assert manager.peers("c1") == {"v1"}
+        assert manager.peers("v1") == set()
+        
+        summary = ChatSummaryService(db=None)
+        summary.remember_peers("c1", [
+            {"client_id": "c1", "videomaker_id": "v2"},
+            {"client_id": "c1", "videomaker_id": "v3"}
+        ])
+        assert summary.known_peers("c1") == {"v2", "v3"}
+        assert summary.known_peers("outro") == set()
+        
+        await connection.close()
+        assert manager.peers("c1") == set()
+        await manager.stop()
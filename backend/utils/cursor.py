@@ -0,0 +1,53 @@
+from fastapi import HTTPException, status
+from typing import Optional, Tuple
+import base64
+import binascii
+import orjson
+
+# Paginação por cursor (keyset) sobre (created_at, id).
+#
+# O cursor aponta para uma posição da ordenação, não para um deslocamento: a
+# consulta seguinte usa o índice para saltar direto até ela, com custo constante
+# independente de quantos documentos ficaram para trás. O `id` desempata
+# documentos com o mesmo `created_at`.
+
+def encode_cursor(created_at: str, document_id: str) -> str:
+    """Cursor opaco (base64 url-safe) para a posição de um documento"""
+    payload = orjson.dumps([created_at, document_id])
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Posição (created_at, id) de um cursor; 400 se inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, document_id = orjson.loads(base64.urlsafe_b64decode(padded))
+        if isinstance(created_at, str) and isinstance(document_id, str):
+            return created_at, document_id
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        pass
+    
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Cursor inválido"
+    )
+
+def cursor_filter(before: Optional[str] = None, after: Optional[str] = None) -> dict:
+    """Filtro dos documentos antes ou depois do cursor, na ordem (created_at, id)"""
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use apenas um dos parâmetros before ou after"
+        )
+    
+    cursor = before or after
+    if not cursor:
+        return {}
+    
+    created_at, document_id = decode_cursor(cursor)
+    op = "$lt" if before else "$gt"
+    return {
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "id": {op: document_id}}
+        ]
+    }
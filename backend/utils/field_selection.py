@@ -0,0 +1,92 @@
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from models.job import Job, JobResponse
+from models.payment import Payment
+from models.user import UserResponse
+from models.search import VideomakerSearchResult
+from typing import Dict, FrozenSet, Iterable, List, Optional, Type
+
+# Seleção de campos (`?fields=a,b,c`) nos endpoints de leitura. A lista pedida
+# é validada contra uma whitelist por recurso e role e vira uma projeção do
+# MongoDB, de modo que campos não pedidos não são lidos do banco nem serializados.
+
+
+def _fields_of(model_cls: Type[BaseModel]) -> FrozenSet[str]:
+    return frozenset(model_cls.model_fields)
+
+# Campos de contato não aparecem nos cards de busca para quem não é admin
+CONTACT_FIELDS = frozenset({"email", "telefone"})
+
+# Campos selecionáveis por recurso e role ("*" vale para as demais roles).
+# Recurso sem entrada para a role e sem "*" não aceita seleção de campos.
+FIELD_WHITELISTS: Dict[str, Dict[str, FrozenSet[str]]] = {
+    "jobs": {
+        "*": _fields_of(JobResponse)
+    },
+    "users": {
+        "*": _fields_of(UserResponse)
+    },
+    "videomakers": {
+        "*": _fields_of(VideomakerSearchResult) - CONTACT_FIELDS,
+        "admin": _fields_of(VideomakerSearchResult)
+    },
+    "admin_jobs": {
+        "admin": _fields_of(Job)
+    },
+    "admin_payments": {
+        "admin": _fields_of(Payment)
+    }
+}
+
+def allowed_fields(resource: str, role: Optional[str]) -> FrozenSet[str]:
+    """Campos que a role pode selecionar no recurso"""
+    whitelist = FIELD_WHITELISTS[resource]
+    return whitelist.get(role, whitelist.get("*", frozenset()))
+
+def parse_fields(resource: str, fields: Optional[str], role: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Valida o parâmetro `fields` e retorna a lista de campos (None = todos)
+    
+    O `id` é sempre incluído quando o recurso o possui.
+    """
+    if fields is None:
+        return None
+    
+    requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    if not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parâmetro fields vazio"
+        )
+    
+    allowed = allowed_fields(resource, role)
+    invalid = [name for name in requested if name not in allowed]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos não permitidos: {', '.join(invalid)}"
+        )
+    
+    if "id" in allowed and "id" not in requested:
+        requested.insert(0, "id")
+    
+    return requested
+
+def build_projection(
+    selected: Optional[List[str]],
+    extra: Iterable[str] = (),
+    default: Optional[dict] = None
+) -> dict:
+    """
+    Projeção do MongoDB para os campos selecionados
+    
+    `extra` são campos que o handler precisa internamente (filtros, ordenação)
+    mesmo sem terem sido pedidos. Sem seleção, retorna `default`.
+    """
+    if selected is None:
+        return dict(default or {"_id": 0})
+    
+    projection = {"_id": 0}
+    for name in (*selected, *extra):
+        projection[name] = 1
+    return projection
@@ -0,0 +1,76 @@
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from typing import Any, Optional
+import hashlib
+import orjson
+
+# GET condicional (ETag / If-None-Match) e Cache-Control por rota.
+#
+# Rotas com um "carimbo de versão" barato (ex.: documento do usuário no cache de
+# entidades) calculam o ETag antes da consulta principal e respondem 304 sem
+# executá-la. As demais usam o hash do corpo serializado: a consulta roda, mas o
+# corpo não trafega quando o cliente já tem a mesma versão.
+
+# Políticas de Cache-Control por rota
+CACHE_POLICIES = {
+    "profile": "public, max-age=0, must-revalidate",
+    "ratings": "public, max-age=0, must-revalidate",
+    "portfolio": "public, max-age=60, must-revalidate",
+    "user_badges": "public, max-age=300, must-revalidate",
+    "badges": "public, max-age=3600",
+    "facets": "public, max-age=300"
+}
+
+_ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+def _weak(digest: str) -> str:
+    return f'W/"{digest}"'
+
+def make_etag(*parts: Any) -> str:
+    """ETag fraco a partir de um carimbo de versão (valores serializáveis em JSON)"""
+    payload = orjson.dumps(parts, option=_ORJSON_OPTIONS)
+    return _weak(hashlib.blake2b(payload, digest_size=12).hexdigest())
+
+def content_etag(body: bytes) -> str:
+    """ETag fraco a partir do corpo da resposta"""
+    return _weak(hashlib.blake2b(body, digest_size=12).hexdigest())
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca do If-None-Match com o ETag atual (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    
+    current = _opaque(etag)
+    return any(_opaque(candidate) == current for candidate in if_none_match.split(","))
+
+def _headers(etag: str, policy: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_POLICIES[policy]}
+
+def not_modified(request: Request, etag: Optional[str], policy: str) -> Optional[Response]:
+    """Resposta 304 se o cliente já tem a versão `etag`; None caso contrário"""
+    if etag is None or not etag_matches(request.headers.get("if-none-match"), etag):
+        return None
+    return Response(status_code=304, headers=_headers(etag, policy))
+
+def with_cache_headers(response: Response, etag: str, policy: str) -> Response:
+    """Adiciona ETag e Cache-Control a uma resposta já montada"""
+    response.headers.update(_headers(etag, policy))
+    return response
+
+def cached_json(request: Request, content: Any, policy: str, etag: Optional[str] = None) -> Response:
+    """
+    Resposta JSON com ETag e Cache-Control
+    
+    `content` pode ser um objeto serializável ou uma Response já montada. Sem
+    `etag`, usa o hash do corpo.
+    """
+    response = content if isinstance(content, Response) else ORJSONResponse(content)
+    etag = etag or content_etag(response.body)
+    
+    return not_modified(request, etag, policy) or with_cache_headers(response, etag, policy)
@@ -0,0 +1,117 @@
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type, Union, get_args, get_origin
+
+# Serialização de documentos do MongoDB (dados confiáveis, gravados pela própria
+# API) para os modelos de resposta. Os modelos são montados com `model_construct`
+# e serializados direto para bytes por um TypeAdapter em cache, sem a validação
+# e o jsonable_encoder que o FastAPI aplica via `response_model`. As conversões
+# que a validação faria (string ISO -> datetime, int -> float) são mantidas
+# para que o JSON gerado seja idêntico byte a byte.
+
+
+def _identity(value):
+    return value
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def _to_float(value):
+    return float(value) if isinstance(value, int) and not isinstance(value, bool) else value
+
+def _to_int(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+def _coercer(annotation) -> Callable[[Any], Any]:
+    """Função de conversão para o tipo de um campo"""
+    origin = get_origin(annotation)
+    
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        inner = _coercer(args[0]) if len(args) == 1 else _identity
+        if inner is _identity:
+            return _identity
+        return lambda value: None if value is None else inner(value)
+    
+    if origin in (list, List):
+        args = get_args(annotation)
+        inner = _coercer(args[0]) if args else _identity
+        if inner is _identity:
+            return _identity
+        return lambda value: value if value is None else [inner(item) for item in value]
+    
+    if annotation is datetime:
+        return _to_datetime
+    if annotation is float:
+        return _to_float
+    if annotation is int:
+        return _to_int
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return lambda value: construct(annotation, value) if isinstance(value, dict) else value
+    
+    return _identity
+
+@lru_cache(maxsize=None)
+def _plan(model_cls: Type[BaseModel]) -> tuple:
+    return tuple(
+        (name, _coercer(field.annotation), field.is_required())
+        for name, field in model_cls.model_fields.items()
+    )
+
+def construct(model_cls: Type[BaseModel], document: dict, defaults: Optional[Dict[str, Any]] = None) -> BaseModel:
+    """
+    Monta o modelo a partir de um documento do banco, sem revalidar
+    
+    Campos ausentes no documento usam `defaults` (equivalente ao `.get(campo, padrão)`
+    dos handlers), o default do modelo ou None.
+    """
+    values = {}
+    for name, coerce, required in _plan(model_cls):
+        if name in document:
+            values[name] = coerce(document[name])
+        elif defaults and name in defaults:
+            values[name] = coerce(defaults[name])
+        elif required:
+            values[name] = None
+    
+    return model_cls.model_construct(**values)
+
+@lru_cache(maxsize=None)
+def list_adapter(model_cls: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model_cls])
+
+def model_list_response(
+    model_cls: Type[BaseModel],
+    documents: Iterable[dict],
+    defaults: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    fields: Optional[List[str]] = None
+) -> Response:
+    """
+    Resposta JSON de uma lista de documentos, já serializada em bytes
+    
+    Com `fields`, apenas esses campos de cada item são serializados.
+    """
+    items = [construct(model_cls, document, defaults) for document in documents]
+    include = {"__all__": set(fields)} if fields is not None else None
+    return Response(
+        content=list_adapter(model_cls).dump_json(items, include=include),
+        media_type="application/json",
+        headers=headers
+    )
+
+def model_response(
+    model_cls: Type[BaseModel],
+    document: dict,
+    defaults: Optional[Dict[str, Any]] = None,
+    fields: Optional[List[str]] = None
+) -> Response:
+    """Resposta JSON de um único documento, opcionalmente restrita a `fields`"""
+    item = construct(model_cls, document, defaults)
+    include = set(fields) if fields is not None else None
+    return Response(
+        content=item.model_dump_json(include=include),
+        media_type="application/json"
+    )
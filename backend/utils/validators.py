@@ -1,20 +1,15 @@
 import re
 from typing import Optional
 
-# Regex para moderação de chat
-PHONE_PATTERN = re.compile(r'\d{8,11}')
-EMAIL_PATTERN = re.compile(r'\S+@\S+\.\S+')
-URL_PATTERN = re.compile(r'http[s]?://|www\.')
-
 def contains_blocked_content(text: str) -> tuple[bool, Optional[str]]:
-    """Verifica se o texto contém conteúdo bloqueado (números, emails, links)"""
-    if PHONE_PATTERN.search(text):
-        return True, "phone_number"
-    if EMAIL_PATTERN.search(text):
-        return True, "email"
-    if URL_PATTERN.search(text):
-        return True, "url"
-    return False, None
+    """
+    Verifica se o texto contém conteúdo bloqueado (números, emails, links)
+    
+    Usa as regras ativas do serviço de moderação; no chat, prefira
+    `moderation_service.check`, que também pega contatos divididos entre mensagens.
+    """
+    from services.moderation_service import moderation_service
+    return moderation_service.scan(text)
 
 def validate_cpf(cpf: str) -> bool:
     """Validação básica de CPF (apenas formato)"""
@@ -14,6 +14,7 @@ import {
 import { useAuth } from '../../context/AuthContext';
 import { COLORS, SIZES, WS_URL } from '../../utils/constants';
 import { chatAPI } from '../../services/api';
+import StorageService from '../../services/storage';
 
 const ChatScreen = ({ route }) => {
   const { chatId, otherUserName } = route.params || {};
@@ -40,8 +41,9 @@ const ChatScreen = ({ route }) => {
 
   const loadMessages = async () => {
     try {
-      const { data } = await chatAPI.getMessages(chatId);
+      const { data, headers } = await chatAPI.getMessages(chatId);
       setMessages(data);
+      chatAPI.markChatRead(chatId, headers['x-cursor-after']).catch(() => {});
     } catch (error) {
       console.error('Error loading messages:', error);
       Alert.alert('Erro', 'Não foi possível carregar as mensagens');
@@ -50,9 +52,11 @@ const ChatScreen = ({ route }) => {
     }
   };
 
-  const connectWebSocket = () => {
+  const connectWebSocket = async () => {
     try {
-      const ws = new WebSocket(`${WS_URL}/${chatId}`);
+      // O servidor autentica a sessão uma vez, na conexão
+      const token = await StorageService.getAccessToken();
+      const ws = new WebSocket(`${WS_URL}/${chatId}?token=${encodeURIComponent(token || '')}`);
 
       ws.onopen = () => {
         console.log('WebSocket connected');
@@ -62,6 +66,12 @@ const ChatScreen = ({ route }) => {
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
+
+          // Heartbeat do servidor
+          if (data.type === 'ping') {
+            ws.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
           
           if (data.error) {
             Alert.alert('Erro', data.error);
@@ -117,7 +127,6 @@ const ChatScreen = ({ route }) => {
     }
 
     const messageData = {
-      sender_id: user.id,
       content: newMessage.trim(),
       attachments: [],
     };
@@ -108,8 +108,9 @@ export const ratingsAPI = {
 // Chat endpoints
 export const chatAPI = {
   sendMessage: (data) => api.post('/chat/message', data),
-  getMessages: (chatId) => api.get(`/chat/${chatId}/messages`),
+  getMessages: (chatId, params) => api.get(`/chat/${chatId}/messages`, { params }),
   getMyChats: () => api.get('/chat/my-chats'),
+  markChatRead: (chatId, until) => api.post(`/chat/${chatId}/read`, until ? { until } : {}),
   uploadAttachment: (chatId, formData) =>
     api.post(`/chat/attachment?chat_id=${chatId}`, formData, {
       headers: { 'Content-Type': 'multipart/form-data' },